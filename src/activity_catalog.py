@@ -0,0 +1,48 @@
+from collections import namedtuple
+
+# one step of an event_sequence, fields keeps the config keys and values in their config order
+EventTemplate = namedtuple("EventTemplate", ["fields", "attribute", "generate"])
+
+
+class CompiledActivity(namedtuple("CompiledActivity", ["name", "variants"])):
+    """variants: {variant name: (EventTemplate, ...)}"""
+    __slots__ = ()
+
+    def variant(self, variant_name):
+        return self.variants[variant_name]
+
+
+class ActivityCatalog:
+    def __init__(self, activity_config, env_config):
+        """
+        activity_config.json compiled once: activity name -> variant (normal / Heating / Stewing / Stir-frying)
+        -> immutable step templates, and the coordinates of every facility and control device for movements
+        (area movements go through the precomputed fields of PathCache, keyed by area name).
+        The catalog is never written to, households, threads and pool workers can share it.
+        """
+        env = env_config["environment_config"]
+        self.positions = {name: (value['x'], value['y'])
+                          for group in ("Facility", "control_device") for name, value in env[group].items()}
+        self.activities = {}
+        for activity in activity_config["activity_config"]:
+            variants = {variant_name: tuple(self.compile_step(step) for step in steps)
+                        for variant_name, steps in activity["event_sequence"].items()}
+            # the first definition wins, as with the linear scan it replaces
+            self.activities.setdefault(activity["activity_name"],
+                                       CompiledActivity(activity["activity_name"], variants))
+
+    @staticmethod
+    def compile_step(step):
+        return EventTemplate(tuple(step.items()), step.get("attribute"), step.get("Generate"))
+
+    def get(self, activity_name):
+        return self.activities.get(activity_name)
+
+    def __contains__(self, activity_name):
+        return activity_name in self.activities
+
+    def __len__(self):
+        return len(self.activities)
+
+    def position(self, target):
+        return self.positions[target]
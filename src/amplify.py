@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import time
+
+from src import backend, chat, utils
+from src.backend import LEISURE_ACTIVITIES
+from src.cache import ResponseCache
+from src.schedule_stream import SchedulePrefetch, ScheduleStream
+from src.simulation import create_event, load_inputs
+
+
+class LocalDecisions:
+    def __init__(self, agent, schedule, rng):
+        """
+        Answers the agent requests of a replayed day without the LLM:
+        the remaining plan is kept after delays and phone calls,
+        waiting time goes to a leisure activity drawn with the household's rng
+        """
+        self.agent = agent
+        self.schedule = schedule
+        self.rng = rng
+        self.waiting_choices = [name for name in LEISURE_ACTIVITIES if name in agent.activity_names] \
+            or [agent.default_waiting_activity()]
+
+    def generate_daily_schedule(self):
+        return [dict(activity) for activity in self.schedule]
+
+    def generate_follow_up_schedule(self, todo_schedule, done_schedule):
+        return list(todo_schedule)
+
+    def judge_waiting_event(self, todo_schedule, done_schedule, current_activity, current_waiting_event):
+        return self.rng.choice(self.waiting_choices)
+
+    def judge_phone_event(self, todo_schedule, done_schedule):
+        return list(todo_schedule)
+
+    # streamed and prefetched requests (Event stream_schedules / prefetch_schedules) get the same local answers
+    def completed_stream(self, schedule):
+        """A ScheduleStream holding the whole local answer once its (empty) stream is read"""
+        return ScheduleStream(iter(()), self.agent.activity_names, lambda text, emitted: schedule[emitted:])
+
+    def stream_daily_schedule(self):
+        return self.completed_stream(self.generate_daily_schedule())
+
+    def stream_follow_up_schedule(self, todo_schedule, done_schedule):
+        return self.completed_stream(self.generate_follow_up_schedule(todo_schedule, done_schedule))
+
+    def next_schedule_entries(self, stream):
+        return stream.next_entries()
+
+    def finish_schedule(self, stream):
+        return stream.rest()
+
+    def prefetch_daily_schedule(self, day):
+        return SchedulePrefetch(day, utils.get_weekday(day), self.generate_daily_schedule)
+
+    def collect_daily_schedule(self, prefetch):
+        return prefetch.result()
+
+
+def generate_schedule(inputs, user_name, day):
+    """Daily schedule of user_name for day through the LLM (or the response cache of the chat module)"""
+    user = create_event(inputs, user_name, 0).agent
+    user.weekday = utils.get_weekday(day)
+    return user.generate_daily_schedule()
+
+
+def replay_schedule(inputs, user_name, day, schedule, seeds, output_root="record", decisions="local",
+                    event_options=None):
+    """
+    Execute one daily schedule once per seed, every replay is a labeled trajectory written to
+    output_root/<user_name>/day<day>/seed<seed>/ with a manifest.json of all replays next to them.
+    decisions: "local" answers follow-up, waiting and phone requests with LocalDecisions,
+               "llm" asks the agent as a normal run does
+    event_options: further keyword arguments of simulation.create_event
+    """
+    day_dir = os.path.join(output_root, user_name, f"day{day}")
+    entries = []
+    start = time.perf_counter()
+    for trajectory, seed in enumerate(seeds):
+        save_dir = os.path.join(day_dir, f"seed{seed}")
+        event_system = create_event(inputs, user_name, seed, save_dir=save_dir, **(event_options or {}))
+        schedule = event_system.agent.parse_daily_schedule(json.dumps(schedule, ensure_ascii=False))
+        event_system.current_day = day
+        event_system.planned_schedules[day] = json.dumps(schedule, ensure_ascii=False)
+        answers = LocalDecisions(event_system.agent, schedule, event_system.rng) if decisions == "local" else None
+        replay_start = time.perf_counter()
+        event_system.drive(event_system.workflow(day), answers)
+        entries.append({
+            "trajectory": trajectory,
+            "seed": seed,
+            "output_dir": save_dir,
+            "elapsed": time.perf_counter() - replay_start,
+            "llm_calls": event_system.agent.usage.summary()["run"]["all"]["calls"]
+        })
+    manifest = {
+        "user_name": user_name,
+        "day": day,
+        "weekday": utils.get_weekday(day),
+        "decisions": decisions,
+        "schedule": schedule,
+        "elapsed": time.perf_counter() - start,
+        "trajectories": entries
+    }
+    os.makedirs(day_dir, exist_ok=True)
+    with open(os.path.join(day_dir, "manifest.json"), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="re-execute one daily schedule with many seeds")
+    parser.add_argument("--user", default="RemoteWorker")
+    parser.add_argument("--day", type=int, default=5, help="simulated day, selects the weekday")
+    parser.add_argument("--replays", type=int, default=10)
+    parser.add_argument("--first-seed", type=int, default=1)
+    parser.add_argument("--schedule", help="JSON file with the schedule, generated through the LLM when missing")
+    parser.add_argument("--decisions", choices=["local", "llm"], default="local")
+    parser.add_argument("--output", default="record")
+    parser.add_argument("--offline", action="store_true", help="use the offline stand-in instead of the LLM")
+    parser.add_argument("--latency", type=float, default=0.0, help="artificial latency of the offline stand-in")
+    parser.add_argument("--cache-dir", help="on-disk response cache, reuses a schedule generated before")
+    parser.add_argument("--random-model", choices=["legacy", "timeline"], default="legacy",
+                        help="toilet / phone trigger model")
+    args = parser.parse_args()
+
+    chat.set_backend(backend.make_backend("offline" if args.offline else "openai", latency=args.latency))
+    if args.cache_dir:
+        chat.set_response_cache(ResponseCache(args.cache_dir))
+    simulation_inputs = load_inputs()
+    if args.schedule:
+        with open(args.schedule, 'r', encoding='utf-8') as schedule_file:
+            day_schedule = json.load(schedule_file)
+    else:
+        day_schedule = generate_schedule(simulation_inputs, args.user, args.day)
+    result = replay_schedule(simulation_inputs, args.user, args.day, day_schedule,
+                             range(args.first_seed, args.first_seed + args.replays), args.output, args.decisions,
+                             {"random_model": args.random_model})
+    print(f"{len(result['trajectories'])} trajectories of {args.user} day {args.day} in {result['elapsed']:.2f}s")
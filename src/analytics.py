@@ -0,0 +1,184 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from src.record_loader import load_records, loader_vocabularies
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def day_count(table):
+    return len(np.unique(table["day"])) if len(table) else 0
+
+
+def elapsed_minutes(table):
+    """
+    Minutes since the first row. Rows are in time order and a step back of the clock is taken as midnight,
+    so activities running over midnight (Sleeping) keep their length.
+    """
+    minute = table["minute"].astype(np.int64)
+    steps = np.diff(minute) % MINUTES_PER_DAY
+    return np.concatenate(([0], np.cumsum(steps)))
+
+
+def activity_segments(table):
+    """
+    Runs of consecutive rows with the same non-empty activity: (activity codes, start minutes, durations).
+    An activity lasts until the first row of whatever follows it.
+    """
+    activity = table["activity"]
+    if not len(activity):
+        return np.zeros(0, dtype=activity.dtype), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    elapsed = elapsed_minutes(table)
+    starts = np.flatnonzero(np.concatenate(([True], activity[1:] != activity[:-1])))
+    ends = np.concatenate((elapsed[starts[1:]], elapsed[-1:]))
+    durations = ends - elapsed[starts]
+    labelled = activity[starts] != 0
+    return activity[starts][labelled], table["minute"][starts][labelled], durations[labelled]
+
+
+def activity_durations(table):
+    """Per activity: number of occurrences, total / mean / median / p90 minutes and the occurrences per day"""
+    codes, _, durations = activity_segments(table)
+    days = max(day_count(table), 1)
+    names = table.vocabularies["activity"].values
+    result = {}
+    order = np.argsort(codes, kind="stable")
+    codes, durations = codes[order], durations[order]
+    boundaries = np.flatnonzero(np.concatenate(([True], codes[1:] != codes[:-1]))) if len(codes) else []
+    for code, group in zip(codes[boundaries], np.split(durations, boundaries[1:])):
+        result[names[code]] = {
+            "count": int(len(group)),
+            "per_day": len(group) / days,
+            "total": int(group.sum()),
+            "mean": float(group.mean()),
+            "median": float(np.median(group)),
+            "p90": float(np.percentile(group, 90))
+        }
+    return result
+
+
+def sensor_firing_matrix(table):
+    """(sensors, 24) mean number of sensor ON rows per day and hour of day"""
+    fired = table["sensor"] != 0
+    sensor = table["sensor"][fired].astype(np.int64)
+    hour = table["minute"][fired].astype(np.int64) // 60
+    size = len(table.vocabularies["sensor"])
+    counts = np.bincount(sensor * 24 + hour, minlength=size * 24).reshape(size, 24)
+    return counts / max(day_count(table), 1)
+
+
+def sensor_rate_per_hour(table):
+    """Sensor name -> 24 mean firings per day, one per hour of day"""
+    matrix = sensor_firing_matrix(table)
+    names = table.vocabularies["sensor"].values
+    return {names[code]: matrix[code].round(4).tolist() for code in np.flatnonzero(matrix.sum(axis=1))}
+
+
+def device_state_matrix(table):
+    """(devices, states) number of device rows per device and state"""
+    used = table["device"] != 0
+    states = len(table.vocabularies["state"])
+    flat = table["device"][used].astype(np.int64) * states + table["device_state"][used]
+    return np.bincount(flat, minlength=len(table.vocabularies["device"]) * states).reshape(-1, states)
+
+
+def device_state_counts(table):
+    """Device name -> {"ON": n, "OFF": n, "per_day": {...}}"""
+    matrix = device_state_matrix(table)
+    days = max(day_count(table), 1)
+    devices = table.vocabularies["device"].values
+    states = table.vocabularies["state"].values
+    result = {}
+    for code in np.flatnonzero(matrix.sum(axis=1)):
+        counts = {states[state] or "NONE": int(matrix[code, state]) for state in np.flatnonzero(matrix[code])}
+        result[devices[code]] = dict(counts, per_day={state: count / days for state, count in counts.items()})
+    return result
+
+
+def distribution_distance(reference, generated):
+    """L1 distance of two non-negative arrays after normalizing each to sum 1, between 0 and 2"""
+    reference_total, generated_total = reference.sum(), generated.sum()
+    if not reference_total or not generated_total:
+        return None
+    return float(np.abs(reference / reference_total - generated / generated_total).sum())
+
+
+def activity_time_vector(table):
+    codes, _, durations = activity_segments(table)
+    return np.bincount(codes.astype(np.int64), weights=durations, minlength=len(table.vocabularies["activity"]))
+
+
+def summarize(table):
+    return {
+        "rows": len(table),
+        "days": day_count(table),
+        "activities": activity_durations(table),
+        "sensors": sensor_rate_per_hour(table),
+        "devices": device_state_counts(table)
+    }
+
+
+def compare(reference, generated):
+    """
+    Distances between a reference table and a generated one, both loaded with the same vocabularies:
+    L1 of the normalized sensor x hour firings, of the time share per activity and of the device x state counts,
+    plus the per-activity median durations and per-day device ON counts side by side
+    """
+    if reference.vocabularies is not generated.vocabularies:
+        raise ValueError("tables must share their vocabularies to be compared")
+    reference_activities = activity_durations(reference)
+    generated_activities = activity_durations(generated)
+    reference_devices = device_state_counts(reference)
+    generated_devices = device_state_counts(generated)
+    return {
+        "rows": {"reference": len(reference), "generated": len(generated)},
+        "days": {"reference": day_count(reference), "generated": day_count(generated)},
+        "sensor_hourly_l1": distribution_distance(sensor_firing_matrix(reference).ravel(),
+                                                  sensor_firing_matrix(generated).ravel()),
+        "activity_time_l1": distribution_distance(activity_time_vector(reference),
+                                                  activity_time_vector(generated)),
+        "device_state_l1": distribution_distance(device_state_matrix(reference).ravel(),
+                                                 device_state_matrix(generated).ravel()),
+        "activity_median_minutes": {
+            name: {"reference": reference_activities.get(name, {}).get("median"),
+                   "generated": generated_activities.get(name, {}).get("median")}
+            for name in sorted(set(reference_activities) | set(generated_activities))
+        },
+        "device_on_per_day": {
+            name: {"reference": reference_devices.get(name, {}).get("per_day", {}).get("ON", 0.0),
+                   "generated": generated_devices.get(name, {}).get("per_day", {}).get("ON", 0.0)}
+            for name in sorted(set(reference_devices) | set(generated_devices))
+        }
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="aggregate analytics of reference and generated records")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summary_parser = subparsers.add_parser("summary", help="aggregates of one csv file, run or corpus directory")
+    summary_parser.add_argument("path")
+    compare_parser = subparsers.add_parser("compare", help="compare generated records against a reference")
+    compare_parser.add_argument("reference", help="e.g. raw_data/old_man.csv")
+    compare_parser.add_argument("generated", help="run directory or directory of runs, e.g. record/OldMan")
+    for sub_parser in (summary_parser, compare_parser):
+        sub_parser.add_argument("--chunk-size", type=int, default=100000)
+        sub_parser.add_argument("--output", help="write the JSON here instead of printing it")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    vocabularies = loader_vocabularies()
+    if args.command == "summary":
+        result = summarize(load_records(args.path, vocabularies, args.chunk_size))
+    else:
+        result = compare(load_records(args.reference, vocabularies, args.chunk_size),
+                         load_records(args.generated, vocabularies, args.chunk_size))
+    result["elapsed"] = time.perf_counter() - start
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+    else:
+        print(text)
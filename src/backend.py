@@ -0,0 +1,453 @@
+import argparse
+import ast
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LEISURE_ACTIVITIES = ["Reading", "Watching TV", "Daytime Rest"]
+
+
+def estimate_tokens(text):
+    """Rough token count (4 characters per token) for backends that do not report usage"""
+    return len(text) // 4
+
+
+def estimate_usage(messages, content):
+    prompt_tokens = sum(estimate_tokens(message.get("content", "")) for message in messages)
+    completion_tokens = estimate_tokens(content)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+class LLMBackend:
+    """Chat-completions backend used by chat.get_response"""
+    model = "deepseek-chat"
+
+    def complete(self, messages):
+        """Return the assistant message content for a list of chat messages"""
+        return self.complete_with_usage(messages)[0]
+
+    def complete_with_usage(self, messages):
+        """Return (content, usage) with usage holding prompt_tokens / completion_tokens / total_tokens"""
+        raise NotImplementedError
+
+    def stream(self, messages):
+        """
+        Generator of the content in pieces as they are produced, returns the usage when exhausted.
+        Backends without streaming produce the whole content as one piece.
+        """
+        content, usage = self.complete_with_usage(messages)
+        yield content
+        return usage
+
+    async def acomplete(self, messages):
+        return (await self.acomplete_with_usage(messages))[0]
+
+    async def acomplete_with_usage(self, messages):
+        """Async variant of complete_with_usage, runs the blocking call in a worker thread by default"""
+        return await asyncio.to_thread(self.complete_with_usage, messages)
+
+    async def astream(self, messages):
+        """
+        Async variant of stream: async generator of (piece, usage) pairs, usage is None but in the last pair.
+        Backends without streaming produce the whole content as one piece.
+        """
+        content, usage = await self.acomplete_with_usage(messages)
+        yield content, usage
+
+
+class OpenAIBackend(LLMBackend):
+    def __init__(self, api_key=None, base_url="https://api.deepseek.com", model="deepseek-chat", timeout=None,
+                 max_retries=None):
+        """
+        timeout: seconds per request of the client
+        max_retries: retries of the client itself, 0 when chat.request_policy retries
+        """
+        # Please install OpenAI SDK first: `pip3 install openai`
+        from openai import OpenAI
+        self.model = model
+        self.api_key = api_key or os.environ.get("DEEPSEEK_API_KEY", "sk-306fd70669ab4d1faa526a050ca99564")
+        self.base_url = base_url
+        self.client_options = {name: value for name, value in (("timeout", timeout), ("max_retries", max_retries))
+                               if value is not None}
+        self.client = OpenAI(api_key=self.api_key, base_url=base_url, **self.client_options)
+        self.async_client = None
+
+    @staticmethod
+    def read_response(messages, response):
+        content = response.choices[0].message.content
+        if response.usage is None:
+            return content, estimate_usage(messages, content)
+        return content, {"prompt_tokens": response.usage.prompt_tokens,
+                         "completion_tokens": response.usage.completion_tokens,
+                         "total_tokens": response.usage.total_tokens}
+
+    def complete_with_usage(self, messages):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=False
+        )
+        return self.read_response(messages, response)
+
+    def stream(self, messages):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        usage = None
+        for chunk in response:
+            if chunk.usage is not None:
+                usage = {"prompt_tokens": chunk.usage.prompt_tokens,
+                         "completion_tokens": chunk.usage.completion_tokens,
+                         "total_tokens": chunk.usage.total_tokens}
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        return usage
+
+    async def acomplete_with_usage(self, messages):
+        if self.async_client is None:
+            from openai import AsyncOpenAI
+            self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, **self.client_options)
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=False
+        )
+        return self.read_response(messages, response)
+
+    async def astream(self, messages):
+        if self.async_client is None:
+            from openai import AsyncOpenAI
+            self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, **self.client_options)
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        usage = None
+        async for chunk in response:
+            if chunk.usage is not None:
+                usage = {"prompt_tokens": chunk.usage.prompt_tokens,
+                         "completion_tokens": chunk.usage.completion_tokens,
+                         "total_tokens": chunk.usage.total_tokens}
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content, None
+        yield "", usage
+
+
+class OfflineBackend(LLMBackend):
+    def __init__(self, latency=0.0, jitter=0.0, seed=0, model="offline-stand-in"):
+        """
+        Deterministic stand-in for the LLM, answers every SmartAgent prompt without network.
+        Daily schedules are the daily_plan_reference.json sample embedded in the prompt,
+        decisions are picked from the activity list of the prompt.
+        latency: artificial seconds per call
+        jitter: extra uniform random seconds per call, drawn from a generator seeded with seed
+        """
+        self.model = model
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.calls = 0
+
+    def delay(self):
+        with self.rng_lock:
+            self.calls += 1
+            extra = self.rng.uniform(0, self.jitter) if self.jitter else 0.0
+        return self.latency + extra
+
+    def complete_with_usage(self, messages):
+        seconds = self.delay()
+        if seconds:
+            time.sleep(seconds)
+        content = offline_reply(messages[-1]["content"])
+        return content, estimate_usage(messages, content)
+
+    async def acomplete_with_usage(self, messages):
+        seconds = self.delay()
+        if seconds:
+            await asyncio.sleep(seconds)
+        content = offline_reply(messages[-1]["content"])
+        return content, estimate_usage(messages, content)
+
+    def stream(self, messages, piece_size=16):
+        """The content in pieces of piece_size characters, the latency of the call spread over them"""
+        seconds = self.delay()
+        content = offline_reply(messages[-1]["content"])
+        pieces = [content[i:i + piece_size] for i in range(0, len(content), piece_size)] or [""]
+        for piece in pieces:
+            if seconds:
+                time.sleep(seconds / len(pieces))
+            yield piece
+        return estimate_usage(messages, content)
+
+    async def astream(self, messages, piece_size=16):
+        seconds = self.delay()
+        content = offline_reply(messages[-1]["content"])
+        pieces = [content[i:i + piece_size] for i in range(0, len(content), piece_size)] or [""]
+        for i, piece in enumerate(pieces):
+            if seconds:
+                await asyncio.sleep(seconds / len(pieces))
+            yield piece, estimate_usage(messages, content) if i == len(pieces) - 1 else None
+
+
+def make_backend(name="openai", latency=0.0, jitter=0.0, seed=0, base_url=None, timeout=None, max_retries=None):
+    """Build a backend from plain options, used where backend objects cannot be pickled (process pools)"""
+    if name == "offline":
+        return OfflineBackend(latency=latency, jitter=jitter, seed=seed)
+    if name == "openai":
+        if base_url:
+            return OpenAIBackend(base_url=base_url, timeout=timeout, max_retries=max_retries)
+        return OpenAIBackend(timeout=timeout, max_retries=max_retries)
+    raise ValueError(f"unknown backend: {name}")
+
+
+def extract_list(prompt, marker):
+    """Parse the first bracketed list literal that follows marker in the prompt"""
+    start = prompt.find(marker)
+    if start < 0:
+        return None
+    start = prompt.find("[", start + len(marker))
+    if start < 0:
+        return None
+    depth = 0
+    for i in range(start, len(prompt)):
+        if prompt[i] == "[":
+            depth += 1
+        elif prompt[i] == "]":
+            depth -= 1
+            if depth == 0:
+                try:
+                    return ast.literal_eval(prompt[start:i + 1])
+                except (ValueError, SyntaxError):
+                    return None
+    return None
+
+
+def extract_schedule(prompt, marker):
+    """Schedule following marker, as a list literal or in the compact encoding of utils.format_schedule"""
+    schedule = extract_list(prompt, marker)
+    if schedule is not None:
+        return schedule
+    start = prompt.find(marker)
+    if start < 0:
+        return None
+    start += len(marker)
+    end = prompt.find(", and ", start)
+    from src.utils import parse_compact_schedule
+    return parse_compact_schedule(prompt[start:end if end >= 0 else len(prompt)])
+
+
+def extract_activity_list(prompt, marker):
+    start = prompt.find(marker)
+    if start < 0:
+        return []
+    start = prompt.find('"', start + len(marker))
+    end = prompt.find('"', start + 1)
+    if start < 0 or end < 0:
+        return []
+    return [name.strip() for name in prompt[start + 1:end].split(",") if name.strip()]
+
+
+def prompt_digest(prompt):
+    return int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16)
+
+
+def offline_reply(prompt):
+    """Deterministic answer for the four SmartAgent prompt templates"""
+    # generate_new_day_plan: return the reference schedule of the prompt
+    if "Below is a sample schedule:" in prompt:
+        schedule = extract_list(prompt, "Below is a sample schedule:") or []
+        return json.dumps(schedule, ensure_ascii=False)
+    # decide_do_what_waiting: pick a leisure activity from the offered list
+    if "awaiting:" in prompt:
+        options = extract_activity_list(prompt, "engage in while waiting:")
+        choices = [name for name in LEISURE_ACTIVITIES if name in options] or options or LEISURE_ACTIVITIES
+        return choices[prompt_digest(prompt) % len(choices)]
+    # decide_whether_step_out: replace the first leisure activity with the outing
+    if "invites you to go out" in prompt:
+        schedule = extract_schedule(prompt, "Your schedule for today is as follows:") or []
+        for activity in schedule:
+            if activity.get("activity_name") in LEISURE_ACTIVITIES:
+                activity["activity_name"] = "Going Out"
+                break
+        return json.dumps(schedule, ensure_ascii=False)
+    # update_day_plan: keep the remaining schedule
+    if "remaining schedule" in prompt:
+        schedule = extract_schedule(prompt, "Your remaining schedule for today is as follows:") or []
+        return json.dumps(schedule, ensure_ascii=False)
+    return "[]"
+
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    """Minimal POST /v1/chat/completions endpoint answering through server.backend"""
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        delay, error_status = self.server.faults()
+        if delay:
+            time.sleep(delay)
+        if error_status:
+            payload = {"error": {"message": "injected fault", "code": error_status,
+                                 "type": "server_error" if error_status >= 500 else "rate_limit"}}
+            headers = {"Retry-After": self.server.retry_after} \
+                if error_status == 429 and self.server.retry_after is not None else {}
+            self.send_json(error_status, payload, headers)
+            return
+        messages = body.get("messages", [])
+        if not messages:
+            self.send_json(400, {"error": {"message": "messages must not be empty", "code": 400}})
+            return
+        if body.get("stream"):
+            self.send_stream(body, messages)
+            return
+        content, usage = self.server.backend.complete_with_usage(messages)
+        payload = {
+            "id": f"chatcmpl-offline-{self.server.backend.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", self.server.backend.model),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }
+        self.send_json(200, payload)
+
+    def send_stream(self, body, messages):
+        """Server-sent chat.completion.chunk events, ending with a usage chunk if asked for and [DONE]"""
+        backend = self.server.backend
+        chunk_id = f"chatcmpl-offline-{backend.calls}"
+
+        def chunk(choices, usage=None):
+            payload = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": body.get("model", backend.model), "choices": choices, "usage": usage}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            pieces = backend.stream(messages)
+            while True:
+                try:
+                    piece = next(pieces)
+                except StopIteration as stop:
+                    usage = stop.value
+                    break
+                self.wfile.write(chunk([{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+                self.wfile.flush()
+            self.wfile.write(chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                self.wfile.write(chunk([], usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, str(value))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up on this request (timeout or a hedged duplicate answered first)
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FaultyHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, error_rate=0.0, error_status=429, retry_after=None, delay_rate=0.0,
+                 delay=0.0, seed=0):
+        super().__init__(address, handler)
+        self.backend = None
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.delay_rate = delay_rate
+        self.delay = delay
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.injected = {"errors": 0, "delays": 0}
+
+    def faults(self):
+        """(delay seconds, error status or None) of the next request"""
+        with self.rng_lock:
+            delay = self.delay if self.delay_rate and self.rng.random() < self.delay_rate else 0.0
+            error = self.error_status if self.error_rate and self.rng.random() < self.error_rate else None
+            self.injected["delays"] += bool(delay)
+            self.injected["errors"] += bool(error)
+        return delay, error
+
+
+class OfflineChatServer:
+    def __init__(self, backend=None, host="127.0.0.1", port=0, error_rate=0.0, error_status=429, retry_after=None,
+                 delay_rate=0.0, delay=0.0, seed=0):
+        """
+        Local HTTP server speaking the chat-completions protocol, port 0 picks a free port.
+        Faults for testing the client side, drawn per request from a generator seeded with seed:
+        error_rate: share of requests answered with error_status (with a Retry-After of retry_after on 429)
+        delay_rate / delay: share of requests held back delay seconds before they are answered
+        """
+        self.httpd = FaultyHTTPServer((host, port), ChatCompletionsHandler, error_rate, error_status, retry_after,
+                                      delay_rate, delay, seed)
+        self.httpd.backend = backend or OfflineBackend()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="offline chat-completions stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds of injected 429 answers")
+    parser.add_argument("--delay-rate", type=float, default=0.0, help="share of requests held back --delay seconds")
+    parser.add_argument("--delay", type=float, default=0.0)
+    args = parser.parse_args()
+    server = OfflineChatServer(OfflineBackend(args.latency, args.jitter, args.seed), args.host, args.port,
+                               args.error_rate, args.error_status, args.retry_after, args.delay_rate, args.delay,
+                               args.seed)
+    print(f"offline LLM serving on {server.base_url}")
+    server.httpd.serve_forever()
@@ -0,0 +1,193 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src import backend, chat
+from src.cache import ResponseCache
+from src.request_policy import make_policy
+from src.simulation import create_event, load_inputs
+
+# per-process state, filled once by init_worker
+worker_inputs = None
+worker_sink_options = {}
+
+
+def build_jobs(users, seeds, days_list):
+    """Job matrix: one job per (user_name, seed, total_days)"""
+    return [{"user_name": user_name, "seed": seed, "total_days": total_days}
+            for user_name, seed, total_days in itertools.product(users, seeds, days_list)]
+
+
+def job_dir(output_root, job):
+    return os.path.join(output_root, job["user_name"], str(job["seed"]))
+
+
+def check_jobs(jobs, inputs):
+    user_config = inputs["user_profile"]["user_config"]
+    seen = set()
+    for job in jobs:
+        if job["user_name"] not in user_config:
+            raise ValueError(f"unknown user profile: {job['user_name']}")
+        # output directories are named by (user, seed), a shorter run of the same seed is a prefix of the longer one
+        key = (job["user_name"], job["seed"])
+        if key in seen:
+            raise ValueError(f"duplicate job for user {key[0]} seed {key[1]}")
+        seen.add(key)
+
+
+def init_worker(inputs, backend_options, cache, quiet, sink_options, policy=None):
+    """
+    Process pool initializer: receive the configs once and set up the LLM backend, cache, request policy
+    and record sink
+    """
+    global worker_inputs, worker_sink_options
+    worker_inputs = inputs
+    worker_sink_options = sink_options
+    chat.set_backend(backend.make_backend(**backend_options))
+    chat.set_response_cache(cache)
+    chat.set_request_policy(policy)
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+
+
+def run_job(job, output_root, planned_schedules=None):
+    save_dir = job_dir(output_root, job)
+    entry = dict(job, output_dir=save_dir, pid=os.getpid())
+    start = time.perf_counter()
+    if chat.request_policy is not None:
+        chat.request_policy.metrics.restart()
+    try:
+        event_system = create_event(worker_inputs, job["user_name"], job["seed"], save_dir=save_dir,
+                                    **worker_sink_options)
+        event_system.planned_schedules.update(planned_schedules or {})
+        event_system.run_workflow(total_days=job["total_days"])
+        entry["status"] = "done"
+        entry["usage"] = event_system.agent.usage.summary()["run"]
+        if event_system.profiler.enabled:
+            entry["profile"] = event_system.profiler.summary()["phases"]
+    except Exception:
+        entry["status"] = "failed"
+        entry["error"] = traceback.format_exc()
+    entry["elapsed"] = time.perf_counter() - start
+    if chat.request_policy is not None:
+        entry["requests"] = chat.request_policy.metrics.summary()
+    entry["files"] = sorted(os.listdir(save_dir)) if os.path.isdir(save_dir) else []
+    if os.path.isdir(save_dir):
+        with open(os.path.join(save_dir, "manifest.json"), 'w', encoding='utf-8') as file:
+            json.dump(entry, file, ensure_ascii=False, indent=2)
+    return entry
+
+
+def run_batch(jobs, output_root="record", max_workers=None, backend_options=None, cache=None, quiet=True,
+              inputs=None, sink_options=None, planned=None, policy=None):
+    """
+    Run every job in a process pool and write the merged manifest to output_root/manifest.json.
+    backend_options: keyword arguments of backend.make_backend, built inside each worker
+    cache: optional ResponseCache shared by the workers through its sqlite file
+    sink_options: keyword arguments sink_format / compress / checkpoint_every / resume / compact_prompts /
+                  history_window / random_model / profile / prometheus / stream_schedules / prefetch_schedules
+                  of simulation.create_event
+    planned: daily schedules generated ahead of the run, offline_batch.ingest_results
+    policy: optional request_policy.RequestPolicy of the workers, its TokenBucket file (if any) is shared by all
+    """
+    inputs = inputs or load_inputs()
+    check_jobs(jobs, inputs)
+    backend_options = backend_options or {"name": "openai"}
+    planned = planned or {}
+    entries = [None] * len(jobs)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                             initargs=(inputs, backend_options, cache, quiet, sink_options or {}, policy)) as executor:
+        futures = {executor.submit(run_job, job, output_root, planned.get((job["user_name"], job["seed"]))): i
+                   for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            entry = future.result()
+            entries[futures[future]] = entry
+            print(f"[{entry['status']}] {entry['user_name']} seed={entry['seed']} "
+                  f"days={entry['total_days']} in {entry['elapsed']:.2f}s")
+    manifest = {
+        "output_root": output_root,
+        "elapsed": time.perf_counter() - start,
+        "jobs": entries
+    }
+    os.makedirs(output_root, exist_ok=True)
+    with open(os.path.join(output_root, "manifest.json"), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="generate records for a matrix of user profiles, seeds and days")
+    parser.add_argument("--users", nargs="+", default=["OldMan", "RemoteWorker", "HolidayMaker"])
+    parser.add_argument("--seeds", nargs="+", type=int, default=[1])
+    parser.add_argument("--days", nargs="+", type=int, default=[14])
+    parser.add_argument("--jobs", help="JSON file with a list of {user_name, seed, total_days} jobs")
+    parser.add_argument("--output", default="record")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores")
+    parser.add_argument("--offline", action="store_true", help="use the offline stand-in instead of the LLM")
+    parser.add_argument("--latency", type=float, default=0.0, help="artificial latency of the offline stand-in")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. a local backend.OfflineChatServer")
+    parser.add_argument("--cache-dir", help="share an on-disk response cache between the workers")
+    parser.add_argument("--replay", action="store_true", help="fail on a cache miss instead of calling the LLM")
+    parser.add_argument("--verbose", action="store_true", help="keep the simulator output of the workers")
+    parser.add_argument("--sink", choices=["csv", "jsonl", "parquet"], help="stream records instead of daily csv")
+    parser.add_argument("--gzip", action="store_true", help="gzip the streamed csv / jsonl records")
+    parser.add_argument("--checkpoint", choices=["activity", "day"], help="checkpoint every job at this granularity")
+    parser.add_argument("--resume", action="store_true", help="continue jobs from their last checkpoint")
+    parser.add_argument("--planned", help="batch results file of offline_batch with the daily schedules")
+    parser.add_argument("--compact-prompts", action="store_true", help="compact schedule encoding in the prompts")
+    parser.add_argument("--history-window", type=int, help="completed activities kept in the prompts")
+    parser.add_argument("--random-model", choices=["legacy", "timeline"], default="legacy",
+                        help="toilet / phone trigger model")
+    parser.add_argument("--profile", action="store_true", help="write a profile.json of every job")
+    parser.add_argument("--prometheus", action="store_true", help="also write the profile as profile.prom")
+    parser.add_argument("--stream", action="store_true", help="stream schedules and simulate them as they arrive")
+    parser.add_argument("--prefetch", action="store_true", help="request the next day's schedule during the day")
+    parser.add_argument("--rate-limit", type=float, help="LLM requests per second, shared by all workers")
+    parser.add_argument("--burst", type=float, help="requests allowed at once, defaults to one second of them")
+    parser.add_argument("--timeout", type=float, help="seconds per LLM request attempt")
+    parser.add_argument("--max-retries", type=int, help="retries after a rate limit, server error or timeout")
+    parser.add_argument("--hedge-percentile", type=float,
+                        help="send a duplicate request when one is slower than this latency percentile")
+    parser.add_argument("--compact", metavar="STORE", help="consolidate the output into a dataset store at the end")
+    args = parser.parse_args()
+
+    if args.jobs:
+        with open(args.jobs, 'r', encoding='utf-8') as file:
+            batch_jobs = json.load(file)
+    else:
+        batch_jobs = build_jobs(args.users, args.seeds, args.days)
+    response_cache = ResponseCache(args.cache_dir, replay=args.replay) if args.cache_dir else None
+    planned_schedules = None
+    if args.planned:
+        from src.offline_batch import ingest_results
+        planned_schedules = ingest_results(args.planned)
+    os.makedirs(args.output, exist_ok=True)
+    request_policy = make_policy(args.rate_limit, args.burst, args.timeout, args.max_retries, args.hedge_percentile,
+                                 bucket_path=os.path.join(args.output, "rate_limit.bucket"))
+    backend_options = {"name": "offline" if args.offline else "openai", "latency": args.latency,
+                       "base_url": args.base_url}
+    if request_policy is not None and not args.offline:
+        # the policy retries, the client itself should not
+        backend_options.update(timeout=args.timeout, max_retries=0)
+    result = run_batch(batch_jobs, args.output, args.workers, backend_options=backend_options,
+                       cache=response_cache, quiet=not args.verbose,
+                       sink_options={"sink_format": args.sink, "compress": args.gzip,
+                                     "checkpoint_every": args.checkpoint, "resume": args.resume,
+                                     "compact_prompts": args.compact_prompts,
+                                     "history_window": args.history_window,
+                                     "random_model": args.random_model,
+                                     "profile": args.profile or args.prometheus, "prometheus": args.prometheus,
+                                     "stream_schedules": args.stream, "prefetch_schedules": args.prefetch},
+                       planned=planned_schedules, policy=request_policy)
+    failed = [entry for entry in result["jobs"] if entry["status"] != "done"]
+    print(f"{len(batch_jobs) - len(failed)}/{len(batch_jobs)} jobs done in {result['elapsed']:.2f}s")
+    if args.compact:
+        from src.dataset_store import compact
+        store_meta = compact(args.output, args.compact)
+        print(f"{store_meta['rows']['record']} records compacted into {args.compact}")
@@ -0,0 +1,230 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from src import backend, chat, utils
+from src.amplify import LocalDecisions
+from src.path_cache import PathCache
+from src.simulation import create_event, load_inputs
+
+BENCHMARK_USER = "RemoteWorker"
+BENCHMARK_SEED = 7
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# what a batch worker imports, and the modules it should not pull in at startup
+WORKER_MODULES = ["src.batch", "src.simulation"]
+HEAVY_MODULES = ["matplotlib", "pandas", "pyarrow", "openai"]
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the simulator output while timing"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def facility_positions(env_config):
+    """Every Facility and control_device position of the layout"""
+    env_config = env_config["environment_config"]
+    return [(value['x'], value['y']) for group in ("Facility", "control_device")
+            for value in env_config[group].values()]
+
+
+def bench_startup(save_dir):
+    """Fresh interpreter importing the worker modules"""
+    subprocess.run([sys.executable, "-c", "import " + ", ".join(WORKER_MODULES)], cwd=REPO_ROOT, check=True)
+    return 1
+
+
+def heavy_startup_modules():
+    """The HEAVY_MODULES a fresh interpreter has loaded after importing the worker modules"""
+    script = (f"import sys, {', '.join(WORKER_MODULES)}; "
+              f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, check=True, capture_output=True,
+                            text=True).stdout.strip()
+    return output.split(",") if output else []
+
+
+def bench_bfs_position(inputs):
+    """utils.move_to_position between every pair of facilities"""
+    map_matrix = inputs["map_matrix"].tolist()
+    positions = facility_positions(inputs["env_config"])
+    for position_from in positions:
+        for position_to in positions:
+            utils.move_to_position(position_from, position_to, map_matrix)
+    return len(positions) ** 2
+
+
+def bench_bfs_area(inputs):
+    """utils.move_to_area from every facility to every valid_area"""
+    map_matrix = inputs["map_matrix"].tolist()
+    positions = facility_positions(inputs["env_config"])
+    areas = inputs["env_config"]["environment_config"]["valid_area"]
+    for position_from in positions:
+        for area in areas.values():
+            utils.move_to_area(position_from, area["Scope"], map_matrix)
+    return len(positions) * len(areas)
+
+
+def bench_path_cache_build(inputs):
+    """PathCache fields of the whole layout, built from scratch"""
+    PathCache(inputs["env_config"], inputs["map_matrix"])
+    return 1
+
+
+def bench_path_cache_query(inputs):
+    """PathCache.move_to_position between every pair of facilities"""
+    path_cache = inputs["path_cache"]
+    positions = facility_positions(inputs["env_config"])
+    for position_from in positions:
+        for position_to in positions:
+            path_cache.move_to_position(position_from, position_to)
+    return len(positions) ** 2
+
+
+def prepared_event(inputs, save_dir):
+    event_system = create_event(inputs, BENCHMARK_USER, BENCHMARK_SEED, save_dir=save_dir)
+    event_system.reset_state()
+    event_system.agent.time = 7 * 60
+    event_system.agent.last_toilet_time = event_system.agent.time
+    return event_system
+
+
+def bench_execute_movement(inputs, save_dir):
+    """Event.execute_movement with sensor emission between every pair of facilities"""
+    event_system = prepared_event(inputs, save_dir)
+    env_config = inputs["env_config"]["environment_config"]
+    targets = list(env_config["Facility"]) + list(env_config["control_device"])
+    for target_from in targets:
+        for target_to in targets:
+            for target in (target_from, target_to):
+                event_system.execute_movement({"state": "position", "target": target, "activity_name": "Reading",
+                                               "duration": 1})
+    return 2 * len(targets) ** 2
+
+
+def bench_event_list(inputs, save_dir):
+    """activity2event_list + handle_event_list of every activity, agent requests answered locally"""
+    event_system = prepared_event(inputs, save_dir)
+    decisions = LocalDecisions(event_system.agent, [], event_system.rng)
+    events = 0
+    for activity in inputs["activity_config"]["activity_config"]:
+        activity_name = activity["activity_name"]
+        event_system.activity_now = {"activity_name": activity_name, "start_time": "07:00", "end_time": "07:30"}
+        event_list = event_system.activity2event_list(event_system.find_activity(activity_name), activity_name, 30)
+        events += len(event_list)
+        event_system.drive(event_system.handle_event_list(event_list, activity_name), decisions)
+    return events
+
+
+def bench_run_workflow(inputs, save_dir, days):
+    """Full run_workflow against the offline stand-in, fixed user and seed"""
+    chat.set_backend(backend.OfflineBackend())
+    chat.set_response_cache(None)
+    event_system = create_event(inputs, BENCHMARK_USER, BENCHMARK_SEED, save_dir=save_dir)
+    event_system.run_workflow(total_days=days)
+    return days
+
+
+def run_benchmarks(repeat=5, days=9, only=None):
+    """Time every benchmark repeat times, returns the machine-readable results"""
+    with quiet():
+        inputs = load_inputs()
+    benchmarks = {
+        "startup_import": bench_startup,
+        "bfs_move_to_position": lambda save_dir: bench_bfs_position(inputs),
+        "bfs_move_to_area": lambda save_dir: bench_bfs_area(inputs),
+        "path_cache_build": lambda save_dir: bench_path_cache_build(inputs),
+        "path_cache_query": lambda save_dir: bench_path_cache_query(inputs),
+        "execute_movement": lambda save_dir: bench_execute_movement(inputs, save_dir),
+        "event_list": lambda save_dir: bench_event_list(inputs, save_dir),
+        "run_workflow": lambda save_dir: bench_run_workflow(inputs, save_dir, days)
+    }
+    results = {}
+    for name, benchmark in benchmarks.items():
+        if only and name not in only:
+            continue
+        times = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as save_dir, quiet():
+                start = time.perf_counter()
+                ops = benchmark(save_dir)
+                times.append(time.perf_counter() - start)
+        median = statistics.median(times)
+        results[name] = {"ops": ops, "min": min(times), "median": median, "max": max(times),
+                         "ops_per_second": ops / median if median else None}
+        print(f"{name:24s} median {median * 1000:10.3f} ms  min {min(times) * 1000:10.3f} ms  ops {ops}")
+        if name == "startup_import":
+            results[name]["heavy_modules"] = heavy_startup_modules()
+            print(f"{'':24s} heavy modules at startup: {results[name]['heavy_modules'] or 'none'}")
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "repeat": repeat,
+            "days": days,
+            "user": BENCHMARK_USER,
+            "seed": BENCHMARK_SEED,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "benchmarks": results
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compare the median times of two result files.
+    Returns the names of the benchmarks more than threshold (relative) slower than the baseline.
+    """
+    regressions = []
+    print(f"{'benchmark':24s} {'baseline ms':>12s} {'current ms':>12s} {'change':>8s}")
+    for name, result in current["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            print(f"{name:24s} {'-':>12s} {result['median'] * 1000:12.3f} {'new':>8s}")
+            continue
+        change = result["median"] / base["median"] - 1 if base["median"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:24s} {base['median'] * 1000:12.3f} {result['median'] * 1000:12.3f} {change:+8.1%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="simulator benchmarks with saved baselines")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and save the results")
+    run_parser.add_argument("--output", default="benchmark.json")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--days", type=int, default=9, help="simulated days of the run_workflow benchmark")
+    run_parser.add_argument("--only", nargs="+", help="names of the benchmarks to run")
+    compare_parser = subparsers.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown to fail on")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        benchmark_results = run_benchmarks(args.repeat, args.days, args.only)
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(benchmark_results, file, indent=2)
+        print(f"results written to {args.output}")
+    else:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline_results = json.load(file)
+        with open(args.current, 'r', encoding='utf-8') as file:
+            current_results = json.load(file)
+        slower = compare(baseline_results, current_results, args.threshold)
+        sys.exit(1 if slower else 0)
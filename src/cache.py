@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class CacheMissError(KeyError):
+    """Raised in replay mode when a prompt has no cached response"""
+
+
+def make_cache_key(model, system_prompt, prompt, scope=None):
+    """
+    Content address of one chat request: sha256 over model, system prompt and rendered prompt.
+    scope: JSON-able discriminator of the call, e.g. [user, seed, day, occurrence] of SmartAgent.call_scope,
+           so that equal prompts of different households or days are not answered with one response
+    """
+    request = [model, system_prompt, prompt] if scope is None else [model, system_prompt, prompt, scope]
+    payload = json.dumps(request, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, cache_dir="cache", max_entries=None, max_bytes=None, replay=False):
+        """
+        cache_dir: directory holding the sqlite cache file
+        max_entries: keep at most this many responses, least recently used are evicted first
+        max_bytes: keep the total response size under this many bytes
+        replay: strict replay-only mode, a miss raises CacheMissError instead of calling the LLM
+        hits / misses / writes / evictions: counters of this process
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.path = os.path.join(cache_dir, "responses.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        # sqlite connections cannot cross process boundaries, reopen lazily in the worker
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        state["_conn"] = None
+        state["_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None or self._pid != os.getpid():
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, "
+                "created REAL, last_access REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses (last_access)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, model, system_prompt, prompt, scope=None):
+        """Return the cached response or None; in replay mode a miss raises CacheMissError"""
+        key = make_cache_key(model, system_prompt, prompt, scope)
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+        if self.replay:
+            raise CacheMissError(f"replay mode: no cached response for key {key}")
+        return None
+
+    def put(self, model, system_prompt, prompt, response, scope=None):
+        key = make_cache_key(model, system_prompt, prompt, scope)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode('utf-8')), now, now))
+            self.writes += 1
+            self._evict(conn)
+            conn.commit()
+        return key
+
+    def _evict(self, conn):
+        """Drop least recently used responses until both bounds hold"""
+        if self.max_entries is not None:
+            count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                removed = conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)).rowcount
+                self.evictions += removed
+        if self.max_bytes is not None:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            while total > self.max_bytes:
+                row = conn.execute(
+                    "SELECT key, size FROM responses ORDER BY last_access ASC LIMIT 1").fetchone()
+                if row is None:
+                    break
+                conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+                total -= row[1]
+                self.evictions += 1
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+            "replay": self.replay
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
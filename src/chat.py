@@ -1,19 +1,199 @@
-# Please install OpenAI SDK first: `pip3 install openai`
-import os
-from openai import OpenAI
-
-client = OpenAI(
-    api_key=os.environ.get("DEEPSEEK_API_KEY", "sk-306fd70669ab4d1faa526a050ca99564"),
-    base_url="https://api.deepseek.com")
-
-
-def get_response(content):
-    response = client.chat.completions.create(
-        model="deepseek-chat",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant"},
-            {"role": "user", "content": content},
-        ],
-        stream=False
-    )
-    return response.choices[0].message.content
+import asyncio
+import contextlib
+import time
+
+from src.backend import OpenAIBackend, estimate_usage
+
+SYSTEM_PROMPT = "You are a helpful assistant"
+
+# default src.backend.LLMBackend, created on first use unless set_backend is called
+backend = None
+# optional src.cache.ResponseCache, see set_response_cache
+response_cache = None
+# optional asyncio.Semaphore capping in-flight get_response_async calls, see set_concurrency_limit
+llm_semaphore = None
+# optional src.request_policy.RequestPolicy: rate limit, timeout, retries and hedging, see set_request_policy
+request_policy = None
+
+
+def set_backend(llm_backend):
+    """Select the backend used by get_response when the caller does not pass one"""
+    global backend
+    backend = llm_backend
+
+
+def get_backend():
+    global backend
+    if backend is None:
+        backend = OpenAIBackend()
+    return backend
+
+
+def set_response_cache(cache):
+    """Route every get_response call through an on-disk response cache (None disables it)"""
+    global response_cache
+    response_cache = cache
+
+
+def set_concurrency_limit(max_concurrency):
+    """Cap the number of in-flight get_response_async calls (None removes the cap)"""
+    global llm_semaphore
+    llm_semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+
+def set_request_policy(policy):
+    """Issue every backend request under a RequestPolicy (None sends each request once, as it comes)"""
+    global request_policy
+    request_policy = policy
+
+
+def messages_for(content):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content},
+    ]
+
+
+def record_usage(usage, call_type, messages, answer, token_usage, latency, cached=False):
+    if usage is None:
+        return
+    token_usage = token_usage or estimate_usage(messages, answer)
+    usage.record(call_type, token_usage["prompt_tokens"], token_usage["completion_tokens"], latency, cached=cached)
+
+
+def complete(llm_backend, messages):
+    if request_policy is None:
+        return llm_backend.complete_with_usage(messages)
+    return request_policy.call(lambda: llm_backend.complete_with_usage(messages))
+
+
+async def acomplete(llm_backend, messages):
+    if request_policy is None:
+        return await llm_backend.acomplete_with_usage(messages)
+    return await request_policy.acall(lambda: llm_backend.acomplete_with_usage(messages))
+
+
+def get_response(content, llm_backend=None, usage=None, call_type=None, cache_scope=None):
+    """
+    usage: optional src.usage.UsageTracker recording tokens and latency of the call under call_type
+    cache_scope: discriminator of the call in the response cache key, see cache.make_cache_key
+    """
+    llm_backend = llm_backend or get_backend()
+    messages = messages_for(content)
+    if response_cache is not None:
+        cached = response_cache.get(llm_backend.model, SYSTEM_PROMPT, content, cache_scope)
+        if cached is not None:
+            record_usage(usage, call_type, messages, cached, None, 0.0, cached=True)
+            return cached
+    start = time.perf_counter()
+    answer, token_usage = complete(llm_backend, messages)
+    record_usage(usage, call_type, messages, answer, token_usage, time.perf_counter() - start)
+    if response_cache is not None:
+        response_cache.put(llm_backend.model, SYSTEM_PROMPT, content, answer, cache_scope)
+    return answer
+
+
+async def get_response_async(content, llm_backend=None, usage=None, call_type=None, cache_scope=None):
+    llm_backend = llm_backend or get_backend()
+    messages = messages_for(content)
+    if response_cache is not None:
+        cached = response_cache.get(llm_backend.model, SYSTEM_PROMPT, content, cache_scope)
+        if cached is not None:
+            record_usage(usage, call_type, messages, cached, None, 0.0, cached=True)
+            return cached
+    if llm_semaphore is not None:
+        async with llm_semaphore:
+            start = time.perf_counter()
+            answer, token_usage = await acomplete(llm_backend, messages)
+    else:
+        start = time.perf_counter()
+        answer, token_usage = await acomplete(llm_backend, messages)
+    record_usage(usage, call_type, messages, answer, token_usage, time.perf_counter() - start)
+    if response_cache is not None:
+        response_cache.put(llm_backend.model, SYSTEM_PROMPT, content, answer, cache_scope)
+    return answer
+
+
+def open_stream(llm_backend, messages):
+    """Start a backend stream and wait for its first piece: (stream, first pieces)"""
+    pieces = llm_backend.stream(messages)
+    for piece in pieces:
+        return pieces, [piece]
+    return None, []
+
+
+def stream_response(content, llm_backend=None, usage=None, call_type=None, cache_scope=None):
+    """
+    get_response as a generator of the answer in pieces, as the backend produces them.
+    Usage and the response cache are written once the answer is complete. Under a request policy,
+    a request failing before its first piece is retried; a failure later in the answer reaches the caller.
+    """
+    llm_backend = llm_backend or get_backend()
+    messages = messages_for(content)
+    if response_cache is not None:
+        cached = response_cache.get(llm_backend.model, SYSTEM_PROMPT, content, cache_scope)
+        if cached is not None:
+            record_usage(usage, call_type, messages, cached, None, 0.0, cached=True)
+            yield cached
+            return
+    start = time.perf_counter()
+    if request_policy is None:
+        pieces, answer = open_stream(llm_backend, messages)
+    else:
+        # the time to the first piece, not to the whole answer, is compared for hedging
+        pieces, answer = request_policy.call(lambda: open_stream(llm_backend, messages), kind="first_piece")
+    yield from answer
+    token_usage = None
+    while pieces is not None:
+        try:
+            piece = next(pieces)
+        except StopIteration as stop:
+            token_usage = stop.value
+            break
+        answer.append(piece)
+        yield piece
+    answer = "".join(answer)
+    record_usage(usage, call_type, messages, answer, token_usage, time.perf_counter() - start)
+    if response_cache is not None:
+        response_cache.put(llm_backend.model, SYSTEM_PROMPT, content, answer, cache_scope)
+
+
+async def aopen_stream(llm_backend, messages):
+    """Async open_stream: (stream, first piece, usage reported with it)"""
+    pieces = llm_backend.astream(messages)
+    async for piece, token_usage in pieces:
+        return pieces, piece, token_usage
+    return None, "", None
+
+
+async def astream_response(content, llm_backend=None, usage=None, call_type=None, cache_scope=None):
+    """
+    stream_response as an async generator over the backend's async stream.
+    The concurrency limit is held for the whole request, from its start to the last piece.
+    """
+    llm_backend = llm_backend or get_backend()
+    messages = messages_for(content)
+    if response_cache is not None:
+        cached = response_cache.get(llm_backend.model, SYSTEM_PROMPT, content, cache_scope)
+        if cached is not None:
+            record_usage(usage, call_type, messages, cached, None, 0.0, cached=True)
+            yield cached
+            return
+    async with llm_semaphore or contextlib.nullcontext():
+        start = time.perf_counter()
+        if request_policy is None:
+            pieces, piece, token_usage = await aopen_stream(llm_backend, messages)
+        else:
+            pieces, piece, token_usage = await request_policy.acall(
+                lambda: aopen_stream(llm_backend, messages), kind="first_piece")
+        answer = [piece]
+        yield piece
+        if pieces is not None:
+            async for piece, piece_usage in pieces:
+                token_usage = piece_usage or token_usage
+                answer.append(piece)
+                yield piece
+    answer = "".join(answer)
+    record_usage(usage, call_type, messages, answer, token_usage, time.perf_counter() - start)
+    if response_cache is not None:
+        response_cache.put(llm_backend.model, SYSTEM_PROMPT, content, answer, cache_scope)
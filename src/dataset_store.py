@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from src.record_loader import (CATEGORICAL_VOCABULARY, TABLE_COLUMNS, RecordTable, load_record_dir,
+                               load_schedule_dir, loader_vocabularies, run_directories)
+from src.record_store import Vocabulary
+
+STORE_META = "store.json"
+STORE_VERSION = 1
+# columns of the done_schedule stream, day first as in the record stream
+SCHEDULE_COLUMNS = {
+    "day": np.int32,
+    "activity": np.int16,
+    "start": np.int16,
+    "end": np.int16
+}
+STREAM_COLUMNS = {"record": TABLE_COLUMNS, "done_schedule": SCHEDULE_COLUMNS}
+# one entry per (user, seed, day), the rows of a day are [start, stop) of each stream
+INDEX_DTYPE = np.dtype([("user", np.int32), ("seed", np.int64), ("day", np.int32),
+                        ("record_start", np.int64), ("record_stop", np.int64),
+                        ("done_schedule_start", np.int64), ("done_schedule_stop", np.int64)])
+
+
+def column_path(store_dir, stream, column):
+    return os.path.join(store_dir, stream, f"{column}.bin")
+
+
+def run_identity(run_dir):
+    """
+    (user_name, seed) of a run directory, from its manifest.json or the directory layout:
+    record/<user>/<seed> of batch and simulation runs, <user>/day<N>/seed<seed> of amplify replays
+    """
+    manifest_path = os.path.join(run_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        if "user_name" in manifest and "seed" in manifest:
+            return manifest["user_name"], int(manifest["seed"])
+    run_path = os.path.abspath(run_dir)
+    parent = os.path.dirname(run_path)
+    seed = os.path.basename(run_path)
+    replay = re.fullmatch(r"seed(\d+)", seed)
+    if replay and re.fullmatch(r"day\d+", os.path.basename(parent)):
+        return os.path.basename(os.path.dirname(parent)), int(replay.group(1))
+    if not seed.isdigit():
+        raise ValueError(f"cannot tell the seed of run directory {run_dir}")
+    return os.path.basename(parent), int(seed)
+
+
+def day_bounds(days):
+    """(day, start, stop) of every run of equal values in a sorted day column"""
+    if not len(days):
+        return []
+    starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+    stops = np.concatenate((starts[1:], [len(days)]))
+    return list(zip(days[starts].tolist(), starts.tolist(), stops.tolist()))
+
+
+def compact(corpus_root, store_dir, chunk_size=100000):
+    """
+    Consolidate every run below corpus_root into one store: a raw little-endian file per stream column,
+    appended run by run with the rows of each run sorted by day, an index of (user, seed, day) row ranges
+    and the vocabularies in store.json. Only one run is held in memory at a time.
+    """
+    vocabularies = loader_vocabularies()
+    users = []
+    index = []
+    seen = set()
+    rows = {stream: 0 for stream in STREAM_COLUMNS}
+    files = {}
+    if os.path.exists(os.path.join(store_dir, STORE_META)):
+        os.remove(os.path.join(store_dir, STORE_META))
+    for stream, columns in STREAM_COLUMNS.items():
+        os.makedirs(os.path.join(store_dir, stream), exist_ok=True)
+        for column in columns:
+            files[stream, column] = open(column_path(store_dir, stream, column), 'wb')
+    try:
+        for run_dir in run_directories(corpus_root):
+            user_name, seed = run_identity(run_dir)
+            if user_name not in users:
+                users.append(user_name)
+            table = load_record_dir(run_dir, vocabularies, chunk_size)
+            order = np.argsort(table["day"], kind="stable")
+            streams = {
+                "record": {column: table[column][order] for column in TABLE_COLUMNS},
+                "done_schedule": load_schedule_dir(run_dir, vocabularies, chunk_size)
+            }
+            bounds = {}
+            for stream, columns in streams.items():
+                for column, dtype in STREAM_COLUMNS[stream].items():
+                    columns[column].astype(np.dtype(dtype).newbyteorder("<"), copy=False).tofile(
+                        files[stream, column])
+                for day, start, stop in day_bounds(columns["day"]):
+                    bounds.setdefault(day, {})[stream] = (rows[stream] + start, rows[stream] + stop)
+                rows[stream] += len(columns["day"])
+            for day in sorted(bounds):
+                # a day of a run simulated again (a batch run and a replay of the same seed) would be indexed twice
+                key = (user_name, seed, day)
+                if key in seen:
+                    raise ValueError(f"duplicate day {day} of user {user_name} seed {seed} in {run_dir}")
+                seen.add(key)
+                record = bounds[day].get("record", (rows["record"], rows["record"]))
+                done_schedule = bounds[day].get("done_schedule", (rows["done_schedule"], rows["done_schedule"]))
+                index.append((users.index(user_name), seed, day, *record, *done_schedule))
+    finally:
+        for file in files.values():
+            file.close()
+    np.save(os.path.join(store_dir, "index.npy"), np.array(index, dtype=INDEX_DTYPE))
+    meta = {
+        "version": STORE_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": os.path.abspath(corpus_root),
+        "users": users,
+        "rows": rows,
+        "columns": {stream: {column: np.dtype(dtype).str for column, dtype in columns.items()}
+                    for stream, columns in STREAM_COLUMNS.items()},
+        "vocabularies": {name: vocabulary.values for name, vocabulary in vocabularies.items()}
+    }
+    # written last, a store without store.json is an interrupted compaction
+    with open(os.path.join(store_dir, STORE_META), 'w', encoding='utf-8') as file:
+        json.dump(meta, file, ensure_ascii=False, indent=2)
+    return meta
+
+
+class DatasetStore:
+    def __init__(self, store_dir):
+        """
+        Read side of a compacted corpus. Columns are memory-mapped read only, a day, a run or the whole corpus
+        is a slice of them: nothing is parsed or copied until the rows are used.
+        """
+        with open(os.path.join(store_dir, STORE_META), 'r', encoding='utf-8') as file:
+            self.meta = json.load(file)
+        if self.meta["version"] != STORE_VERSION:
+            raise ValueError(f"unsupported dataset store version: {self.meta['version']}")
+        self.store_dir = store_dir
+        self.users = self.meta["users"]
+        self.vocabularies = {name: Vocabulary(values[1:]) for name, values in self.meta["vocabularies"].items()}
+        self.index = np.load(os.path.join(store_dir, "index.npy"))
+        self.positions = {(self.users[entry["user"]], int(entry["seed"]), int(entry["day"])): i
+                          for i, entry in enumerate(self.index)}
+        self.columns = {}
+        for stream, columns in self.meta["columns"].items():
+            rows = self.meta["rows"][stream]
+            self.columns[stream] = {
+                column: np.memmap(column_path(store_dir, stream, column), dtype=np.dtype(dtype), mode='r',
+                                  shape=(rows,)) if rows else np.zeros(0, dtype=np.dtype(dtype))
+                for column, dtype in columns.items()
+            }
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def keys(self):
+        """(user_name, seed, day) of every stored day, in store order"""
+        return list(self.positions)
+
+    def runs(self):
+        """(user_name, seed) of every stored run, in store order"""
+        return list(dict.fromkeys((user_name, seed) for user_name, seed, _ in self.positions))
+
+    def rows(self, stream, start, stop):
+        return {column: values[start:stop] for column, values in self.columns[stream].items()}
+
+    def day(self, user_name, seed, day):
+        """RecordTable of one day, its columns are views of the memory maps"""
+        entry = self.index[self.positions[user_name, seed, day]]
+        return RecordTable(self.rows("record", entry["record_start"], entry["record_stop"]), self.vocabularies)
+
+    def schedule(self, user_name, seed, day):
+        """Done schedule of one day: day, activity code, start and end minute columns"""
+        entry = self.index[self.positions[user_name, seed, day]]
+        return self.rows("done_schedule", entry["done_schedule_start"], entry["done_schedule_stop"])
+
+    def run(self, user_name, seed):
+        """
+        RecordTable of every day of a run. The rows of a run directory are contiguous and returned as views,
+        amplify replays of one seed come from several day<N> directories and their days are concatenated
+        """
+        entries = self.index[[i for (user, run_seed, _), i in self.positions.items()
+                              if user == user_name and run_seed == seed]]
+        if not len(entries):
+            raise KeyError((user_name, seed))
+        starts, stops = entries["record_start"], entries["record_stop"]
+        if np.array_equal(starts[1:], stops[:-1]):
+            return RecordTable(self.rows("record", starts[0], stops[-1]), self.vocabularies)
+        days = [self.rows("record", start, stop) for start, stop in zip(starts, stops)]
+        return RecordTable({column: np.concatenate([day[column] for day in days])
+                            for column in self.columns["record"]}, self.vocabularies)
+
+    def corpus_table(self, vocabularies=None):
+        """
+        Every row of the store with consecutive day indices across runs, as load_corpus returns them.
+        vocabularies: recode the categorical columns into these (e.g. to compare with a reference table)
+        """
+        columns = dict(self.columns["record"])
+        # every (user, seed, day) entry becomes its own day
+        lengths = self.index["record_stop"] - self.index["record_start"]
+        columns["day"] = np.repeat(np.arange(len(self.index), dtype=np.int32), lengths)
+        if vocabularies is None:
+            return RecordTable(columns, self.vocabularies)
+        for column, vocabulary_name in CATEGORICAL_VOCABULARY.items():
+            lookup = np.array([vocabularies[vocabulary_name].encode(value)
+                               for value in self.vocabularies[vocabulary_name].values], dtype=TABLE_COLUMNS[column])
+            columns[column] = lookup[columns[column]]
+        return RecordTable(columns, vocabularies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compact generated runs into one indexed, memory-mapped store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compact_parser = subparsers.add_parser("compact", help="consolidate the runs below a corpus directory")
+    compact_parser.add_argument("corpus", help="e.g. record, the output of src.batch")
+    compact_parser.add_argument("store", help="directory of the store")
+    compact_parser.add_argument("--chunk-size", type=int, default=100000)
+    info_parser = subparsers.add_parser("info", help="users, runs and rows of a store")
+    info_parser.add_argument("store")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        start = time.perf_counter()
+        store_meta = compact(args.corpus, args.store, args.chunk_size)
+        print(f"{store_meta['rows']['record']} records of {len(store_meta['users'])} users compacted into "
+              f"{args.store} in {time.perf_counter() - start:.2f}s")
+    else:
+        store = DatasetStore(args.store)
+        print(json.dumps({"users": store.users, "runs": len(store.runs()), "days": len(store),
+                          "rows": store.meta["rows"], "created": store.meta["created"]}, indent=2))
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from src.record_loader import load_records, loader_vocabularies
+
+# README ablation: feature groups on top of the hour of day and the recent activities
+FEATURE_SETS = {
+    "Base (Activity)": ("activity",),
+    "+ Device": ("activity", "device"),
+    "+ Sensor": ("activity", "sensor"),
+    "+ Device + Sensor": ("activity", "device", "sensor")
+}
+# user profile -> reference file of raw_data
+REFERENCE_FILES = {
+    "OldMan": "old_man.csv",
+    "RemoteWorker": "remote_worker.csv",
+    "HolidayMaker": "holiday maker.csv"
+}
+
+
+def window_counts(codes, size, window, rows):
+    """
+    (len(rows), size) counts of every code over the window rows before each of rows, code 0 (empty) is not counted.
+    Positions of each code are binary searched, memory stays proportional to the samples and not the records.
+    """
+    end = rows
+    start = np.maximum(end - window, 0)
+    counts = np.zeros((len(rows), size), dtype=np.float32)
+    for code in range(1, size):
+        positions = np.flatnonzero(codes == code)
+        if len(positions):
+            counts[:, code] = np.searchsorted(positions, end) - np.searchsorted(positions, start)
+    return counts
+
+
+def one_hot(codes, size):
+    matrix = np.zeros((len(codes), size), dtype=np.float32)
+    matrix[np.arange(len(codes)), codes] = 1
+    return matrix
+
+
+def last_activity(activity):
+    """Activity of the last labelled row before each row (0 before the first one)"""
+    labelled_index = np.where(activity != 0, np.arange(len(activity)), -1)
+    last = np.maximum.accumulate(np.concatenate(([-1], labelled_index[:-1])))
+    return np.where(last >= 0, activity[np.maximum(last, 0)], 0)
+
+
+def activity_starts(table):
+    """Samples of the prediction task: rows where a labelled activity other than the last one begins"""
+    activity = table["activity"].astype(np.int64)
+    return (activity != 0) & (activity != last_activity(activity))
+
+
+def feature_groups(table, rows, window):
+    """
+    Sliding-window features of the sample rows, built from the window rows before each of them, by group:
+    activity: hour of day, last activity and activity counts
+    device: device x state counts
+    sensor: sensor firing counts
+    """
+    activity = table["activity"].astype(np.int64)
+    activities = len(table.vocabularies["activity"])
+    states = len(table.vocabularies["state"])
+    device = table["device"].astype(np.int64) * states + table["device_state"]
+    # a device row without its device is no device row
+    device[table["device"] == 0] = 0
+    return {
+        "activity": np.hstack([one_hot(table["minute"][rows].astype(np.int64) // 60, 24),
+                               one_hot(last_activity(activity)[rows], activities),
+                               window_counts(activity, activities, window, rows) / window]),
+        "device": window_counts(device, len(table.vocabularies["device"]) * states, window, rows) / window,
+        "sensor": window_counts(table["sensor"], len(table.vocabularies["sensor"]), window, rows) / window
+    }
+
+
+def split_days(table, rows, test_fraction):
+    """Train / test masks over the sample rows, the last test_fraction of the days is held out"""
+    days = np.unique(table["day"])
+    test_days = days[len(days) - max(1, int(round(len(days) * test_fraction))):]
+    test = np.isin(table["day"][rows], test_days)
+    return ~test, test
+
+
+class SoftmaxRegression:
+    def __init__(self, epochs=200, learning_rate=0.05, weight_decay=1e-4):
+        """Multinomial logistic regression trained full batch with Adam, the CPU baseline of the ablation"""
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.weight_decay = weight_decay
+        self.classes = None
+        self.weights = None
+
+    def fit(self, features, labels):
+        self.classes, targets = np.unique(labels, return_inverse=True)
+        samples = len(features)
+        features = np.hstack([features, np.ones((samples, 1), dtype=np.float32)])
+        target = one_hot(targets, len(self.classes))
+        self.weights = np.zeros((features.shape[1], len(self.classes)), dtype=np.float32)
+        moment = np.zeros_like(self.weights)
+        velocity = np.zeros_like(self.weights)
+        for epoch in range(1, self.epochs + 1):
+            probabilities = self.softmax(features @ self.weights)
+            gradient = features.T @ (probabilities - target) / samples + self.weight_decay * self.weights
+            moment = 0.9 * moment + 0.1 * gradient
+            velocity = 0.999 * velocity + 0.001 * gradient * gradient
+            step = moment / (1 - 0.9 ** epoch) / (np.sqrt(velocity / (1 - 0.999 ** epoch)) + 1e-8)
+            self.weights -= self.learning_rate * step
+        return self
+
+    @staticmethod
+    def softmax(logits):
+        logits = logits - logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        return logits / logits.sum(axis=1, keepdims=True)
+
+    def predict(self, features):
+        features = np.hstack([features, np.ones((len(features), 1), dtype=np.float32)])
+        return self.classes[np.argmax(features @ self.weights, axis=1)]
+
+
+def evaluate(table, window=20, test_fraction=0.2, epochs=200, feature_sets=None):
+    """Top-1 accuracy of the next activity on the held-out days, one baseline per feature set"""
+    rows = np.flatnonzero(activity_starts(table))
+    groups = feature_groups(table, rows, window)
+    train, test = split_days(table, rows, test_fraction)
+    labels = table["activity"][rows]
+    results = {}
+    for name, group_names in (feature_sets or FEATURE_SETS).items():
+        features = np.hstack([groups[group] for group in group_names])
+        model = SoftmaxRegression(epochs=epochs).fit(features[train], labels[train])
+        predicted = model.predict(features[test])
+        results[name] = float(np.mean(predicted == labels[test])) if test.any() else None
+    return {"train_samples": int(train.sum()), "test_samples": int(test.sum()), "accuracy": results}
+
+
+def ablation_table(results):
+    """The README ablation table, best accuracy of each column in bold"""
+    users = list(results)
+    lines = ["| Configuration     | " + " | ".join(f"{user:12s}" for user in users) + " |",
+             "|-------------------|" + "|".join("-" * 14 for _ in users) + "|"]
+    best = {user: max((value for value in results[user]["accuracy"].values() if value is not None), default=None)
+            for user in users}
+    for name in FEATURE_SETS:
+        cells = []
+        for user in users:
+            value = results[user]["accuracy"].get(name)
+            cell = "-" if value is None else f"{value:.3f}"
+            if value is not None and value == best[user]:
+                cell = f"**{cell}**"
+            cells.append(f"{cell:12s}")
+        lines.append(f"| {name:17s} | " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="activity prediction ablation over reference or generated records")
+    parser.add_argument("--data", nargs="+", metavar="USER=PATH",
+                        help="csv file, run or corpus directory per user, defaults to the files of raw_data")
+    parser.add_argument("--raw-data", default=os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), "raw_data"))
+    parser.add_argument("--window", type=int, default=20, help="rows of history per sample")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="share of the last days held out")
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    if args.data:
+        sources = dict(item.split("=", 1) for item in args.data)
+    else:
+        sources = {user: os.path.join(args.raw_data, file_name) for user, file_name in REFERENCE_FILES.items()}
+    ablation = {}
+    for user_name, path in sources.items():
+        start = time.perf_counter()
+        user_table = load_records(path, loader_vocabularies())
+        ablation[user_name] = evaluate(user_table, args.window, args.test_fraction, args.epochs)
+        ablation[user_name]["elapsed"] = time.perf_counter() - start
+        print(f"{user_name}: {len(user_table)} rows in {ablation[user_name]['elapsed']:.1f}s")
+    print(ablation_table(ablation))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(ablation, file, ensure_ascii=False, indent=2)
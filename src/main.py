@@ -2,6 +2,7 @@ import os
 import json
 import utils
 
+from src import backend, chat
 from src.module import agent, event
 
 # map initialization
@@ -9,7 +10,7 @@ env_config_dir = "config/env_config.json"
 with open(env_config_dir, 'r', encoding='utf-8') as file:
     env_config = json.load(file)
 map_matrix = utils.map_initialization(env_config)
-# utils.create_color_table(map_matrix)
+# visualization.create_color_table(map_matrix), needs matplotlib
 
 # load user profile
 user_profile_dir = r"config/user_profile.json"
@@ -32,12 +33,26 @@ activity_str = utils.get_activity_str(activity_config)
 
 iteration_day_num = 1
 
+# seed of the household's random events, a rerun with the same seed replays a recorded response cache
+seed = 1
+
+# llm backend, backend.OfflineBackend(latency=0.5) runs without network
+chat.set_backend(backend.OpenAIBackend())
+
+# llm response cache, off by default: record a run with replay=False, regenerate it with replay=True
+response_cache = None
+# response_cache = src.cache.ResponseCache(cache_dir="cache", max_entries=50000, replay=False)
+chat.set_response_cache(response_cache)
+
 # user initialization
 user = agent.SmartAgent(user_profile_choose, activity_str, prompt_dict)
 
 # create event
-event_system = event.Event(agent=user, activity_config=activity_config, env_config=env_config, map_matrix=map_matrix)
+event_system = event.Event(agent=user, activity_config=activity_config, env_config=env_config, map_matrix=map_matrix,
+                           seed=seed)
 
 # run workflow
 total_days = 14
 event_system.run_workflow(total_days=total_days)
+if response_cache is not None:
+    print(f"response cache: {response_cache.stats()}")
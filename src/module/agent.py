@@ -1,12 +1,42 @@
+import hashlib
 import json
 
-from src import chat
+from src import chat, schedule_parser, utils
+from src.schedule_stream import AsyncSchedulePrefetch, AsyncScheduleStream, SchedulePrefetch, ScheduleStream
+from src.usage import UsageTracker
+
+# appended to the schedule prompts in compact mode, where no JSON schedule is left in the prompt to copy
+COMPACT_FORMAT_HINT = ('\nOutput the schedule as a JSON list of {"activity_name": ..., "start_time": "HH:MM", '
+                       '"end_time": "HH:MM"} objects.')
+# fallback answer of judge_waiting_event, the example given in decide_do_what_waiting
+DEFAULT_WAITING_ACTIVITY = "Daytime Rest"
 
 
 class SmartAgent:
-    def __init__(self, user_config, activity_list, prompt_dict):
+    def __init__(self, user_config, activity_list, prompt_dict, backend=None, compact_prompts=False,
+                 history_window=None, activity_names=None, max_reasks=2):
+        """
+        backend: src.backend.LLMBackend for this agent, None uses the chat module default
+        compact_prompts: write schedules into the prompts as "start-end activity_name" entries
+                         instead of the repr of the schedule dicts
+        history_window: only put the last history_window completed activities into the prompts
+        activity_names: valid activity names of the answers, defaults to activity_list and Going Out
+        max_reasks: how often an answer that cannot be repaired is asked again before falling back
+        """
         self.user_config = user_config
+        self.backend = backend
+        self.compact_prompts = compact_prompts
+        self.history_window = history_window
+        # tokens and latency of every LLM call, see src.usage
+        self.usage = UsageTracker()
+        # [user_name, seed] set by Event ([user_name] unseeded): response cache keys are then per household,
+        # day and occurrence
+        self.cache_scope = None
+        # (day, prompt digest) -> calls made so far, the occurrence index of call_scope
+        self.call_counts = {}
         self.activity_list = activity_list
+        self.activity_names = activity_names or [name.strip() for name in activity_list.split(",")] + ["Going Out"]
+        self.max_reasks = max_reasks
         self.user_profile = user_config['Introduction']
         self.user_lifestyle = ''
         self.prompt_dict = prompt_dict
@@ -15,8 +45,196 @@ class SmartAgent:
         for i, lifestyle_i in enumerate(user_config['Characteristics']):
             self.user_lifestyle += f'{i + 1}.{lifestyle_i};'
 
+    # Every decision below has a blocking and an async (a-prefixed) variant sharing prompt and parsing.
+    # An answer that cannot be repaired is re-asked at most max_reasks times, then the fallback is used.
+    def call_scope(self, prompt, day):
+        """
+        Response cache discriminator of the next call of prompt on day: without it the daily prompt, which only
+        depends on profile and weekday, would get the same cached schedule every week and in every household
+        """
+        if self.cache_scope is None:
+            return None
+        key = day, hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+        occurrence = self.call_counts.get(key, 0)
+        self.call_counts[key] = occurrence + 1
+        return [*self.cache_scope, day, occurrence]
+
+    def ask(self, prompt, call_type, parse, fallback, usage=None):
+        content = prompt
+        usage = usage or self.usage
+        for attempt in range(self.max_reasks + 1):
+            answer = chat.get_response(content=content, llm_backend=self.backend, usage=usage, call_type=call_type,
+                                       cache_scope=self.call_scope(content, usage.day))
+            try:
+                return parse(answer)
+            except schedule_parser.ScheduleError as e:
+                print(f"Unusable {call_type} answer, attempt {attempt + 1}: {e}")
+                content = schedule_parser.reask_prompt(prompt, e)
+        return fallback()
+
+    async def aask(self, prompt, call_type, parse, fallback, usage=None):
+        content = prompt
+        usage = usage or self.usage
+        for attempt in range(self.max_reasks + 1):
+            answer = await chat.get_response_async(content=content, llm_backend=self.backend, usage=usage,
+                                                   call_type=call_type,
+                                                   cache_scope=self.call_scope(content, usage.day))
+            try:
+                return parse(answer)
+            except schedule_parser.ScheduleError as e:
+                print(f"Unusable {call_type} answer, attempt {attempt + 1}: {e}")
+                content = schedule_parser.reask_prompt(prompt, e)
+        return fallback()
+
     def generate_daily_schedule(self):
+        return self.ask(self.daily_schedule_prompt(), "generate_daily_schedule", self.parse_daily_schedule,
+                        self.reference_schedule)
+
+    async def agenerate_daily_schedule(self):
+        return await self.aask(self.daily_schedule_prompt(), "generate_daily_schedule", self.parse_daily_schedule,
+                               self.reference_schedule)
+
+    # The daily prompt only depends on the profile and the weekday, the schedule of the next day can be
+    # generated in a worker thread (an asyncio task under the async driver) while the current day is simulated.
+    # Its usage is counted on that day.
+    def prefetch_daily_schedule(self, day):
+        weekday = utils.get_weekday(day)
+        usage = self.usage.for_day(day)
+        return SchedulePrefetch(day, weekday, lambda: self.ask(
+            self.daily_schedule_prompt(weekday), "generate_daily_schedule", self.parse_daily_schedule,
+            lambda: self.reference_schedule(weekday), usage))
+
+    async def aprefetch_daily_schedule(self, day):
+        weekday = utils.get_weekday(day)
+        usage = self.usage.for_day(day)
+        return AsyncSchedulePrefetch(day, weekday, lambda: self.aask(
+            self.daily_schedule_prompt(weekday), "generate_daily_schedule", self.parse_daily_schedule,
+            lambda: self.reference_schedule(weekday), usage))
+
+    def collect_daily_schedule(self, prefetch):
+        return prefetch.result()
+
+    async def acollect_daily_schedule(self, prefetch):
+        return await prefetch.aresult()
+
+    def generate_follow_up_schedule(self, todo_schedule, done_schedule):
+        prompt = self.follow_up_schedule_prompt(todo_schedule, done_schedule)
+        return self.ask(prompt, "generate_follow_up_schedule",
+                        lambda answer: self.parse_follow_up_schedule(todo_schedule, answer),
+                        lambda: list(todo_schedule))
+
+    async def agenerate_follow_up_schedule(self, todo_schedule, done_schedule):
+        prompt = self.follow_up_schedule_prompt(todo_schedule, done_schedule)
+        return await self.aask(prompt, "generate_follow_up_schedule",
+                               lambda answer: self.parse_follow_up_schedule(todo_schedule, answer),
+                               lambda: list(todo_schedule))
+
+    # Streamed variants of the schedule decisions: a ScheduleStream is returned at once and filled by a worker
+    # thread (an asyncio task under the async driver), next_schedule_entries / finish_schedule read it.
+    # Starting a stream does not block.
+    def stream_schedule(self, prompt, call_type, parse, fallback):
+        def recover(text, emitted):
+            """
+            The whole answer through the blocking path: repaired, or else re-asked while nothing was used.
+            Once entries were used, the fallback plan (the previous todo or the reference schedule) continues them.
+            """
+            try:
+                schedule = parse(text)
+            except schedule_parser.ScheduleError as e:
+                print(f"Unusable streamed {call_type} answer: {e}")
+                schedule = fallback() if emitted \
+                    else self.ask(schedule_parser.reask_prompt(prompt, e), call_type, parse, fallback)
+            return schedule[emitted:]
+
+        pieces = chat.stream_response(content=prompt, llm_backend=self.backend, usage=self.usage,
+                                      call_type=call_type, cache_scope=self.call_scope(prompt, self.usage.day))
+        return ScheduleStream(pieces, self.activity_names, recover)
+
+    # the async driver's streams are consumed by a task of its loop and held under chat.llm_semaphore
+    def astream_schedule(self, prompt, call_type, parse, fallback):
+        async def arecover(text, emitted):
+            try:
+                schedule = parse(text)
+            except schedule_parser.ScheduleError as e:
+                print(f"Unusable streamed {call_type} answer: {e}")
+                schedule = fallback() if emitted \
+                    else await self.aask(schedule_parser.reask_prompt(prompt, e), call_type, parse, fallback)
+            return schedule[emitted:]
+
+        pieces = chat.astream_response(content=prompt, llm_backend=self.backend, usage=self.usage,
+                                       call_type=call_type, cache_scope=self.call_scope(prompt, self.usage.day))
+        return AsyncScheduleStream(pieces, self.activity_names, arecover)
+
+    def stream_daily_schedule(self):
+        return self.stream_schedule(self.daily_schedule_prompt(), "generate_daily_schedule",
+                                    self.parse_daily_schedule, self.reference_schedule)
+
+    async def astream_daily_schedule(self):
+        return self.astream_schedule(self.daily_schedule_prompt(), "generate_daily_schedule",
+                                     self.parse_daily_schedule, self.reference_schedule)
+
+    def stream_follow_up_schedule(self, todo_schedule, done_schedule):
+        prompt = self.follow_up_schedule_prompt(todo_schedule, done_schedule)
+        previous = list(todo_schedule)
+        return self.stream_schedule(prompt, "generate_follow_up_schedule",
+                                    lambda answer: self.parse_follow_up_schedule(previous, answer),
+                                    lambda: list(previous))
+
+    async def astream_follow_up_schedule(self, todo_schedule, done_schedule):
+        prompt = self.follow_up_schedule_prompt(todo_schedule, done_schedule)
+        previous = list(todo_schedule)
+        return self.astream_schedule(prompt, "generate_follow_up_schedule",
+                                     lambda answer: self.parse_follow_up_schedule(previous, answer),
+                                     lambda: list(previous))
+
+    def next_schedule_entries(self, stream):
+        return stream.next_entries()
+
+    async def anext_schedule_entries(self, stream):
+        return await stream.anext_entries()
+
+    def finish_schedule(self, stream):
+        return stream.rest()
+
+    async def afinish_schedule(self, stream):
+        return await stream.arest()
+
+    def judge_waiting_event(self, todo_schedule, done_schedule, current_activity, current_waiting_event):
+        prompt = self.waiting_event_prompt(todo_schedule, done_schedule, current_activity, current_waiting_event)
+        return self.ask(prompt, "judge_waiting_event", self.parse_waiting_activity, self.default_waiting_activity)
+
+    async def ajudge_waiting_event(self, todo_schedule, done_schedule, current_activity, current_waiting_event):
+        prompt = self.waiting_event_prompt(todo_schedule, done_schedule, current_activity, current_waiting_event)
+        return await self.aask(prompt, "judge_waiting_event", self.parse_waiting_activity,
+                               self.default_waiting_activity)
+
+    def judge_phone_event(self, todo_schedule, done_schedule):
+        prompt = self.phone_event_prompt(todo_schedule, done_schedule)
+        return self.ask(prompt, "judge_phone_event",
+                        lambda answer: self.parse_phone_decision(todo_schedule, answer),
+                        lambda: list(todo_schedule))
+
+    async def ajudge_phone_event(self, todo_schedule, done_schedule):
+        prompt = self.phone_event_prompt(todo_schedule, done_schedule)
+        return await self.aask(prompt, "judge_phone_event",
+                               lambda answer: self.parse_phone_decision(todo_schedule, answer),
+                               lambda: list(todo_schedule))
+
+    def daily_schedule_prompt(self, weekday=None):
+        """Prompt of the daily schedule, of the current weekday unless another one is given"""
+        weekday = weekday or self.weekday
         prompt_format = self.prompt_dict["generate_new_day_plan"]
+        variables = {
+            "user_profile": self.user_profile,
+            "user_lifestyle": self.user_lifestyle,
+            "weekday": weekday,
+            "schedule_sample": self.plan_reference(weekday),
+            "activity_list": self.activity_list
+        }
+        return prompt_format.format(**variables)
+
+    def plan_reference(self, weekday=None):
+        """Sample schedule of the user for the category (weekday / weekend) of the current or the given day"""
         plan_reference = json.loads(self.prompt_dict["daily_plan_reference.json"])[self.user_config["user_name"]]
 
         DAY_CATEGORY = {
@@ -24,99 +242,92 @@ class SmartAgent:
             "Thursday": "Weekday", "Friday": "Weekday",
             "Saturday": "Weekend", "Sunday": "Weekend"
         }
-        category = DAY_CATEGORY.get(self.weekday)
+        category = DAY_CATEGORY.get(weekday or self.weekday)
         if category and plan_reference.get(category):
             plan_reference = plan_reference[category]
         else:
             plan_reference = plan_reference["default"]
+        return plan_reference
 
-        variables = {
-            "user_profile": self.user_profile,
-            "user_lifestyle": self.user_lifestyle,
-            "weekday": self.weekday,
-            "schedule_sample": plan_reference,
-            "activity_list": self.activity_list
-        }
-        prompt = prompt_format.format(**variables)
-
-        schedule = chat.get_response(content=prompt)
-        try:
-            schedule = schedule.replace("'", '"')
-            schedule = json.loads(schedule)
-        except json.JSONDecodeError as e:
-            print(f"JSON Error: {e}")
-            print(f"Original Schedule: {schedule}")
-        except Exception as e:
-            print(f"Other Error: {e}")
-            print(f"Original Schedule: {schedule}")
-        return schedule
-
-    def generate_follow_up_schedule(self, todo_schedule, done_schedule):
+    def follow_up_schedule_prompt(self, todo_schedule, done_schedule):
         # update schedule
-        # 1.generate prompt
         prompt_format = self.prompt_dict["update_day_plan"]
         variables = {
             "user_profile": self.user_profile,
             "user_lifestyle": self.user_lifestyle,
-            "todo_schedule": list(todo_schedule),
-            "past_schedule": list(done_schedule),
+            "todo_schedule": self.schedule_text(todo_schedule),
+            "past_schedule": self.schedule_text(done_schedule, self.history_window),
             "weekday": self.weekday,
             "activity_list": self.activity_list
         }
-        prompt = prompt_format.format(**variables)
-        # 2.generate schedule
-        schedule = chat.get_response(content=prompt)
-        try:
-            print(f"Original Schedule: {todo_schedule}")
-            print(f"New Schedule: {schedule}")
-            schedule = schedule.replace("'", '"')
-            schedule = json.loads(schedule)
-        except json.JSONDecodeError as e:
-            print(f"JSON Error: {e}")
-            print(f"Original Schedule: {schedule}")
-        except Exception as e:
-            print(f"Other Error: {e}")
-            print(f"Original Schedule: {schedule}")
-        return schedule
+        return prompt_format.format(**variables) + (COMPACT_FORMAT_HINT if self.compact_prompts else "")
 
-    def judge_waiting_event(self, todo_schedule, done_schedule, current_activity, current_waiting_event):
+    def waiting_event_prompt(self, todo_schedule, done_schedule, current_activity, current_waiting_event):
         # waiting decision
-        # 1.generate prompt
         prompt_format = self.prompt_dict["decide_do_what_waiting"]
         variables = {
             "user_profile": self.user_profile,
             "user_lifestyle": self.user_lifestyle,
-            "todo_schedule": list(todo_schedule),
-            "past_schedule": list(done_schedule),
+            "todo_schedule": self.schedule_text(todo_schedule),
+            "past_schedule": self.schedule_text(done_schedule, self.history_window),
             "activity": current_activity["activity_name"],
             "event_name": current_waiting_event["target"],
             "event_time": current_waiting_event["duration"],
             "weekday": self.weekday,
             "activity_list": self.activity_list
         }
-        prompt = prompt_format.format(**variables)
-        # 2.generate decision
-        choose_activity = chat.get_response(content=prompt)
-        print(f"Waiting activity: {choose_activity}")
-        return choose_activity
+        return prompt_format.format(**variables)
 
-    def judge_phone_event(self, todo_schedule, done_schedule):
+    def phone_event_prompt(self, todo_schedule, done_schedule):
         # phone decision
-        # 1.generate prompt
         prompt_format = self.prompt_dict["decide_whether_step_out"]
         variables = {
             "user_profile": self.user_profile,
             "user_lifestyle": self.user_lifestyle,
-            "todo_schedule": list(todo_schedule),
-            "past_schedule": list(done_schedule),
+            "todo_schedule": self.schedule_text(todo_schedule),
+            "past_schedule": self.schedule_text(done_schedule, self.history_window),
             "weekday": self.weekday,
             "activity_list": self.activity_list + ',Going Out'
         }
-        prompt = prompt_format.format(**variables)
-        # 2.generate decision
-        phone_decision = chat.get_response(content=prompt)
+        return prompt_format.format(**variables) + (COMPACT_FORMAT_HINT if self.compact_prompts else "")
+
+    def schedule_text(self, schedule, window=None):
+        """A schedule as it is written into the prompts"""
+        if self.compact_prompts:
+            return utils.format_schedule(schedule, window)
+        schedule = list(schedule)
+        if window is not None:
+            schedule = schedule[len(schedule) - window:] if window > 0 else []
+        return schedule
+
+    def parse_schedule(self, schedule, allow_empty=True):
+        """Repaired and validated schedule, raises schedule_parser.ScheduleError when it cannot be used"""
+        return schedule_parser.parse_schedule(schedule, self.activity_names, allow_empty)
+
+    def parse_daily_schedule(self, schedule):
+        return self.parse_schedule(schedule, allow_empty=False)
+
+    def parse_follow_up_schedule(self, todo_schedule, schedule):
+        print(f"Original Schedule: {todo_schedule}")
+        print(f"New Schedule: {schedule}")
+        return self.parse_schedule(schedule)
+
+    def parse_waiting_activity(self, choose_activity):
+        print(f"Waiting activity: {choose_activity}")
+        return schedule_parser.parse_activity_name(choose_activity, self.activity_names)
+
+    def parse_phone_decision(self, todo_schedule, phone_decision):
         print(f"Original Schedule: {todo_schedule}")
         print(f"New Schedule: {phone_decision}")
-        phone_decision = phone_decision.replace("'", '"')
-        phone_decision = json.loads(phone_decision)
-        return phone_decision
+        return self.parse_schedule(phone_decision)
+
+    def reference_schedule(self, weekday=None):
+        """Fallback of generate_daily_schedule: the sample schedule of the prompt"""
+        print("Falling back to the reference schedule")
+        return self.parse_schedule(json.dumps(self.plan_reference(weekday), ensure_ascii=False))
+
+    def default_waiting_activity(self):
+        """Fallback of judge_waiting_event: the example answer of the prompt"""
+        if DEFAULT_WAITING_ACTIVITY in self.activity_names:
+            return DEFAULT_WAITING_ACTIVITY
+        return self.activity_names[0]
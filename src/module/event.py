@@ -1,13 +1,26 @@
 import json
 import os.path
+import pickle
 import random
 from collections import deque
 from src import utils
-import pandas as pd
+from src.activity_catalog import ActivityCatalog
+from src.path_cache import PathCache
+from src.profiler import Profiler
+from src.random_timeline import MINUTES_PER_DAY, RandomTimeline
+from src.record_store import EventRecordStore, RecordStore, build_vocabularies
+from src.schedule_parser import ScheduleError
+import numpy as np
+
+# index of the first simulated day, day % 7 == 5 is a Saturday
+FIRST_DAY = 5
 
 
 class Event:
-    def __init__(self, agent, activity_config, env_config, map_matrix):
+    def __init__(self, agent, activity_config, env_config, map_matrix, seed=None, save_dir=None, path_cache=None,
+                 sensor_index=None, sink=None, vocabularies=None, checkpoint_path=None, checkpoint_every="activity",
+                 random_model="legacy", profiler=None, catalog=None, stream_schedules=False,
+                 prefetch_schedules=False):
         """
         agent: user
         activity_config: details of activities
@@ -18,47 +31,175 @@ class Event:
         event_sequence: the sequence todo
         current_activity: the activity being done
         current_event: the event being done
+        seed: seed of this household's random generator, also names its record directory
+        save_dir: directory of the daily records, defaults to record/<user_name>/<seed>/
+        path_cache: precomputed PathCache of the map, can be shared between households
+        sensor_index: precomputed utils.build_sensor_index table, can be shared between households
+        sink: optional RecordSink, records are streamed to it as they are produced instead of kept per day
+        vocabularies: record_store.build_vocabularies of the configs, record and event_record keep codes into them
+        checkpoint_path: pickle the full simulation state there, see save_checkpoint / load_checkpoint
+        checkpoint_every: "activity" or "day"
+        random_model: "legacy" draws toilet / phone at every interruptible event,
+                      "timeline" pre-samples each day's events on a minute grid (src.random_timeline)
+        profiler: src.profiler.Profiler timing the hot phases, its report is written at the end of the run
+        catalog: compiled ActivityCatalog of activity_config, can be shared between households
+        stream_schedules: stream daily and follow-up schedules, the first activities are simulated
+                          while the rest of the answer is still being generated
+        prefetch_schedules: request the daily schedule of the next day while the current day is simulated
         """
         self.agent = agent
         self.activity_config = activity_config
+        self.catalog = catalog or ActivityCatalog(activity_config, env_config)
         self.env_config = env_config
         self.map_matrix = map_matrix
-        self.record = []
-        self.event_record = []
+        self.path_cache = path_cache or PathCache(env_config, map_matrix)
+        self.sensor_index = sensor_index or utils.build_sensor_index(env_config, map_matrix)
+        self.vocabularies = vocabularies or build_vocabularies(env_config, activity_config)
+        self.record = RecordStore(self.vocabularies)
+        self.event_record = EventRecordStore(self.vocabularies)
         self.position_now = None
         self.activity_now = None
         self.todo_schedule = deque([])
         self.done_schedule = deque([])
-        self.current_day = 5
+        self.current_day = FIRST_DAY
         self.phone_happened = 0
-        self.random_num = random.randint(1, 100)
+        self.rng = random.Random(seed)
+        self.random_model = random_model
+        self.np_rng = np.random.default_rng(seed)
+        self.timeline = None
+        self.profiler = profiler or Profiler()
+        self.random_num = seed if seed is not None else random.randint(1, 100)
+        # random_num of an unseeded run differs between reruns, its cache keys are only scoped by the user
+        self.agent.cache_scope = [self.agent.user_config["user_name"]] + ([seed] if seed is not None else [])
+        self.save_dir = save_dir
+        self.sink = sink
+        self.record_day = self.current_day
+        self.day_in_progress = False
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        # raw daily schedule responses generated ahead of the run (offline_batch), keyed by day
+        self.planned_schedules = {}
+        self.stream_schedules = stream_schedules
+        # agent.ScheduleStream feeding todo_schedule while it is still being generated
+        self.schedule_stream = None
+        self.prefetch_schedules = prefetch_schedules
+        # agent.SchedulePrefetch of the next day, only used if that day starts with the weekday it was asked for
+        self.schedule_prefetch = None
 
     def reset_state(self):
         self.todo_schedule = deque([])
         self.done_schedule = deque([])
-        self.record = []
-        self.event_record = []
+        self.record = RecordStore(self.vocabularies)
+        self.event_record = EventRecordStore(self.vocabularies)
         self.agent.weekday = utils.get_weekday(self.current_day)
         self.phone_happened = 0
+        self.record_day = self.current_day
+        self.agent.usage.set_day(self.current_day)
         if self.position_now is None:
             bed = self.env_config["environment_config"]["Facility"]["BedroomBed"]
             self.position_now = bed['x'], bed['y']
 
     # 工作流模块
     def run_workflow(self, total_days):
-        """workflow"""
+        """workflow, every agent decision is a blocking call"""
+        return self.drive(self.workflow(total_days))
+
+    async def arun_workflow(self, total_days):
+        """workflow, yields to the event loop at every agent decision"""
+        return await self.adrive(self.workflow(total_days))
+
+    def workflow(self, total_days):
+        """
+        Step generator of the workflow.
+        Every agent decision is yielded as (method_name, args) and resumed with its result,
+        drive / adrive answer them with the blocking / async methods of the agent.
+        """
         while self.current_day <= total_days:
-            print(f"----- Day {self.current_day} -----")
-            # 1.Reset State
-            self.reset_state()
-            # 2.Generate daily_schedule
-            self.todo_schedule = deque(self.agent.generate_daily_schedule())
+            # a day restored from a checkpoint continues with its remaining schedule
+            if not self.day_in_progress:
+                print(f"----- Day {self.current_day} -----")
+                # 1.Reset State
+                self.reset_state()
+                # 2.Generate daily_schedule, unless it was generated ahead of the run
+                planned = self.planned_schedules.pop(self.current_day, None)
+                schedule = None
+                if planned is not None:
+                    try:
+                        schedule = self.agent.parse_daily_schedule(planned)
+                    except ScheduleError as e:
+                        print(f"Planned schedule of day {self.current_day} is unusable: {e}")
+                if schedule is None:
+                    schedule = yield from self.take_prefetched_schedule()
+                if schedule is None and self.stream_schedules:
+                    self.schedule_stream = yield "stream_daily_schedule", ()
+                    schedule = []
+                elif schedule is None:
+                    schedule = yield "generate_daily_schedule", ()
+                self.todo_schedule = deque(schedule)
+                if self.prefetch_schedules and self.current_day < total_days \
+                        and self.current_day + 1 not in self.planned_schedules:
+                    self.schedule_prefetch = yield "prefetch_daily_schedule", (self.current_day + 1,)
+                if self.random_model == "timeline":
+                    # the timeline is sampled over the whole day
+                    yield from self.finish_schedule_stream()
+                    self.sample_timeline()
+                self.day_in_progress = True
+                self.save_checkpoint("activity")
             # 3.execute activity step by step
-            self.execute_schedule()
+            yield from self.execute_schedule()
             # 4.save daily_record
             self.save_record(self.current_day - 1)
+            self.day_in_progress = False
+            self.save_checkpoint("day")
+        if self.sink is not None:
+            self.sink.close()
+        if self.profiler.enabled:
+            self.profiler.save(self.get_save_path(), labels={"user": self.agent.user_config["user_name"],
+                                                             "seed": self.random_num})
         print("所有日期execution结束")
 
+    def take_prefetched_schedule(self):
+        """
+        The schedule prefetched for the day starting now, None if there is none or it is not valid here:
+        a day that ended before midnight starts again with the same day index, a checkpoint restores another day
+        """
+        prefetch, self.schedule_prefetch = self.schedule_prefetch, None
+        if prefetch is None:
+            return None
+        if not prefetch.matches(self.current_day, self.agent.weekday):
+            # the request still completes in its thread, its answer is dropped
+            print(f"Discarding the schedule prefetched for day {prefetch.day} ({prefetch.weekday})")
+            return None
+        return (yield "collect_daily_schedule", (prefetch,))
+
+    def drive(self, steps, decisions=None):
+        """
+        Run a step generator, answering each agent request with a blocking call
+        decisions: object answering the requests instead of the agent, e.g. amplify.LocalDecisions
+        """
+        decisions = decisions or self.agent
+        try:
+            method, args = next(steps)
+            while True:
+                self.profiler.count("agent_calls", self.record_day)
+                with self.profiler.phase("agent." + method):
+                    result = getattr(decisions, method)(*args)
+                method, args = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+
+    async def adrive(self, steps):
+        """Run a step generator, awaiting the async variant ("a" + method) of each agent request"""
+        try:
+            method, args = next(steps)
+            while True:
+                self.profiler.count("agent_calls", self.record_day)
+                with self.profiler.phase("agent." + method):
+                    result = await getattr(self.agent, "a" + method)(*args)
+                method, args = steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+
     # execution module
     def execute_schedule(self):
         """
@@ -66,7 +207,11 @@ class Event:
         execute events until the executable event_sequence is empty
         """
         print(f"今日安排: {self.todo_schedule}")
-        while self.todo_schedule:
+        while True:
+            if self.schedule_stream is not None:
+                yield from self.pull_schedule_stream(wait=not self.todo_schedule)
+            if not self.todo_schedule:
+                break
             # 1. If subsequent schedule is not empty, get the next activity
             activity_todo = self.todo_schedule.popleft()
             self.activity_now = activity_todo
@@ -86,19 +231,46 @@ class Event:
 
             # 3. Convert the next activity into executable event_sequence and execute
             event_list = self.activity2event_list(current_activity, activity_name, duration)
-            self.handle_event_list(event_list, activity_name)
+            yield from self.handle_event_list(event_list, activity_name)
 
             # 4. Trigger possible random activities after event_sequence ends
-            self.trigger_random_activity()
+            if self.timeline is None:
+                self.trigger_random_activity()
 
             self.activity_now["end_time"] = utils.int_time2str_time(self.agent.time)
             self.done_schedule.append(self.activity_now)
 
             # 5. After current activity ends, determine whether to update schedule based on planned time and current time
             time_diff = utils.str_time2int_time(end_time) - self.agent.time
-            if abs(time_diff) > 60 and len(self.todo_schedule) > 1:
-                self.todo_schedule = deque(
-                    self.agent.generate_follow_up_schedule(self.todo_schedule, self.done_schedule))
+            if abs(time_diff) > 60:
+                yield from self.finish_schedule_stream()
+                if len(self.todo_schedule) > 1:
+                    if self.stream_schedules:
+                        self.schedule_stream = yield "stream_follow_up_schedule", (self.todo_schedule,
+                                                                                    self.done_schedule)
+                        self.todo_schedule = deque()
+                    else:
+                        schedule = yield "generate_follow_up_schedule", (self.todo_schedule, self.done_schedule)
+                        self.todo_schedule = deque(schedule)
+                    yield from self.resample_timeline()
+
+            self.save_checkpoint("activity")
+
+    def pull_schedule_stream(self, wait):
+        """Move the entries streamed so far to todo_schedule, if wait at least one unless the answer is complete"""
+        entries = self.schedule_stream.ready()
+        if not entries and wait:
+            entries = yield "next_schedule_entries", (self.schedule_stream,)
+        self.todo_schedule.extend(entries)
+        if self.schedule_stream.exhausted:
+            self.schedule_stream = None
+
+    def finish_schedule_stream(self):
+        """Complete todo_schedule before anything reads it as a whole: prompts, the timeline, checkpoints"""
+        if self.schedule_stream is not None:
+            entries = yield "finish_schedule", (self.schedule_stream,)
+            self.todo_schedule.extend(entries)
+            self.schedule_stream = None
 
     def activity2event_list(self, activity, activity_name, duration=1):
         """Convert the activity into corresponding executable event_sequence and return it"""
@@ -109,30 +281,29 @@ class Event:
             "execution": duration
         }
 
-        activity = activity["event_sequence"]
         if activity_name != 'Cooking':
-            event_input_list = activity["normal"]
+            templates = activity.variant("normal")
         else:
-            rand = random.random()
+            rand = self.rng.random()
             prob_params = self.agent.user_config["Parameter"]
             cook_prob = prob_params["Cooking"]["Probability"]
             prob1 = cook_prob["Heating"]
             prob2 = cook_prob["Stewing"]
             if rand < prob1:
-                event_input_list = activity["Heating"]
+                templates = activity.variant("Heating")
             elif rand < (prob1 + prob2):
-                event_input_list = activity["Stewing"]
+                templates = activity.variant("Stewing")
             else:
-                event_input_list = activity["Stir-frying"]
-
-        for event_input in event_input_list:
-            event_attribute = event_input.get("attribute")
-            duration_attribute = event_input.get("Generate")
-            if event_attribute in duration_mapping:
-                if duration_attribute == "random":
-                    event_input["duration"] = random.randint(3, 10)
+                templates = activity.variant("Stir-frying")
+
+        # fresh event dicts from the immutable templates, the config keys first as before
+        for template in templates:
+            event_input = dict(template.fields)
+            if template.attribute in duration_mapping:
+                if template.generate == "random":
+                    event_input["duration"] = self.rng.randint(3, 10)
                 else:
-                    event_input["duration"] = duration_mapping[event_attribute]
+                    event_input["duration"] = duration_mapping[template.attribute]
             event_input["activity_name"] = activity_name
             event_list.append(event_input)
         return event_list
@@ -141,11 +312,11 @@ class Event:
         """handle executable event_sequence"""
         event_list = deque(event_list)
         while event_list:
-            event_todo = event_list.popleft().copy()
+            event_todo = event_list.popleft()
             event_state = event_todo.get("attribute")
             event_todo["activity_name"] = activity_name
             event_todo["start_time"] = utils.int_time2str_time(self.agent.time)
-            self.event_record.append(event_todo)
+            self.add_event_record(event_todo)
 
             # execute different event
             if event_state.startswith("Movement"):
@@ -153,7 +324,7 @@ class Event:
             elif event_state.startswith("control"):
                 self.execute_control(event_todo)
             elif event_state.startswith("execution"):
-                self.handle_execution_event(event_todo)
+                yield from self.handle_execution_event(event_todo)
 
     def execute_movement(self, event_todo):
         """
@@ -162,41 +333,28 @@ class Event:
         position_from = self.position_now
         destination_to = event_todo["target"]
         if event_todo["state"] == "area":
-            area_to = self.env_config["environment_config"]["valid_area"][destination_to]["Scope"]
-            path = utils.move_to_area(position_from=position_from, area_to=area_to, map_matrix=self.map_matrix)
+            with self.profiler.phase("pathfinding"):
+                path = self.path_cache.move_to_area(position_from=position_from, area_name=destination_to)
             activity_name = ''
             self.area_now = destination_to
         elif event_todo["state"] == "position":
-            env_config = self.env_config["environment_config"]
-            position_to = (env_config["Facility"].get(destination_to) or
-                           env_config["control_device"].get(destination_to))
-            position_to = position_to['x'], position_to['y']
-            path = utils.move_to_position(position_from=position_from, position_to=position_to,
-                                          map_matrix=self.map_matrix)
+            position_to = self.catalog.position(destination_to)
+            with self.profiler.phase("pathfinding"):
+                path = self.path_cache.move_to_position(position_from=position_from, position_to=position_to)
             activity_name = event_todo["activity_name"]
             self.pos_now = destination_to
         else:
             path = []
             activity_name = ''
         if path:
-            for destination in path:
-                for sensor_name, sensor in self.env_config["environment_config"]["sensor"].items():
-                    destination_x = destination[0]
-                    destination_y = destination[1]
-                    sensor_x = sensor["x"]
-                    sensor_y = sensor["y"]
-                    if abs(destination_x - sensor_x) <= 1 and abs(destination_y - sensor_y) <= 1:
-                        # print(f"触发{sensor_name}")
-                        record_i = {
-                            "Day": self.agent.weekday,
-                            "Hour": utils.int_time2str_time(self.agent.time),
-                            "sensor_type": sensor_name,
-                            "sensor_state": 'ON',
-                            "device_type": '',
-                            'device_state': '',
-                            'activity': activity_name
-                        }
-                        self.record.append(record_i)
+            # every cell of the path fires the sensors listed for it in the sensor index
+            weekday = self.agent.weekday
+            minute = self.agent.time
+            sensor_index = self.sensor_index
+            with self.profiler.phase("sensor_scan"):
+                for destination_x, destination_y in path:
+                    for sensor_name in sensor_index[destination_x][destination_y]:
+                        self.add_record(weekday, minute, sensor_name, 'ON', '', '', activity_name)
             self.position_now = path[-1]
             self.update_time(event_todo["duration"])
 
@@ -206,16 +364,8 @@ class Event:
         """
         device_type = event_todo["target"]
         device_state = event_todo["state"]
-        record_i = {
-            "Day": self.agent.weekday,
-            "Hour": utils.int_time2str_time(self.agent.time),
-            "sensor_type": '',
-            "sensor_state": '',
-            "device_type": device_type,
-            'device_state': device_state,
-            'activity': event_todo["activity_name"]
-        }
-        self.record.append(record_i)
+        self.add_record(self.agent.weekday, self.agent.time, '', '', device_type, device_state,
+                        event_todo["activity_name"])
         self.update_time(event_todo["duration"])
 
     def handle_execution_event(self, event_todo):
@@ -230,16 +380,20 @@ class Event:
         area_now = self.area_now
         pos_now = self.pos_now
         if event_state == "waiting" or event_state == 'doing':
-            flag, random_activity = self.trigger_random_activity()
+            if self.timeline is not None:
+                flag, random_activity, split_duration = self.timeline_random_activity(duration)
+            else:
+                flag, random_activity = self.trigger_random_activity()
+                split_duration = self.rng.randint(0, duration) if flag else 0
             if flag:
-                split_duration = random.randint(0, duration)
                 duration = duration - split_duration
                 self.update_time(split_duration)
-                self.handle_random_activity(random_activity)
+                yield from self.handle_random_activity(random_activity)
             if not flag and event_state == "waiting":
-                waiting_activity = self.agent.judge_waiting_event(self.todo_schedule, self.done_schedule,
-                                                                  self.activity_now, event_todo)
-                self.handle_waiting_activity(waiting_activity, event_todo["duration"])
+                yield from self.finish_schedule_stream()
+                waiting_activity = yield "judge_waiting_event", (self.todo_schedule, self.done_schedule,
+                                                                 self.activity_now, event_todo)
+                yield from self.handle_waiting_activity(waiting_activity, event_todo["duration"])
                 duration = duration - event_todo["duration"]
         self.execute_movement(
             {"state": "area", "target": area_now, "activity_name": event_todo["activity_name"], "duration": 1})
@@ -267,7 +421,7 @@ class Event:
         toilet_prob = toilet_prob["Sleeping"] if self.activity_now["activity_name"] == "Sleeping" else toilet_prob["Daytime"]
         toilet_prob = utils.adjust_toilet_prob(toilet_prob, abs(self.agent.time - self.agent.last_toilet_time) / 60)
         # Randomly determine and execute activities
-        rand = random.random()
+        rand = self.rng.random()
         total_toilet = toilet_prob
         total_phone = total_toilet + phone_prob
         if rand < total_toilet:
@@ -280,12 +434,60 @@ class Event:
             return True, activity
         return False, ''
 
+    def sample_timeline(self, until=None):
+        """
+        Pre-sample the toilet / phone events from now on, see src.random_timeline
+        until: absolute minute the timeline has to reach at least
+        """
+        if self.agent.time == "":
+            start_minute = utils.str_time2int_time(self.todo_schedule[0]["start_time"])
+            elapsed_toilet = 0
+        else:
+            start_minute = self.agent.time
+            elapsed_toilet = (self.agent.time - self.agent.last_toilet_time) % MINUTES_PER_DAY
+        length = 2 * MINUTES_PER_DAY
+        if until is not None:
+            length = max(length, until - (self.current_day * MINUTES_PER_DAY + start_minute) + MINUTES_PER_DAY)
+        # the Sleeping entries of the plan as it stands now select the Sleeping toilet probability
+        self.timeline = RandomTimeline.sample(self.agent.user_config["Parameter"], self.current_day, start_minute,
+                                              list(self.done_schedule) + list(self.todo_schedule), elapsed_toilet,
+                                              self.np_rng, length)
+
+    def continue_timeline(self, until=None):
+        """
+        Sample the timeline again from now on, for a replaced todo_schedule or past its horizon.
+        Events already due but not consumed yet are kept, only the future is drawn again.
+        """
+        previous = self.timeline
+        self.sample_timeline(until)
+        self.timeline.keep_pending(previous)
+
+    def resample_timeline(self):
+        """todo_schedule was replaced: its Sleeping entries apply from now on"""
+        if self.timeline is not None:
+            yield from self.finish_schedule_stream()
+            self.continue_timeline()
+
+    def timeline_random_activity(self, duration):
+        """
+        Timeline variant of trigger_random_activity for an interruptible event of duration minutes:
+        returns (flag, activity type, minutes into the event at which it happens)
+        """
+        now = self.current_day * MINUTES_PER_DAY + self.agent.time
+        if now + duration > self.timeline.end:
+            # a day running past the sampled horizon
+            self.continue_timeline(now + duration)
+        minute, activity = self.timeline.next_event(now, now + duration, phone_allowed=self.phone_happened == 0)
+        if activity is None:
+            return False, '', 0
+        return True, activity, minute - now
+
     def handle_random_activity(self, activity_type):
         """handle_random_activity"""
         if activity_type == "toilet_activity":
-            self.handle_toilet_activity()
+            yield from self.handle_toilet_activity()
         elif activity_type == "phone_activity":
-            self.handle_phone_activity()
+            yield from self.handle_phone_activity()
         else:
             raise Exception(f"execution random activity error: {activity_type}")
 
@@ -295,7 +497,7 @@ class Event:
         activity_name = "Toilet"
         current_activity = self.find_activity(activity_name)
         event_list = self.activity2event_list(current_activity, activity_name)
-        self.handle_event_list(event_list, activity_name)
+        yield from self.handle_event_list(event_list, activity_name)
         self.agent.last_toilet_time = self.agent.time
         return
 
@@ -306,15 +508,17 @@ class Event:
         activity_name = "Phone"
         current_activity = self.find_activity(activity_name)
         event_list = self.activity2event_list(current_activity, activity_name)
-        self.handle_event_list(event_list, activity_name)
+        yield from self.handle_event_list(event_list, activity_name)
         # 2.Whether to update the schedule based on the decision
         step_out_prob = utils.adjust_step_out_prob(self.agent.time / 60)
-        rand = random.random()
+        rand = self.rng.random()
         if rand <= step_out_prob:
             self.phone_happened = 1
-            result = self.agent.judge_phone_event(self.todo_schedule, self.done_schedule)
+            yield from self.finish_schedule_stream()
+            result = yield "judge_phone_event", (self.todo_schedule, self.done_schedule)
             print("Update Schedule")
             self.todo_schedule = deque(result)
+            yield from self.resample_timeline()
         return
 
     def handle_waiting_activity(self, waiting_activity_name, duration):
@@ -329,24 +533,92 @@ class Event:
         }
         current_activity = self.find_activity(waiting_activity_name)
         event_list = self.activity2event_list(current_activity, waiting_activity_name, duration)
-        self.handle_event_list(event_list, waiting_activity_name)
+        yield from self.handle_event_list(event_list, waiting_activity_name)
         waiting_activity["end_time"] = utils.int_time2str_time(self.agent.time)
         self.done_schedule.append(waiting_activity)
         self.activity_now["start_time"] = utils.int_time2str_time(self.agent.time)
         return
 
     def find_activity(self, activity_name):
-        current_activity = ''
-        activity_list = self.activity_config.get("activity_config", [])
-        for activity in activity_list:
-            current_name = activity.get("activity_name")
-            if current_name == activity_name:
-                current_activity = activity
-                break
-        if current_activity == '':
+        current_activity = self.catalog.get(activity_name)
+        if current_activity is None:
             raise Exception(f"cant find activity {activity_name}")
         return current_activity
 
+    def save_checkpoint(self, granularity):
+        """
+        Pickle everything needed to continue the run: schedules, position, clock, day, toilet/phone state,
+        random generator state and the records of the current day (or the sink offsets).
+        Checkpoints are taken between activities, where no event_sequence is pending,
+        and not while a streamed schedule is incomplete.
+        """
+        if self.checkpoint_path is None or (granularity == "activity" and self.checkpoint_every == "day"):
+            return
+        if self.schedule_stream is not None:
+            return
+        state = {
+            "todo_schedule": self.todo_schedule,
+            "done_schedule": self.done_schedule,
+            "activity_now": self.activity_now,
+            "position_now": self.position_now,
+            "area_now": getattr(self, "area_now", None),
+            "pos_now": getattr(self, "pos_now", None),
+            "current_day": self.current_day,
+            "record_day": self.record_day,
+            "day_in_progress": self.day_in_progress,
+            "phone_happened": self.phone_happened,
+            "rng_state": self.rng.getstate(),
+            "np_rng": self.np_rng,
+            "timeline": self.timeline,
+            "agent_time": self.agent.time,
+            "agent_weekday": self.agent.weekday,
+            "agent_last_toilet_time": getattr(self.agent, "last_toilet_time", None),
+            "agent_usage": self.agent.usage,
+            "agent_call_counts": self.agent.call_counts,
+            "vocabularies": self.vocabularies,
+            "record": self.record,
+            "event_record": self.event_record,
+            "sink_offsets": self.sink.checkpoint() if self.sink is not None else None
+        }
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def load_checkpoint(self, checkpoint_path=None):
+        """Restore the state of save_checkpoint, run_workflow then continues where the checkpoint was taken"""
+        checkpoint_path = checkpoint_path or self.checkpoint_path
+        with open(checkpoint_path, 'rb') as file:
+            state = pickle.load(file)
+        self.todo_schedule = state["todo_schedule"]
+        self.done_schedule = state["done_schedule"]
+        self.activity_now = state["activity_now"]
+        self.position_now = state["position_now"]
+        if state["area_now"] is not None:
+            self.area_now = state["area_now"]
+        if state["pos_now"] is not None:
+            self.pos_now = state["pos_now"]
+        self.current_day = state["current_day"]
+        self.schedule_prefetch = None
+        self.record_day = state["record_day"]
+        self.day_in_progress = state["day_in_progress"]
+        self.phone_happened = state["phone_happened"]
+        self.rng.setstate(state["rng_state"])
+        self.np_rng = state["np_rng"]
+        self.timeline = state["timeline"]
+        self.agent.time = state["agent_time"]
+        self.agent.weekday = state["agent_weekday"]
+        if state["agent_last_toilet_time"] is not None:
+            self.agent.last_toilet_time = state["agent_last_toilet_time"]
+        self.agent.usage = state["agent_usage"]
+        self.agent.call_counts = state.get("agent_call_counts", {})
+        self.vocabularies = state["vocabularies"]
+        self.record = state["record"]
+        self.event_record = state["event_record"]
+        if self.sink is not None:
+            self.sink.truncate(state["sink_offsets"])
+
     def update_time(self, duration):
         old_time = self.agent.time
         self.agent.time = (self.agent.time + duration) % (24 * 60)
@@ -354,14 +626,55 @@ class Event:
             self.current_day += 1
             self.agent.weekday = utils.get_weekday(self.current_day)
 
+    def add_record(self, weekday, minute, sensor_type, sensor_state, device_type, device_state, activity):
+        self.profiler.count("records", self.record_day)
+        if self.sink is not None:
+            record_i = {
+                "Day": weekday,
+                "Hour": utils.int_time2str_time(minute),
+                "sensor_type": sensor_type,
+                "sensor_state": sensor_state,
+                "device_type": device_type,
+                'device_state': device_state,
+                'activity': activity
+            }
+            self.sink.write("record", self.record_day, record_i)
+        else:
+            self.record.append_row(weekday, minute, sensor_type, sensor_state, device_type, device_state, activity)
+
+    def add_event_record(self, event_todo):
+        self.profiler.count("events", self.record_day)
+        if self.sink is not None:
+            self.sink.write("event_record", self.record_day, event_todo)
+        else:
+            self.event_record.append(event_todo)
+
+    def get_save_path(self):
+        save_path = self.save_dir or f"record/{self.agent.user_config['user_name']}/{self.random_num}/"
+        return os.path.join(save_path, "")
+
     def save_record(self, current_day):
-        save_path = f"record/{self.agent.user_config['user_name']}/{self.random_num}/"
-        if not os.path.exists(save_path):
-            os.makedirs(save_path)
+        with self.profiler.phase("save_record"):
+            self.write_record(current_day)
+
+    def write_record(self, current_day):
+        save_path = self.get_save_path()
+        os.makedirs(save_path, exist_ok=True)
+        # LLM tokens and latency per day and for the run so far
+        self.agent.usage.save(save_path + "usage.json")
+        if self.sink is not None:
+            # record and event_record are already streamed, done_schedule is kept for the prompts until now
+            for activity in self.done_schedule:
+                self.sink.write("done_schedule", self.record_day, activity)
+            self.sink.end_day(self.record_day)
+            return
+        # pandas is only needed for the daily csv files, imported on first use
+        import pandas as pd
         done_schedule = pd.DataFrame(list(self.done_schedule))
         done_schedule.to_csv(save_path + f"done_schedule_day{current_day}.csv", index=False,
                              encoding='utf-8-sig')
-        record = pd.DataFrame(list(self.record))
+        # decode the compact stores only here
+        record = pd.DataFrame(self.record.columns() if len(self.record) else [])
         record.to_csv(save_path + f"record_day{current_day}.csv", index=False,
                       encoding='utf-8-sig')
         event_record = pd.DataFrame(list(self.event_record))
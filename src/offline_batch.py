@@ -0,0 +1,132 @@
+import argparse
+import json
+import time
+
+from src import backend, chat, utils
+from src.batch import build_jobs
+from src.module import agent
+from src.module.event import FIRST_DAY
+from src.simulation import load_inputs
+
+
+def make_custom_id(user_name, seed, day):
+    return f"{user_name}/{seed}/day{day}"
+
+
+def parse_custom_id(custom_id):
+    user_name, seed, day = custom_id.rsplit("/", 2)
+    return user_name, int(seed), int(day[len("day"):])
+
+
+def export_requests(jobs, request_path, inputs=None, model="deepseek-chat"):
+    """
+    Render the first prompt of every simulated day of every job into a batch request file.
+    The daily schedule prompt only depends on profile and weekday, so it is known before the run.
+    Lines follow the OpenAI batch input format: custom_id, method, url, body.
+    """
+    inputs = inputs or load_inputs()
+    count = 0
+    with open(request_path, 'w', encoding='utf-8') as file:
+        for job in jobs:
+            user_config = dict(inputs["user_profile"]["user_config"][job["user_name"]], user_name=job["user_name"])
+            user = agent.SmartAgent(user_config, inputs["activity_str"], inputs["prompt_dict"])
+            for day in range(FIRST_DAY, job["total_days"] + 1):
+                user.weekday = utils.get_weekday(day)
+                request = {
+                    "custom_id": make_custom_id(job["user_name"], job["seed"], day),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": model,
+                        "messages": [
+                            {"role": "system", "content": chat.SYSTEM_PROMPT},
+                            {"role": "user", "content": user.daily_schedule_prompt()},
+                        ]
+                    }
+                }
+                file.write(json.dumps(request, ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+
+def run_requests(request_path, result_path, llm_backend):
+    """Local stand-in for a provider batch endpoint: answer every request and write batch output lines"""
+    count = 0
+    with open(request_path, 'r', encoding='utf-8') as requests, \
+            open(result_path, 'w', encoding='utf-8') as results:
+        for line in requests:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            result = {"id": f"batch_req_{count}", "custom_id": request["custom_id"], "error": None}
+            try:
+                content = llm_backend.complete(request["body"]["messages"])
+                result["response"] = {
+                    "status_code": 200,
+                    "body": {
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request["body"].get("model", llm_backend.model),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop"
+                        }]
+                    }
+                }
+            except Exception as e:
+                result["response"] = None
+                result["error"] = {"message": str(e)}
+            results.write(json.dumps(result, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def ingest_results(result_path):
+    """
+    Read batch output lines into {(user_name, seed): {day: schedule response}}.
+    Failed requests are left out, those days fall back to a live call during the run.
+    """
+    planned = {}
+    with open(result_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response")
+            if result.get("error") or not response or response.get("status_code") != 200:
+                continue
+            user_name, seed, day = parse_custom_id(result["custom_id"])
+            content = response["body"]["choices"][0]["message"]["content"]
+            planned.setdefault((user_name, seed), {})[day] = content
+    return planned
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="two-phase generation: export daily schedule prompts, "
+                                                 "answer them in batch, run the simulation with --planned")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="write the batch request file of a job matrix")
+    export_parser.add_argument("--users", nargs="+", default=["OldMan", "RemoteWorker", "HolidayMaker"])
+    export_parser.add_argument("--seeds", nargs="+", type=int, default=[1])
+    export_parser.add_argument("--days", nargs="+", type=int, default=[14])
+    export_parser.add_argument("--jobs", help="JSON file with a list of {user_name, seed, total_days} jobs")
+    export_parser.add_argument("--model", default="deepseek-chat")
+    export_parser.add_argument("--output", default="batch_requests.jsonl")
+    run_parser = subparsers.add_parser("run", help="answer a request file locally")
+    run_parser.add_argument("requests")
+    run_parser.add_argument("--output", default="batch_results.jsonl")
+    run_parser.add_argument("--offline", action="store_true", help="use the offline stand-in instead of the LLM")
+    run_parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        if args.jobs:
+            with open(args.jobs, 'r', encoding='utf-8') as job_file:
+                batch_jobs = json.load(job_file)
+        else:
+            batch_jobs = build_jobs(args.users, args.seeds, args.days)
+        print(f"{export_requests(batch_jobs, args.output, model=args.model)} requests written to {args.output}")
+    else:
+        llm = backend.make_backend("offline" if args.offline else "openai", latency=args.latency)
+        print(f"{run_requests(args.requests, args.output, llm)} results written to {args.output}")
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+from collections import deque
+
+import numpy as np
+
+from src import utils
+
+DIRECTIONS = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+
+
+def config_hash(env_config):
+    payload = json.dumps(env_config, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def distance_field(sources, map_matrix):
+    """
+    Multi-source BFS from the target cells over the passable cells of the map.
+    Returns the flat (x * cols + y) distance list, -1 marks unreachable or blocked cells.
+    """
+    rows = len(map_matrix)
+    cols = len(map_matrix[0]) if rows > 0 else 0
+    distance = [-1] * (rows * cols)
+    queue = deque()
+    for x, y in sources:
+        if 0 <= x < rows and 0 <= y < cols and map_matrix[x][y] != -1 and distance[x * cols + y] == -1:
+            distance[x * cols + y] = 0
+            queue.append((x, y))
+    while queue:
+        x, y = queue.popleft()
+        next_distance = distance[x * cols + y] + 1
+        for dx, dy in DIRECTIONS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < rows and 0 <= ny < cols and map_matrix[nx][ny] != -1 and distance[nx * cols + ny] == -1:
+                distance[nx * cols + ny] = next_distance
+                queue.append((nx, ny))
+    return distance
+
+
+def next_step_field(distance, rows, cols):
+    """For every cell the flat index of its first neighbor (in DIRECTIONS order) one step closer to the target"""
+    next_step = [-1] * (rows * cols)
+    for index, cell_distance in enumerate(distance):
+        if cell_distance <= 0:
+            continue
+        x, y = divmod(index, cols)
+        for dx, dy in DIRECTIONS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < rows and 0 <= ny < cols and distance[nx * cols + ny] == cell_distance - 1:
+                next_step[index] = nx * cols + ny
+                break
+    return next_step
+
+
+def distance_field_array(source_mask, map_array):
+    """
+    distance_field for a numpy map, sources given as a boolean grid.
+    The BFS advances a whole wavefront per step with shifted boolean masks.
+    Returns a distance grid, -1 marks unreachable or blocked cells.
+    """
+    passable = utils.passable_mask(map_array)
+    rows, cols = passable.shape
+    frontier = source_mask & passable
+    distance = np.full((rows, cols), -1, dtype=np.int32)
+    distance[frontier] = 0
+    visited = frontier.copy()
+    step = 0
+    while frontier.any():
+        step += 1
+        grown = np.zeros_like(frontier)
+        grown[1:, :] |= frontier[:-1, :]
+        grown[:-1, :] |= frontier[1:, :]
+        grown[:, 1:] |= frontier[:, :-1]
+        grown[:, :-1] |= frontier[:, 1:]
+        frontier = grown & passable & ~visited
+        distance[frontier] = step
+        visited |= frontier
+    return distance
+
+
+def next_step_field_array(distance):
+    """next_step_field for a distance grid, same DIRECTIONS tie-break, returned as a flat array"""
+    rows, cols = distance.shape
+    padded = np.full((rows + 2, cols + 2), -2, dtype=distance.dtype)
+    padded[1:-1, 1:-1] = distance
+    index = np.arange(rows * cols).reshape(rows, cols)
+    next_step = np.full((rows, cols), -1, dtype=np.int32)
+    for dx, dy in DIRECTIONS:
+        neighbor = padded[1 + dx:1 + dx + rows, 1 + dy:1 + dy + cols]
+        mask = (distance > 0) & (neighbor == distance - 1) & (next_step == -1)
+        next_step[mask] = index[mask] + dx * cols + dy
+    return next_step.ravel()
+
+
+class PathCache:
+    def __init__(self, env_config, map_matrix, cache_dir=None):
+        """
+        Shortest-path fields towards every fixed target of the layout:
+        each Facility and control_device position and each valid_area.
+        The fields are computed once at map load, path queries then follow precomputed steps.
+        map_matrix: list of lists, or the numpy grid of utils.map_array_initialization
+                    for a vectorized BFS and int32 array fields
+        cache_dir: optionally persist the fields there (.npz), keyed by the hash of env_config
+        """
+        self.env_config = env_config
+        self.map_matrix = map_matrix
+        self.rows = len(map_matrix)
+        self.cols = len(map_matrix[0]) if self.rows > 0 else 0
+        self.fields = None
+        self.config_key = config_hash(env_config)
+        cache_path = os.path.join(cache_dir, f"path_cache_{self.config_key[:16]}.npz") if cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            self.fields = self.load(cache_path)
+        if self.fields is None:
+            self.fields = self.build_fields()
+            if cache_path:
+                self.save(cache_path)
+
+    def save(self, cache_path):
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        arrays = {"config_key": np.array(self.config_key)}
+        for key, field in self.fields.items():
+            arrays[f"{key}|distance"] = np.asarray(field["distance"], dtype=np.int32)
+            arrays[f"{key}|next_step"] = np.asarray(field["next_step"], dtype=np.int32)
+        np.savez_compressed(cache_path, **arrays)
+
+    def load(self, cache_path):
+        with np.load(cache_path) as cached:
+            if str(cached["config_key"]) != self.config_key:
+                return None
+            fields = {}
+            for name in cached.files:
+                if name == "config_key":
+                    continue
+                key, kind = name.rsplit("|", 1)
+                fields.setdefault(key, {})[kind] = cached[name]
+        return fields
+
+    @staticmethod
+    def position_key(position):
+        return f"position:{position[0]},{position[1]}"
+
+    @staticmethod
+    def area_key(area_name):
+        return f"area:{area_name}"
+
+    def build_fields(self):
+        env_config = self.env_config["environment_config"]
+        # every target as a list of (xmin, xhigh, ymin, yhigh) rectangles
+        targets = {}
+        for group in ("Facility", "control_device"):
+            for value in env_config[group].values():
+                targets[self.position_key((value['x'], value['y']))] = [(value['x'], value['x'], value['y'], value['y'])]
+        for area_name, area in env_config["valid_area"].items():
+            targets[self.area_key(area_name)] = [(scope['xmin'], scope['xhigh'], scope['ymin'], scope['yhigh'])
+                                                 for scope in area["Scope"].values()]
+        fields = {}
+        for key, rectangles in targets.items():
+            if isinstance(self.map_matrix, np.ndarray):
+                source_mask = np.zeros((self.rows, self.cols), dtype=bool)
+                for xmin, xhigh, ymin, yhigh in rectangles:
+                    source_mask[max(xmin, 0):xhigh + 1, max(ymin, 0):yhigh + 1] = True
+                distance = distance_field_array(source_mask, self.map_matrix)
+                fields[key] = {"distance": distance.ravel(), "next_step": next_step_field_array(distance)}
+            else:
+                cells = [(i, j) for xmin, xhigh, ymin, yhigh in rectangles
+                         for i in range(xmin, xhigh + 1) for j in range(ymin, yhigh + 1)]
+                distance = distance_field(cells, self.map_matrix)
+                fields[key] = {"distance": distance, "next_step": next_step_field(distance, self.rows, self.cols)}
+        return fields
+
+    def follow(self, key, position_from):
+        """Walk the precomputed steps from position_from to the target, [] if unreachable"""
+        x, y = position_from
+        if not (0 <= x < self.rows and 0 <= y < self.cols):
+            return []
+        field = self.fields[key]
+        index = x * self.cols + y
+        if field["distance"][index] == -1:
+            return []
+        next_step = field["next_step"]
+        path = [[x, y]]
+        index = int(next_step[index])
+        while index != -1:
+            path.append(list(divmod(index, self.cols)))
+            index = int(next_step[index])
+        return path
+
+    def move_to_position(self, position_from, position_to):
+        """Same contract as utils.move_to_position, falls back to a BFS for targets without a field"""
+        key = self.position_key(position_to)
+        if key not in self.fields:
+            return utils.move_to_position(position_from, position_to, self.map_matrix)
+        return self.follow(key, position_from)
+
+    def move_to_area(self, position_from, area_name):
+        """Same contract as utils.move_to_area for a valid_area name"""
+        key = self.area_key(area_name)
+        if key not in self.fields:
+            area_to = self.env_config["environment_config"]["valid_area"][area_name]["Scope"]
+            return utils.move_to_area(position_from, area_to, self.map_matrix)
+        return self.follow(key, position_from)
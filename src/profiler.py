@@ -0,0 +1,96 @@
+import contextlib
+import json
+import os
+import time
+
+# shared by every disabled profiler, entering it costs one method call
+NULL_PHASE = contextlib.nullcontext()
+
+
+class PhaseTimer:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    def __init__(self, enabled=False, prometheus=False):
+        """
+        Timers around the hot phases of a run (pathfinding, sensor scan, save_record, each agent call type)
+        and per-day counters (events, records).
+        A disabled profiler hands out NULL_PHASE and ignores counts, so it can stay in the code paths.
+        prometheus: save also writes profile.prom
+        """
+        self.enabled = enabled
+        self.prometheus = prometheus
+        self.phases = {}
+        self.days = {}
+        self.started = time.perf_counter()
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        return PhaseTimer(self, name)
+
+    def add_time(self, name, seconds):
+        totals = self.phases.get(name)
+        if totals is None:
+            totals = self.phases[name] = {"count": 0, "total": 0.0, "max": 0.0}
+        totals["count"] += 1
+        totals["total"] += seconds
+        if seconds > totals["max"]:
+            totals["max"] = seconds
+
+    def count(self, name, day, amount=1):
+        if not self.enabled:
+            return
+        day_counts = self.days.setdefault(day, {})
+        day_counts[name] = day_counts.get(name, 0) + amount
+
+    def summary(self):
+        phases = {name: dict(totals, mean=totals["total"] / totals["count"])
+                  for name, totals in sorted(self.phases.items())}
+        return {
+            "wall": time.perf_counter() - self.started,
+            "phases": phases,
+            "days": {str(day): counts for day, counts in sorted(self.days.items())}
+        }
+
+    def prometheus_text(self, labels=None):
+        """The summary in the Prometheus text exposition format"""
+        base = "".join(f',{key}="{value}"' for key, value in (labels or {}).items())
+        lines = [
+            "# TYPE smartllm_phase_seconds_total counter",
+            *(f'smartllm_phase_seconds_total{{phase="{name}"{base}}} {totals["total"]:.6f}'
+              for name, totals in sorted(self.phases.items())),
+            "# TYPE smartllm_phase_calls_total counter",
+            *(f'smartllm_phase_calls_total{{phase="{name}"{base}}} {totals["count"]}'
+              for name, totals in sorted(self.phases.items())),
+            "# TYPE smartllm_phase_max_seconds gauge",
+            *(f'smartllm_phase_max_seconds{{phase="{name}"{base}}} {totals["max"]:.6f}'
+              for name, totals in sorted(self.phases.items())),
+            "# TYPE smartllm_day_total gauge",
+            *(f'smartllm_day_total{{counter="{name}",day="{day}"{base}}} {value}'
+              for day, counts in sorted(self.days.items()) for name, value in sorted(counts.items())),
+            "# TYPE smartllm_run_seconds gauge",
+            f"smartllm_run_seconds{{{base[1:]}}} {time.perf_counter() - self.started:.6f}"
+        ]
+        return "\n".join(lines) + "\n"
+
+    def save(self, save_dir, labels=None):
+        """Write profile.json (and profile.prom) to save_dir"""
+        os.makedirs(save_dir, exist_ok=True)
+        with open(os.path.join(save_dir, "profile.json"), 'w', encoding='utf-8') as file:
+            json.dump(self.summary(), file, ensure_ascii=False, indent=2)
+        if self.prometheus:
+            with open(os.path.join(save_dir, "profile.prom"), 'w', encoding='utf-8') as file:
+                file.write(self.prometheus_text(labels))
@@ -0,0 +1,141 @@
+import numpy as np
+
+from src import utils
+
+MINUTES_PER_DAY = 24 * 60
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+
+
+def minute_hazard(hourly_prob):
+    """
+    Per-minute event probability of an hourly one.
+    The Parameter probabilities of the profiles, scaled by the time factors, are read as the probability
+    of at least one event within an hour at that rate.
+    """
+    return 1 - (1 - np.clip(hourly_prob, 0, 0.99)) ** (1 / 60)
+
+
+def toilet_factor(elapsed):
+    """utils.adjust_toilet_prob factor for an array of minutes since the last toilet"""
+    hours = np.abs(elapsed) / 60
+    return np.select([hours < 1, hours < 3, hours < 6, hours > 8], [0.5, 1, 2, 5], default=3)
+
+
+def phone_factor(minute):
+    """utils.adjust_phone_prob factor (phone_happened == 0) for an array of minutes of day"""
+    hours = (np.asarray(minute) % MINUTES_PER_DAY) / 60
+    return np.select([(6 < hours) & (hours <= 12), (12 < hours) & (hours <= 14), (14 < hours) & (hours <= 16),
+                      (16 < hours) & (hours <= 18)], [1, 0.8, 0.6, 0.2], default=0)
+
+
+def sleeping_mask(schedule, minute):
+    """For an array of minutes of day, whether a Sleeping entry of the schedule covers it"""
+    minute = np.asarray(minute) % MINUTES_PER_DAY
+    mask = np.zeros(minute.shape, dtype=bool)
+    for activity in schedule:
+        if activity["activity_name"] != "Sleeping":
+            continue
+        start = utils.str_time2int_time(activity["start_time"])
+        end = utils.str_time2int_time(activity["end_time"])
+        if start <= end:
+            mask |= (start <= minute) & (minute < end)
+        else:
+            mask |= (minute >= start) | (minute < end)
+    return mask
+
+
+def sample_toilet(base_prob, elapsed, rng):
+    """
+    Toilet visits of n sequences over a minute grid, a renewal process:
+    the hazard at minute m is minute_hazard(base_prob[:, m] * toilet_factor(m - last visit)).
+    base_prob: (n, T) hourly probability (Daytime or Sleeping of the profile)
+    elapsed: (n,) minutes since the last visit at grid minute 0
+    Each round draws the next visit of every unfinished sequence at once by inverting its cumulative hazard.
+    """
+    n, length = base_prob.shape
+    events = np.zeros((n, length), dtype=bool)
+    last = -np.asarray(elapsed, dtype=np.int64)
+    start = np.zeros(n, dtype=np.int64)
+    grid = np.arange(length)
+    active = np.arange(n)
+    while active.size:
+        hazard = minute_hazard(base_prob[active] * toilet_factor(grid[None, :] - last[active, None]))
+        hazard[grid[None, :] < start[active, None]] = 0
+        cumulative = np.cumsum(-np.log1p(-hazard), axis=1)
+        threshold = rng.exponential(size=active.size)
+        hit = cumulative >= threshold[:, None]
+        found = hit.any(axis=1)
+        minute = hit.argmax(axis=1)
+        events[active[found], minute[found]] = True
+        last[active[found]] = minute[found]
+        start[active[found]] = minute[found] + 1
+        active = active[found & (minute + 1 < length)]
+    return events
+
+
+def sample_phone(prob, rng):
+    """Phone calls of n sequences, one Bernoulli draw per minute with prob: (n, T) hourly probability"""
+    return rng.random(prob.shape) < minute_hazard(prob)
+
+
+class RandomTimeline:
+    def __init__(self, start, toilet, phone):
+        """
+        Pre-sampled toilet and phone events of one household, consumed by Event.timeline_random_activity.
+        start: absolute minute (day * 24 * 60 + minute of day) of grid minute 0
+        toilet / phone: boolean event grids
+        """
+        self.start = start
+        # first absolute minute past the grid, Event samples again from there on
+        self.end = start + len(toilet)
+        self.toilet = np.flatnonzero(toilet) + start
+        self.phone = np.flatnonzero(phone) + start
+        self.consumed = start
+
+    @classmethod
+    def sample(cls, params, day, start_minute, schedule, elapsed_toilet, rng, length=2 * MINUTES_PER_DAY):
+        """
+        Sample the timeline of a simulated day from start_minute on, over length minutes.
+        params: the Parameter block of the user profile
+        schedule: the plan of the day, its Sleeping entries select the Sleeping toilet probability
+        elapsed_toilet: minutes since the last toilet visit
+        """
+        minute = start_minute + np.arange(length)
+        toilet_prob = params["Toilet"]["Probability"]
+        base = np.where(sleeping_mask(schedule, minute), toilet_prob["Sleeping"], toilet_prob["Daytime"])
+        phone_prob = params["Phone"]["Probability"]
+        weekday = [utils.get_weekday(day + offset) in WEEKDAYS for offset in range(length // MINUTES_PER_DAY + 2)]
+        is_weekday = np.array(weekday)[minute // MINUTES_PER_DAY]
+        phone = np.where(is_weekday, phone_prob["Weekday"], phone_prob["Weekend"]) * phone_factor(minute)
+        start = day * MINUTES_PER_DAY + start_minute
+        return cls(start, sample_toilet(base[None, :], [elapsed_toilet], rng)[0],
+                   sample_phone(phone[None, :], rng)[0])
+
+    def keep_pending(self, previous):
+        """Take over the events of previous that are due before this timeline starts and not consumed yet"""
+        for name in ("toilet", "phone"):
+            times = getattr(previous, name)
+            pending = times[(times >= previous.consumed) & (times < self.start)]
+            setattr(self, name, np.concatenate([pending, getattr(self, name)]))
+        self.consumed = min(self.consumed, previous.consumed)
+
+    def next_event(self, now, end, phone_allowed=True):
+        """
+        The first event not consumed yet before the absolute minute end, as (minute, activity type).
+        Events that fell into a stretch without an interruptible event are deferred to now,
+        a toilet visit goes first when both happen in the same minute.
+        Returns (None, None) when nothing is pending.
+        """
+        candidates = []
+        for times, activity in ((self.toilet, "toilet_activity"), (self.phone, "phone_activity")):
+            if activity == "phone_activity" and not phone_allowed:
+                continue
+            i = np.searchsorted(times, self.consumed)
+            if i < len(times) and times[i] < end:
+                candidates.append((int(times[i]), activity))
+        if not candidates:
+            return None, None
+        minute, activity = min(candidates, key=lambda candidate: (candidate[0], candidate[1] != "toilet_activity"))
+        minute = max(minute, now)
+        self.consumed = minute + 1
+        return minute, activity
@@ -0,0 +1,240 @@
+import glob
+import os
+import re
+
+import numpy as np
+
+from src.record_store import WEEKDAYS, Vocabulary
+
+# typed columns of a loaded table: day index, weekday code, minute of day and vocabulary codes
+TABLE_COLUMNS = {
+    "day": np.int32,
+    "weekday": np.uint8,
+    "minute": np.int16,
+    "sensor": np.int16,
+    "sensor_state": np.uint8,
+    "device": np.int16,
+    "device_state": np.uint8,
+    "activity": np.int16
+}
+# csv column -> (table column, vocabulary), generated records name the time column "Hour"
+CATEGORICAL_COLUMNS = {
+    "Day": ("weekday", "weekday"),
+    "sensor_type": ("sensor", "sensor"),
+    "sensor_state": ("sensor_state", "state"),
+    "device_type": ("device", "device"),
+    "device_state": ("device_state", "state"),
+    "activity": ("activity", "activity")
+}
+CATEGORICAL_VOCABULARY = {column: vocabulary for column, vocabulary in CATEGORICAL_COLUMNS.values()}
+# record streams of a RecordSink, in the order they are looked for
+SINK_RECORD_FILES = ["record.csv", "record.csv.gz", "record.jsonl", "record.jsonl.gz", "record.parquet"]
+SINK_SCHEDULE_FILES = [name.replace("record", "done_schedule") for name in SINK_RECORD_FILES]
+
+
+def loader_vocabularies():
+    """Vocabularies shared by every table that is compared with another, code 0 is the empty string"""
+    return {
+        "weekday": Vocabulary(WEEKDAYS),
+        "sensor": Vocabulary(),
+        "device": Vocabulary(),
+        "state": Vocabulary(["ON", "OFF"]),
+        "activity": Vocabulary()
+    }
+
+
+def encode_column(values, vocabulary, dtype):
+    """Vocabulary codes of a column, each distinct value is looked up once"""
+    import pandas as pd
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    lookup = np.array([vocabulary.encode("" if value is None else str(value)) for value in uniques], dtype=dtype)
+    return lookup[codes] if len(lookup) else np.zeros(len(values), dtype=dtype)
+
+
+def encode_minutes(values):
+    """Minute of day of "H:MM" / "HH:MM" strings, parsed once per distinct value"""
+    import pandas as pd
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    lookup = np.zeros(len(uniques), dtype=np.int16)
+    for i, value in enumerate(uniques):
+        hour, minute = str(value).split(":")
+        lookup[i] = int(hour) * 60 + int(minute)
+    return lookup[codes]
+
+
+class RecordTable:
+    def __init__(self, columns, vocabularies):
+        """
+        Record rows as typed numpy columns (TABLE_COLUMNS), categorical values as codes into vocabularies.
+        Tables loaded with the same vocabularies can be concatenated and compared code by code.
+        """
+        self.columns = columns
+        self.vocabularies = vocabularies
+
+    def __len__(self):
+        return len(self.columns["minute"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def decode(self, name):
+        """A categorical column as strings"""
+        vocabulary = self.vocabularies[CATEGORICAL_VOCABULARY[name]]
+        return np.array(vocabulary.values, dtype=object)[self.columns[name]]
+
+    def select(self, mask):
+        return RecordTable({name: column[mask] for name, column in self.columns.items()}, self.vocabularies)
+
+    @classmethod
+    def empty(cls, vocabularies):
+        return cls({name: np.zeros(0, dtype=dtype) for name, dtype in TABLE_COLUMNS.items()}, vocabularies)
+
+    @classmethod
+    def concat(cls, tables, vocabularies):
+        if not tables:
+            return cls.empty(vocabularies)
+        return cls({name: np.concatenate([table.columns[name] for table in tables]) for name in TABLE_COLUMNS},
+                   vocabularies)
+
+
+def encode_chunk(chunk, vocabularies, days):
+    columns = {}
+    for csv_column, (column, vocabulary) in CATEGORICAL_COLUMNS.items():
+        columns[column] = encode_column(chunk[csv_column].to_numpy(), vocabularies[vocabulary],
+                                        TABLE_COLUMNS[column])
+    time_column = "Time" if "Time" in chunk.columns else "Hour"
+    columns["minute"] = encode_minutes(chunk[time_column].to_numpy())
+    columns["day"] = np.asarray(days, dtype=np.int32)
+    return {name: columns[name] for name in TABLE_COLUMNS}
+
+
+def read_chunks(path, chunk_size):
+    """DataFrames of at most chunk_size rows from a csv, jsonl or parquet file (gzip is detected by suffix)"""
+    import pandas as pd
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    elif path.endswith((".jsonl", ".jsonl.gz")):
+        yield from pd.read_json(path, lines=True, dtype=False, chunksize=chunk_size, compression="infer")
+    else:
+        # utf-8-sig drops the BOM of the reference files and of the records written by Event.save_record
+        yield from pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8-sig",
+                               chunksize=chunk_size, compression="infer")
+
+
+def load_raw_csv(path, vocabularies=None, chunk_size=100000):
+    """
+    Stream a reference file of raw_data (Day,Time,sensor_type,...,activity) chunk by chunk into a RecordTable.
+    The files carry only the weekday, a new day index starts at every change of weekday.
+    """
+    vocabularies = vocabularies or loader_vocabularies()
+    tables = []
+    last_weekday = None
+    day = -1
+    for chunk in read_chunks(path, chunk_size):
+        weekday = encode_column(chunk["Day"].to_numpy(), vocabularies["weekday"], np.uint8)
+        previous = np.empty_like(weekday)
+        previous[1:] = weekday[:-1]
+        previous[:1] = weekday[:1] if last_weekday is None else last_weekday
+        changes = weekday != previous
+        if last_weekday is None and len(weekday):
+            changes[0] = True
+        days = day + np.cumsum(changes)
+        if len(weekday):
+            day = int(days[-1])
+            last_weekday = weekday[-1]
+        tables.append(RecordTable(encode_chunk(chunk, vocabularies, days), vocabularies))
+    return RecordTable.concat(tables, vocabularies)
+
+
+def load_record_dir(save_dir, vocabularies=None, chunk_size=100000):
+    """
+    Load the records of one generated run: the record stream of a RecordSink (with its day column)
+    or else the record_day<N>.csv files of Event.save_record.
+    """
+    vocabularies = vocabularies or loader_vocabularies()
+    tables = []
+    streamed = [os.path.join(save_dir, name) for name in SINK_RECORD_FILES
+                if os.path.exists(os.path.join(save_dir, name))]
+    if streamed:
+        for chunk in read_chunks(streamed[0], chunk_size):
+            tables.append(RecordTable(encode_chunk(chunk, vocabularies, chunk["day"].to_numpy(dtype=np.int32)),
+                                      vocabularies))
+        return RecordTable.concat(tables, vocabularies)
+    paths = glob.glob(os.path.join(save_dir, "record_day*.csv"))
+    paths.sort(key=lambda path: int(re.search(r"record_day(\d+)\.csv$", path).group(1)))
+    for path in paths:
+        day = int(re.search(r"record_day(\d+)\.csv$", path).group(1))
+        for chunk in read_chunks(path, chunk_size):
+            if len(chunk):
+                tables.append(RecordTable(encode_chunk(chunk, vocabularies, np.full(len(chunk), day)), vocabularies))
+    return RecordTable.concat(tables, vocabularies)
+
+
+def load_schedule_dir(save_dir, vocabularies=None, chunk_size=100000):
+    """
+    The done schedules of one generated run as typed columns: day, activity code, start and end minute.
+    Read from the done_schedule stream of a RecordSink or else the done_schedule_day<N>.csv files.
+    """
+    vocabularies = vocabularies or loader_vocabularies()
+    parts = []
+
+    def encode(chunk, days):
+        parts.append({
+            "day": np.asarray(days, dtype=np.int32),
+            "activity": encode_column(chunk["activity_name"].to_numpy(), vocabularies["activity"], np.int16),
+            "start": encode_minutes(chunk["start_time"].to_numpy()),
+            "end": encode_minutes(chunk["end_time"].to_numpy())
+        })
+
+    streamed = [os.path.join(save_dir, name) for name in SINK_SCHEDULE_FILES
+                if os.path.exists(os.path.join(save_dir, name))]
+    if streamed:
+        for chunk in read_chunks(streamed[0], chunk_size):
+            encode(chunk, chunk["day"].to_numpy(dtype=np.int32))
+    else:
+        for path in glob.glob(os.path.join(save_dir, "done_schedule_day*.csv")):
+            day = int(re.search(r"done_schedule_day(\d+)\.csv$", path).group(1))
+            for chunk in read_chunks(path, chunk_size):
+                if len(chunk):
+                    encode(chunk, np.full(len(chunk), day))
+    if not parts:
+        return {"day": np.zeros(0, dtype=np.int32), "activity": np.zeros(0, dtype=np.int16),
+                "start": np.zeros(0, dtype=np.int16), "end": np.zeros(0, dtype=np.int16)}
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    order = np.argsort(columns["day"], kind="stable")
+    return {name: column[order] for name, column in columns.items()}
+
+
+def run_directories(root):
+    """Directories below root holding the records of a run, sorted"""
+    return sorted({os.path.dirname(path) for pattern in ["record_day*.csv"] + SINK_RECORD_FILES
+                   for path in glob.glob(os.path.join(root, "**", pattern), recursive=True)})
+
+
+def load_corpus(root, vocabularies=None, chunk_size=100000):
+    """Every run below root (directories holding records), concatenated with consecutive day indices"""
+    vocabularies = vocabularies or loader_vocabularies()
+    tables = []
+    offset = 0
+    for run_dir in run_directories(root):
+        table = load_record_dir(run_dir, vocabularies, chunk_size)
+        if len(table):
+            table.columns["day"] = table.columns["day"] - table.columns["day"].min() + offset
+            offset = int(table.columns["day"].max()) + 1
+            tables.append(table)
+    return RecordTable.concat(tables, vocabularies)
+
+
+def load_records(path, vocabularies=None, chunk_size=100000):
+    """A reference csv file, a compacted dataset store, a run directory or a directory of runs"""
+    if os.path.isfile(path):
+        return load_raw_csv(path, vocabularies, chunk_size)
+    if glob.glob(os.path.join(path, "record_day*.csv")) or \
+            any(os.path.exists(os.path.join(path, name)) for name in SINK_RECORD_FILES):
+        return load_record_dir(path, vocabularies, chunk_size)
+    if os.path.exists(os.path.join(path, "store.json")):
+        from src.dataset_store import DatasetStore
+        return DatasetStore(path).corpus_table(vocabularies)
+    return load_corpus(path, vocabularies, chunk_size)
@@ -0,0 +1,120 @@
+import csv
+import gzip
+import json
+import os
+
+# fixed columns of the three record streams, "day" is the workflow day the row belongs to
+STREAM_FIELDS = {
+    "record": ["day", "Day", "Hour", "sensor_type", "sensor_state", "device_type", "device_state", "activity"],
+    "event_record": ["day", "step", "target", "attribute", "state", "Generate", "duration", "activity_name",
+                     "start_time"],
+    "done_schedule": ["day", "activity_name", "start_time", "end_time"]
+}
+
+
+class RecordSink:
+    def __init__(self, save_dir, format="csv", compress=False, buffer_size=1000, resume=False):
+        """
+        Append-only writer for the record, event_record and done_schedule streams of one run.
+        Rows are buffered per stream and appended to <save_dir>/<stream>.<format> every buffer_size rows,
+        so memory stays bounded however long the run is.
+        format: csv, jsonl or parquet (one row group per stream and day, needs pyarrow)
+        compress: gzip csv / jsonl files, every flush appends one gzip member
+        resume: keep the stream files of an earlier run, truncate then cuts them back to its checkpoint.
+                Otherwise they are removed, a new run does not append to what a failed one flushed
+        """
+        if format not in ("csv", "jsonl", "parquet"):
+            raise ValueError(f"unknown record format: {format}")
+        self.save_dir = save_dir
+        self.format = format
+        self.compress = compress and format != "parquet"
+        self.buffer_size = buffer_size
+        self.buffers = {stream: [] for stream in STREAM_FIELDS}
+        self.parquet_writers = {}
+        self.rows_written = {stream: 0 for stream in STREAM_FIELDS}
+        os.makedirs(save_dir, exist_ok=True)
+        if not resume:
+            for stream in STREAM_FIELDS:
+                if os.path.exists(self.path(stream)):
+                    os.remove(self.path(stream))
+
+    def path(self, stream):
+        suffix = ".gz" if self.compress else ""
+        return os.path.join(self.save_dir, f"{stream}.{self.format}{suffix}")
+
+    def write(self, stream, day, row):
+        buffer = self.buffers[stream]
+        buffer.append(dict(row, day=day))
+        # parquet keeps a whole day per row group, see end_day
+        if self.format != "parquet" and len(buffer) >= self.buffer_size:
+            self.flush_stream(stream)
+
+    def end_day(self, day):
+        """Called by Event.save_record once a day is complete"""
+        self.flush()
+
+    def flush(self):
+        for stream in STREAM_FIELDS:
+            self.flush_stream(stream)
+
+    def flush_stream(self, stream):
+        rows = self.buffers[stream]
+        if not rows:
+            return
+        if self.format == "parquet":
+            self.write_parquet(stream, rows)
+        else:
+            path = self.path(stream)
+            new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+            opener = gzip.open if self.compress else open
+            with opener(path, 'at', encoding='utf-8', newline='') as file:
+                if self.format == "csv":
+                    writer = csv.DictWriter(file, fieldnames=STREAM_FIELDS[stream], restval='',
+                                            extrasaction='ignore')
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerows(rows)
+                else:
+                    for row in rows:
+                        file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.rows_written[stream] += len(rows)
+        self.buffers[stream] = []
+
+    def write_parquet(self, stream, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        fields = STREAM_FIELDS[stream]
+        columns = {"day": pa.array([row["day"] for row in rows], type=pa.int32())}
+        for field in fields[1:]:
+            columns[field] = pa.array(["" if row.get(field) is None else str(row.get(field)) for row in rows],
+                                      type=pa.string())
+        table = pa.table(columns)
+        if stream not in self.parquet_writers:
+            self.parquet_writers[stream] = pq.ParquetWriter(self.path(stream), table.schema)
+        self.parquet_writers[stream].write_table(table)
+
+    def checkpoint(self):
+        """Flush and return the size of every stream file, the offsets a resumed run truncates back to"""
+        if self.format == "parquet":
+            # row groups only become readable with the footer written at close
+            return None
+        self.flush()
+        return {stream: os.path.getsize(self.path(stream)) if os.path.exists(self.path(stream)) else 0
+                for stream in STREAM_FIELDS}
+
+    def truncate(self, offsets):
+        """Drop everything written after a checkpoint"""
+        if offsets is None:
+            raise ValueError(f"{self.format} record sinks cannot be resumed from a checkpoint")
+        self.buffers = {stream: [] for stream in STREAM_FIELDS}
+        for stream, size in offsets.items():
+            path = self.path(stream)
+            if os.path.exists(path):
+                with open(path, 'r+b') as file:
+                    file.truncate(size)
+
+    def close(self):
+        self.flush()
+        for writer in self.parquet_writers.values():
+            writer.close()
+        self.parquet_writers = {}
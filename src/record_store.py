@@ -0,0 +1,148 @@
+from array import array
+
+import numpy as np
+
+from src import utils
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+RECORD_COLUMNS = ["Day", "Hour", "sensor_type", "sensor_state", "device_type", "device_state", "activity"]
+# "HH:MM" of every minute of the day, decoded by lookup instead of formatting each row
+MINUTE_STR = [utils.int_time2str_time(minute) for minute in range(24 * 60)]
+
+
+class Vocabulary:
+    def __init__(self, values=()):
+        """Interned values with dense integer codes, code 0 is always the empty string"""
+        self.values = ['']
+        self.codes = {'': 0}
+        for value in values:
+            self.encode(value)
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+    def decode(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+def build_vocabularies(env_config, activity_config):
+    """Vocabularies of the record columns, seeded from the sensor, device and activity names of the configs"""
+    env = env_config["environment_config"]
+    devices = list(env["control_device"]) + list(env["Facility"])
+    activities = []
+    for activity in activity_config["activity_config"]:
+        activities.append(activity["activity_name"])
+        for event_list in activity["event_sequence"].values():
+            for event_input in event_list:
+                if event_input.get("attribute") == "control":
+                    devices.append(event_input["target"])
+    return {
+        "weekday": Vocabulary(WEEKDAYS),
+        "sensor": Vocabulary(env["sensor"]),
+        "device": Vocabulary(devices),
+        "state": Vocabulary(["ON", "OFF"]),
+        "activity": Vocabulary(activities),
+        "event_template": Vocabulary()
+    }
+
+
+def decode_codes(codes, values):
+    """Map an array of codes to their strings"""
+    return np.array(values, dtype=object)[np.frombuffer(codes, dtype=codes.typecode).astype(np.int64)]
+
+
+class RecordStore:
+    def __init__(self, vocabularies):
+        """
+        Compact column store of Event.record: one typed array per column holding vocabulary codes,
+        the time as minute of day. Rows are only decoded to strings at export.
+        """
+        self.vocabularies = vocabularies
+        self.weekday = array('B')
+        self.minute = array('H')
+        self.sensor = array('H')
+        self.sensor_state = array('B')
+        self.device = array('H')
+        self.device_state = array('B')
+        self.activity = array('H')
+
+    def __len__(self):
+        return len(self.minute)
+
+    def append_row(self, weekday, minute, sensor_type, sensor_state, device_type, device_state, activity):
+        vocabularies = self.vocabularies
+        self.weekday.append(vocabularies["weekday"].encode(weekday))
+        self.minute.append(minute)
+        self.sensor.append(vocabularies["sensor"].encode(sensor_type))
+        self.sensor_state.append(vocabularies["state"].encode(sensor_state))
+        self.device.append(vocabularies["device"].encode(device_type))
+        self.device_state.append(vocabularies["state"].encode(device_state))
+        self.activity.append(vocabularies["activity"].encode(activity))
+
+    def append(self, record_i):
+        """Append a row given as the legacy record dict"""
+        self.append_row(record_i["Day"], utils.str_time2int_time(record_i["Hour"]), record_i["sensor_type"],
+                        record_i["sensor_state"], record_i["device_type"], record_i["device_state"],
+                        record_i["activity"])
+
+    def columns(self):
+        """Decoded columns as numpy object arrays, one vectorized lookup per column"""
+        vocabularies = self.vocabularies
+        return {
+            "Day": decode_codes(self.weekday, vocabularies["weekday"].values),
+            "Hour": decode_codes(self.minute, MINUTE_STR),
+            "sensor_type": decode_codes(self.sensor, vocabularies["sensor"].values),
+            "sensor_state": decode_codes(self.sensor_state, vocabularies["state"].values),
+            "device_type": decode_codes(self.device, vocabularies["device"].values),
+            "device_state": decode_codes(self.device_state, vocabularies["state"].values),
+            "activity": decode_codes(self.activity, vocabularies["activity"].values)
+        }
+
+    def __iter__(self):
+        """Decoded rows as the legacy record dicts"""
+        columns = self.columns()
+        for i in range(len(self)):
+            yield {name: columns[name][i] for name in RECORD_COLUMNS}
+
+
+class EventRecordStore:
+    def __init__(self, vocabularies):
+        """
+        Compact store of Event.event_record: the event-sequence step is interned as a template code,
+        only duration, activity and start minute are kept per row.
+        """
+        self.vocabularies = vocabularies
+        self.template = array('H')
+        self.duration = array('I')
+        self.activity = array('H')
+        self.start = array('H')
+
+    def __len__(self):
+        return len(self.template)
+
+    def append(self, event_todo):
+        template = tuple((key, value) for key, value in event_todo.items()
+                         if key not in ("duration", "activity_name", "start_time"))
+        self.template.append(self.vocabularies["event_template"].encode(template))
+        self.duration.append(event_todo.get("duration", 0))
+        self.activity.append(self.vocabularies["activity"].encode(event_todo["activity_name"]))
+        self.start.append(utils.str_time2int_time(event_todo["start_time"]))
+
+    def __iter__(self):
+        """Decoded rows as the legacy event dicts"""
+        templates = self.vocabularies["event_template"]
+        activities = self.vocabularies["activity"]
+        for i in range(len(self)):
+            event_todo = dict(templates.decode(self.template[i]))
+            event_todo["duration"] = self.duration[i]
+            event_todo["activity_name"] = activities.decode(self.activity[i])
+            event_todo["start_time"] = MINUTE_STR[self.start[i]]
+            yield event_todo
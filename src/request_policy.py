@@ -0,0 +1,416 @@
+import asyncio
+import collections
+import os
+import random
+import struct
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+try:
+    import fcntl
+except ImportError:
+    # no flock on Windows, the token bucket is then shared by the threads of one process only
+    fcntl = None
+
+# HTTP status codes worth another attempt: timeout, conflict, rate limit and server side errors
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# bucket file layout: available tokens, time.time() of the last refill
+BUCKET_STATE = struct.Struct("dd")
+
+
+class RequestTimeoutError(TimeoutError):
+    """Raised when an attempt does not answer within RequestPolicy.timeout"""
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are retried, anything else is raised"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # openai.APIConnectionError / APITimeoutError, matched by name to keep openai an optional import
+    return any(cls.__name__ == "APIConnectionError" for cls in type(error).__mro__)
+
+
+def retry_after(error):
+    """Seconds asked for by a Retry-After header of the error response, None without one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None, path=None):
+        """
+        rate: requests per second refilled into the bucket
+        burst: bucket capacity, defaults to one second of requests
+        path: state file shared through flock by every process using the same path (batch workers),
+              without it the bucket is shared by the threads of this process
+        """
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.path = path
+        self.tokens = self.burst
+        self.updated = time.time()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def take(self, tokens, updated, now):
+        """(tokens, wait) after trying to take one token at now"""
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) / self.rate
+
+    def try_acquire(self):
+        """Take a token if one is available, returns 0 or the seconds to wait before trying again"""
+        with self._lock:
+            now = time.time()
+            if self.path is None or fcntl is None:
+                self.tokens, seconds = self.take(self.tokens, self.updated, now)
+                self.updated = now
+                return seconds
+            with open(self.path, 'a+b') as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                try:
+                    file.seek(0)
+                    data = file.read(BUCKET_STATE.size)
+                    tokens, updated = BUCKET_STATE.unpack(data) if len(data) == BUCKET_STATE.size \
+                        else (self.burst, now)
+                    tokens, seconds = self.take(tokens, updated, now)
+                    file.seek(0)
+                    file.truncate()
+                    file.write(BUCKET_STATE.pack(tokens, now))
+                    file.flush()
+                finally:
+                    fcntl.flock(file, fcntl.LOCK_UN)
+                return seconds
+
+    def acquire(self):
+        """Block until a token is taken, returns the seconds spent waiting"""
+        waited = 0.0
+        seconds = self.try_acquire()
+        while seconds:
+            time.sleep(seconds)
+            waited += seconds
+            seconds = self.try_acquire()
+        return waited
+
+    async def aacquire(self):
+        waited = 0.0
+        seconds = self.try_acquire()
+        while seconds:
+            await asyncio.sleep(seconds)
+            waited += seconds
+            seconds = self.try_acquire()
+        return waited
+
+
+class RequestMetrics:
+    def __init__(self, window=10000):
+        """
+        Counters of the LLM requests of this process: attempts, retries, timeouts, errors by type,
+        hedged requests and the latency of the answers (the last window of them per call kind, e.g.
+        "complete" answers and the "first_piece" of streams) for the tail percentiles
+        """
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.abandoned = 0
+        self.throttled = 0.0
+        self.errors = collections.Counter()
+        self.window = window
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def restart(self):
+        """Zero the counters, the latency window is kept since hedging decisions rely on it"""
+        with self._lock:
+            self.calls = self.attempts = self.retries = self.timeouts = self.failures = 0
+            self.hedged = self.hedge_wins = self.abandoned = 0
+            self.throttled = 0.0
+            self.errors = collections.Counter()
+
+    def add(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def error(self, error):
+        with self._lock:
+            self.errors[type(error).__name__] += 1
+
+    def latency(self, seconds, kind="complete"):
+        with self._lock:
+            self.latencies.setdefault(kind, collections.deque(maxlen=self.window)).append(seconds)
+
+    def samples(self, kind="complete"):
+        with self._lock:
+            return len(self.latencies.get(kind, ()))
+
+    def percentile(self, percent, kind="complete"):
+        with self._lock:
+            samples = sorted(self.latencies.get(kind, ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+    def summary(self):
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "abandoned": self.abandoned,
+            "throttled_seconds": self.throttled,
+            "errors": dict(self.errors),
+            "latency": {kind: {"p50": self.percentile(50, kind), "p90": self.percentile(90, kind),
+                               "p99": self.percentile(99, kind), "max": max(samples)}
+                        for kind, samples in list(self.latencies.items()) if samples}
+        }
+
+
+class RequestPolicy:
+    def __init__(self, timeout=None, max_retries=3, backoff=0.5, max_backoff=30.0, hedge_percentile=None,
+                 hedge_min_samples=20, limiter=None, seed=None, max_workers=32, max_abandoned=8):
+        """
+        How chat.get_response issues a request to the backend.
+        timeout: seconds per attempt, a late attempt counts as a retryable RequestTimeoutError
+        max_retries: further attempts after a retryable error (see is_retryable)
+        backoff / max_backoff: the wait before retry n is uniform in [0, min(max_backoff, backoff * 2**n)]
+                               ("full jitter"), at least the Retry-After of the error
+        hedge_percentile: once hedge_min_samples answers of the same call kind are known, an attempt slower
+                          than this latency percentile gets one duplicate request, the first answer wins
+        limiter: optional TokenBucket, every attempt and hedge takes a token
+        max_workers: threads of the pool running timed or hedged attempts
+        max_abandoned: timed-out and losing hedged attempts still running in the pool (a thread cannot be
+                       stopped); a new attempt first waits until fewer are left, so they cannot fill the pool
+        """
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.limiter = limiter
+        self.rng = random.Random(seed)
+        self.max_workers = max_workers
+        self.max_abandoned = min(max_abandoned, max_workers - 1)
+        self.metrics = RequestMetrics()
+        self._executor = None
+        self._pid = None
+        self._abandoned = set()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # a thread pool cannot cross process boundaries, recreated lazily in the worker
+        state = self.__dict__.copy()
+        state["_executor"] = None
+        state["_pid"] = None
+        state["_abandoned"] = None
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._abandoned = set()
+        self._lock = threading.Lock()
+
+    def executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="llm-request")
+            self._pid = os.getpid()
+            self._abandoned = set()
+        return self._executor
+
+    def abandon(self, futures):
+        """Cancel attempts that did not start yet, keep count of the running ones until they finish"""
+        for future in futures:
+            if future.cancel():
+                continue
+            with self._lock:
+                self._abandoned.add(future)
+            self.metrics.add("abandoned")
+            future.add_done_callback(self.release)
+
+    def release(self, future):
+        with self._lock:
+            self._abandoned.discard(future)
+
+    def wait_abandoned(self):
+        """Block while max_abandoned attempts are still running, the pool keeps threads for new ones"""
+        while True:
+            with self._lock:
+                abandoned = list(self._abandoned)
+            if len(abandoned) < self.max_abandoned:
+                return
+            wait(abandoned, return_when=FIRST_COMPLETED)
+
+    def hedge_delay(self, kind):
+        if self.hedge_percentile is None or self.metrics.samples(kind) < self.hedge_min_samples:
+            return None
+        return self.metrics.percentile(self.hedge_percentile, kind)
+
+    def retry_delay(self, attempt, error):
+        delay = self.rng.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return max(delay, retry_after(error) or 0.0)
+
+    def throttle(self):
+        if self.limiter is not None:
+            self.metrics.add("throttled", self.limiter.acquire())
+
+    async def athrottle(self):
+        if self.limiter is not None:
+            self.metrics.add("throttled", await self.limiter.aacquire())
+
+    def attempt(self, call, kind="complete"):
+        """One attempt: the call in a pool thread, bounded by timeout, hedged past the latency percentile"""
+        hedge_delay = self.hedge_delay(kind)
+        if self.timeout is None and hedge_delay is None:
+            return call()
+        self.wait_abandoned()
+        start = time.perf_counter()
+        first = self.executor().submit(call)
+        pending = {first}
+        try:
+            if hedge_delay is not None and (self.timeout is None or hedge_delay < self.timeout):
+                done, _ = wait(pending, timeout=hedge_delay)
+                if not done:
+                    self.metrics.add("hedged")
+                    self.throttle()
+                    pending.add(self.executor().submit(call))
+            while True:
+                remaining = None if self.timeout is None else max(0.0, self.timeout - (time.perf_counter() - start))
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                if not done:
+                    raise RequestTimeoutError(f"no answer within {self.timeout}s")
+                answered = [future for future in done if future.exception() is None]
+                if answered:
+                    if first not in answered:
+                        self.metrics.add("hedge_wins")
+                    return answered[0].result()
+                if not pending:
+                    raise next(iter(done)).exception()
+        finally:
+            # timed-out and losing attempts finish in their pool thread, the backend's own timeout bounds them
+            self.abandon(pending)
+
+    async def aattempt(self, call, kind="complete"):
+        hedge_delay = self.hedge_delay(kind)
+        start = time.perf_counter()
+        first = asyncio.ensure_future(call())
+        pending = {first}
+        try:
+            if hedge_delay is not None and (self.timeout is None or hedge_delay < self.timeout):
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    self.metrics.add("hedged")
+                    await self.athrottle()
+                    pending.add(asyncio.ensure_future(call()))
+            while True:
+                remaining = None if self.timeout is None else max(0.0, self.timeout - (time.perf_counter() - start))
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise RequestTimeoutError(f"no answer within {self.timeout}s")
+                answered = [task for task in done if task.exception() is None]
+                if answered:
+                    if first not in answered:
+                        self.metrics.add("hedge_wins")
+                    return answered[0].result()
+                if not pending:
+                    raise next(iter(done)).exception()
+        finally:
+            for task in pending:
+                if task.done() and not task.cancelled():
+                    # the losing request failed meanwhile, retrieve its error so asyncio does not log it
+                    task.exception()
+                elif not task.done():
+                    task.cancel()
+
+    def handle_error(self, attempt, error):
+        """Count the error, returns the seconds to wait before the next attempt or raises it"""
+        self.metrics.error(error)
+        if isinstance(error, RequestTimeoutError):
+            self.metrics.add("timeouts")
+        if attempt >= self.max_retries or not is_retryable(error):
+            self.metrics.add("failures")
+            raise error
+        self.metrics.add("retries")
+        return self.retry_delay(attempt, error)
+
+    def call(self, call, kind="complete"):
+        """
+        Run call() (a blocking backend request) under the policy, returns its result
+        kind: latency window of the call, hedging compares it with calls of the same kind only
+        """
+        self.metrics.add("calls")
+        attempt = 0
+        while True:
+            self.metrics.add("attempts")
+            self.throttle()
+            start = time.perf_counter()
+            try:
+                result = self.attempt(call, kind)
+            except Exception as error:
+                time.sleep(self.handle_error(attempt, error))
+                attempt += 1
+                continue
+            self.metrics.latency(time.perf_counter() - start, kind)
+            return result
+
+    async def acall(self, call, kind="complete"):
+        """Async variant of call, call() returns an awaitable"""
+        self.metrics.add("calls")
+        attempt = 0
+        while True:
+            self.metrics.add("attempts")
+            await self.athrottle()
+            start = time.perf_counter()
+            try:
+                result = await self.aattempt(call, kind)
+            except Exception as error:
+                await asyncio.sleep(self.handle_error(attempt, error))
+                attempt += 1
+                continue
+            self.metrics.latency(time.perf_counter() - start, kind)
+            return result
+
+
+def make_policy(rate_limit=None, burst=None, timeout=None, max_retries=None, hedge_percentile=None,
+                bucket_path=None):
+    """RequestPolicy from plain (command line) options, None when none of them is given"""
+    if all(option is None for option in (rate_limit, timeout, max_retries, hedge_percentile)):
+        return None
+    limiter = TokenBucket(rate_limit, burst, bucket_path) if rate_limit else None
+    return RequestPolicy(timeout=timeout, max_retries=3 if max_retries is None else max_retries,
+                         hedge_percentile=hedge_percentile, limiter=limiter)
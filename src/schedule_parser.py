@@ -0,0 +1,160 @@
+import ast
+import difflib
+import json
+import re
+
+from src import utils
+
+# H:MM or HH:MM within one day
+TIME_PATTERN = re.compile(r"^([01]?\d|2[0-3]):[0-5]\d$")
+SCHEDULE_KEYS = ["activity_name", "start_time", "end_time"]
+
+
+class ScheduleError(ValueError):
+    """LLM output that cannot be repaired into a valid schedule or activity name"""
+
+
+def strip_response(text):
+    """Drop markdown code fences and any prose around the outermost [...] of a response"""
+    text = re.sub(r"```[A-Za-z]*", "", text).strip()
+    start = text.find("[")
+    end = text.rfind("]")
+    if start < 0 or end < start:
+        return text
+    return text[start:end + 1]
+
+
+def load_list(text):
+    """
+    Read a list literal written as JSON or as a Python repr.
+    The replace of single quotes is tried last, it breaks names that contain an apostrophe.
+    """
+    for loader in (json.loads, ast.literal_eval, lambda value: json.loads(value.replace("'", '"'))):
+        try:
+            return loader(text)
+        except (ValueError, SyntaxError, TypeError):
+            continue
+    # "start-end activity_name" entries, the compact prompt encoding copied back by the LLM
+    schedule = utils.parse_compact_schedule(text)
+    if schedule:
+        return schedule
+    raise ScheduleError(f"not a JSON list: {text[:80]!r}")
+
+
+class IncrementalListParser:
+    def __init__(self):
+        """
+        Reads a JSON (or Python repr) list of objects as it arrives in pieces: feed returns every top-level
+        object completed by the new text. Text before the opening "[" (prose, code fences) is skipped,
+        brackets and braces inside strings are ignored.
+        """
+        self.text = ""
+        self.position = 0
+        self.in_list = False
+        self.closed = False
+        self.depth = 0
+        self.quote = None
+        self.escaped = False
+        self.object_start = None
+
+    def feed(self, piece):
+        self.text += piece
+        completed = []
+        text = self.text
+        while self.position < len(text) and not self.closed:
+            char = text[self.position]
+            if not self.in_list:
+                self.in_list = char == "["
+            elif self.quote is not None:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == self.quote:
+                    self.quote = None
+            elif char in "\"'" and self.depth:
+                self.quote = char
+            elif char == "{":
+                if self.depth == 0:
+                    self.object_start = self.position
+                self.depth += 1
+            elif char == "}" and self.depth:
+                self.depth -= 1
+                if self.depth == 0:
+                    completed.append(load_object(text[self.object_start:self.position + 1]))
+            elif char == "]" and self.depth == 0:
+                self.closed = True
+            self.position += 1
+        return completed
+
+
+def load_object(text):
+    """One object of a streamed list, None when it cannot be read"""
+    for loader in (json.loads, ast.literal_eval, lambda value: json.loads(value.replace("'", '"'))):
+        try:
+            return loader(text)
+        except (ValueError, SyntaxError, TypeError):
+            continue
+    return None
+
+
+def nearest_activity(name, activity_names):
+    """The valid activity closest to name, None if nothing is close"""
+    if name in activity_names:
+        return name
+    lowered = {activity.lower(): activity for activity in activity_names}
+    cleaned = name.strip().strip('"\'“”.,').strip()
+    if cleaned.lower() in lowered:
+        return lowered[cleaned.lower()]
+    # a valid name inside a longer answer, e.g. "Reading while waiting"
+    contained = [activity for activity in lowered if activity in cleaned.lower()]
+    if contained:
+        return lowered[max(contained, key=len)]
+    matches = difflib.get_close_matches(cleaned.lower(), list(lowered), n=1, cutoff=0.6)
+    return lowered[matches[0]] if matches else None
+
+
+def validate_schedule(schedule, activity_names, allow_empty=True):
+    """
+    Check a decoded schedule against the schema: a list of
+    {"activity_name": <name of activity_config>, "start_time": "H:MM", "end_time": "H:MM"} entries.
+    Unknown activities are mapped to the nearest valid one, entries are rebuilt in the canonical key order.
+    """
+    if not isinstance(schedule, list):
+        raise ScheduleError(f"expected a list of activities, got {type(schedule).__name__}")
+    if not schedule and not allow_empty:
+        raise ScheduleError("empty schedule")
+    valid = []
+    for i, activity in enumerate(schedule):
+        if not isinstance(activity, dict) or any(key not in activity for key in SCHEDULE_KEYS):
+            raise ScheduleError(f"entry {i} must have the keys {', '.join(SCHEDULE_KEYS)}: {activity!r}")
+        name = nearest_activity(str(activity["activity_name"]), activity_names)
+        if name is None:
+            raise ScheduleError(f"entry {i} has an unknown activity {activity['activity_name']!r}")
+        for key in ("start_time", "end_time"):
+            if not TIME_PATTERN.match(str(activity[key]).strip()):
+                raise ScheduleError(f"entry {i} has an invalid {key} {activity[key]!r}, expected H:MM")
+        valid.append({"activity_name": name, "start_time": str(activity["start_time"]).strip(),
+                      "end_time": str(activity["end_time"]).strip()})
+    return valid
+
+
+def parse_schedule(text, activity_names, allow_empty=True):
+    """Repair and validate a schedule response, raises ScheduleError when it cannot be used"""
+    if not isinstance(text, str):
+        raise ScheduleError(f"expected text, got {type(text).__name__}")
+    return validate_schedule(load_list(strip_response(text)), activity_names, allow_empty)
+
+
+def parse_activity_name(text, activity_names):
+    """A single activity name answer, e.g. of decide_do_what_waiting"""
+    name = nearest_activity(re.sub(r"```[A-Za-z]*", "", text).strip(), activity_names)
+    if name is None:
+        raise ScheduleError(f"unknown activity {text[:80]!r}")
+    return name
+
+
+def reask_prompt(prompt, error):
+    """The prompt of a bounded re-ask after an unusable answer"""
+    return (f"{prompt}\nYour previous answer could not be used: {error}. "
+            f"Answer again in the required format, without any additional content.")
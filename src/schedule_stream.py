@@ -0,0 +1,202 @@
+import asyncio
+import threading
+
+from src.schedule_parser import IncrementalListParser, ScheduleError, validate_schedule
+
+
+class ScheduleStream:
+    def __init__(self, pieces, activity_names, recover):
+        """
+        A schedule answer consumed in a worker thread while the simulation runs: every entry is validated
+        and handed out as soon as its object is complete in the streamed text.
+        pieces: iterable of answer pieces, e.g. chat.stream_response
+        recover(text, emitted): entries after the first emitted ones, called with the whole answer when the
+                                stream could not be used as it came (an invalid entry, no list, an unclosed list).
+                                A failed request is raised by the reading methods instead.
+        """
+        self.activity_names = activity_names
+        self.recover = recover
+        self.entries = []
+        self.read = 0
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+        self.parser = IncrementalListParser()
+        self.usable = True
+        if pieces is not None:
+            self.thread = threading.Thread(target=self.consume, args=(pieces,), daemon=True)
+            self.thread.start()
+
+    def add(self, entries):
+        with self.condition:
+            self.entries.extend(entries)
+            self.condition.notify_all()
+
+    def take(self, piece):
+        """Validate and add the entries a piece completes"""
+        if not self.usable:
+            self.parser.text += piece
+            return
+        for item in self.parser.feed(piece):
+            try:
+                self.add(validate_schedule([item], self.activity_names))
+            except ScheduleError as e:
+                print(f"Unusable streamed schedule entry: {e}")
+                self.usable = False
+                break
+
+    def needs_recovery(self):
+        # an invalid entry, no list or an unclosed one: the whole answer goes through the repair path
+        return not (self.usable and self.parser.closed and self.entries)
+
+    def finish(self, error=None):
+        with self.condition:
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+    def consume(self, pieces):
+        try:
+            for piece in pieces:
+                self.take(piece)
+            if self.needs_recovery():
+                self.add(self.recover(self.parser.text, len(self.entries)))
+        except Exception as e:
+            # a failed request is not repaired, it is raised to the reader as get_response raises it
+            self.finish(e)
+        else:
+            self.finish()
+
+    @property
+    def exhausted(self):
+        """Every entry of the answer has been read"""
+        with self.condition:
+            return self.done and self.error is None and self.read == len(self.entries)
+
+    def ready(self):
+        """Entries that arrived since the last read, without waiting. Raises the error of a failed request once
+        the entries that arrived before it are read"""
+        with self.condition:
+            entries = self.entries[self.read:]
+            self.read = len(self.entries)
+            if not entries and self.error is not None:
+                raise self.error
+            return entries
+
+    def next_entries(self):
+        """Wait until at least one new entry arrived or the answer is complete, then read"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.done or self.read < len(self.entries))
+        return self.ready()
+
+    def rest(self):
+        """Wait for the complete answer, then read every entry not read yet"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.done)
+            if self.error is not None:
+                raise self.error
+        return self.ready()
+
+
+class AsyncScheduleStream(ScheduleStream):
+    def __init__(self, pieces, activity_names, arecover):
+        """
+        ScheduleStream consumed by an asyncio task of the running loop instead of a worker thread.
+        pieces: async iterable of answer pieces, e.g. chat.astream_response
+        arecover(text, emitted): async recover
+        """
+        super().__init__(None, activity_names, None)
+        self.arecover = arecover
+        self.changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self.aconsume(pieces))
+
+    def add(self, entries):
+        super().add(entries)
+        self.changed.set()
+
+    def finish(self, error=None):
+        super().finish(error)
+        self.changed.set()
+
+    async def aconsume(self, pieces):
+        try:
+            async for piece in pieces:
+                self.take(piece)
+            if self.needs_recovery():
+                self.add(await self.arecover(self.parser.text, len(self.entries)))
+        except Exception as e:
+            self.finish(e)
+        else:
+            self.finish()
+
+    async def wait_for(self, predicate):
+        while not predicate():
+            self.changed.clear()
+            await self.changed.wait()
+
+    async def anext_entries(self):
+        await self.wait_for(lambda: self.done or self.read < len(self.entries))
+        return self.ready()
+
+    async def arest(self):
+        await self.wait_for(lambda: self.done)
+        if self.error is not None:
+            raise self.error
+        return self.ready()
+
+
+class SchedulePrefetch:
+    def __init__(self, day, weekday, generate):
+        """
+        The daily schedule of a coming day, generated in a worker thread while the current day is simulated.
+        day / weekday: what the schedule was asked for, Event only uses it for that day
+        generate(): the blocking request, e.g. SmartAgent.ask of the daily schedule prompt
+        """
+        self.day = day
+        self.weekday = weekday
+        self.schedule = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(generate,), daemon=True)
+        self.thread.start()
+
+    def run(self, generate):
+        try:
+            self.schedule = generate()
+        except Exception as e:
+            # the day then asks for its schedule as if nothing was prefetched
+            print(f"Prefetching the schedule of day {self.day} failed: {e!r}")
+        finally:
+            self.done.set()
+
+    def matches(self, day, weekday):
+        return self.day == day and self.weekday == weekday
+
+    def result(self):
+        """Wait for the schedule, None when the request failed"""
+        self.done.wait()
+        return self.schedule
+
+    async def aresult(self):
+        return await asyncio.to_thread(self.result)
+
+
+class AsyncSchedulePrefetch(SchedulePrefetch):
+    def __init__(self, day, weekday, agenerate):
+        """
+        SchedulePrefetch generated by an asyncio task of the running loop, e.g. over SmartAgent.aask,
+        so the request waits for the concurrency limit like any other.
+        """
+        self.day = day
+        self.weekday = weekday
+        self.schedule = None
+        self.task = asyncio.ensure_future(self.arun(agenerate))
+
+    async def arun(self, agenerate):
+        try:
+            self.schedule = await agenerate()
+        except Exception as e:
+            print(f"Prefetching the schedule of day {self.day} failed: {e!r}")
+
+    async def aresult(self):
+        await self.task
+        return self.schedule
@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import copy
+import json
+import os
+import time
+
+from src import backend, chat, utils
+from src.activity_catalog import ActivityCatalog
+from src.module import agent, event
+from src.path_cache import PathCache
+from src.profiler import Profiler
+from src.record_sink import RecordSink
+from src.record_store import build_vocabularies
+from src.request_policy import make_policy
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_inputs(base_dir=BASE_DIR, path_cache_dir=None):
+    """
+    Load configs, activity catalog, map, path fields, sensor index, record vocabularies and prompts once,
+    the result is shared by every household
+    path_cache_dir: persist the precomputed path fields there
+    """
+    with open(os.path.join(base_dir, "config/env_config.json"), 'r', encoding='utf-8') as file:
+        env_config = json.load(file)
+    with open(os.path.join(base_dir, "config/user_profile.json"), 'r', encoding='utf-8') as file:
+        user_profile = json.load(file)
+    with open(os.path.join(base_dir, "config/activity_config.json"), 'r', encoding='utf-8') as file:
+        activity_config = json.load(file)
+    map_matrix = utils.map_array_initialization(env_config)
+    return {
+        "env_config": env_config,
+        "user_profile": user_profile,
+        "activity_config": activity_config,
+        "activity_catalog": ActivityCatalog(activity_config, env_config),
+        "map_matrix": map_matrix,
+        "path_cache": PathCache(env_config, map_matrix, cache_dir=path_cache_dir),
+        "sensor_index": utils.build_sensor_index(env_config, map_matrix),
+        "vocabularies": build_vocabularies(env_config, activity_config),
+        "prompt_dict": utils.load_prompt_dict(os.path.join(base_dir, "prompt")),
+        "activity_str": utils.get_activity_str(activity_config),
+        "activity_names": [activity["activity_name"] for activity in activity_config["activity_config"]]
+    }
+
+
+def create_event(inputs, user_name, seed, llm_backend=None, save_dir=None, sink_format=None, compress=False,
+                 checkpoint_every=None, resume=False, compact_prompts=False, history_window=None,
+                 random_model="legacy", profile=False, prometheus=False, stream_schedules=False,
+                 prefetch_schedules=False):
+    """
+    Build one simulated household: a SmartAgent for user_name and its Event seeded with seed
+    sink_format: stream records to csv / jsonl / parquet files instead of writing per-day csv files
+    checkpoint_every: "activity" or "day", checkpoint the household to <record dir>/checkpoint.pkl
+    resume: continue from that checkpoint when it exists
+    compact_prompts / history_window: prompt compaction options of SmartAgent
+    random_model: "legacy" or "timeline" toilet / phone triggers of Event
+    profile: time the hot phases and write profile.json (and profile.prom with prometheus) next to the records
+    stream_schedules: simulate streamed schedules while they are generated, see Event
+    prefetch_schedules: generate the next day's schedule while the current day is simulated, see Event
+    """
+    user_config = copy.deepcopy(inputs["user_profile"]['user_config'][user_name])
+    user_config['user_name'] = user_name
+    user = agent.SmartAgent(user_config, inputs["activity_str"], inputs["prompt_dict"], backend=llm_backend,
+                            compact_prompts=compact_prompts, history_window=history_window,
+                            activity_names=inputs["activity_names"])
+    event_system = event.Event(agent=user, activity_config=inputs["activity_config"],
+                               env_config=inputs["env_config"], map_matrix=inputs["map_matrix"], seed=seed,
+                               save_dir=save_dir, path_cache=inputs["path_cache"],
+                               sensor_index=inputs["sensor_index"], vocabularies=inputs["vocabularies"],
+                               random_model=random_model, profiler=Profiler(profile, prometheus),
+                               catalog=inputs["activity_catalog"], stream_schedules=stream_schedules,
+                               prefetch_schedules=prefetch_schedules)
+    checkpoint_path = os.path.join(event_system.get_save_path(), "checkpoint.pkl")
+    restore = bool(checkpoint_every) and resume and os.path.exists(checkpoint_path)
+    if sink_format:
+        # stream files are only kept when the run continues from a checkpoint
+        event_system.sink = RecordSink(event_system.get_save_path(), format=sink_format, compress=compress,
+                                       resume=restore)
+    if checkpoint_every:
+        event_system.checkpoint_path = checkpoint_path
+        event_system.checkpoint_every = checkpoint_every
+        if restore:
+            event_system.load_checkpoint()
+    return event_system
+
+
+async def run_households(households, total_days, max_concurrency=None):
+    """
+    Run many households on one event loop.
+    Each household simulates its days in order, at most max_concurrency LLM requests are in flight.
+    """
+    chat.set_concurrency_limit(max_concurrency)
+    await asyncio.gather(*(household.arun_workflow(total_days) for household in households))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="simulate many households concurrently on one event loop")
+    parser.add_argument("--users", nargs="+", default=["RemoteWorker"])
+    parser.add_argument("--seeds", nargs="+", type=int, default=[1])
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--offline", action="store_true", help="use the offline stand-in instead of the LLM")
+    parser.add_argument("--latency", type=float, default=0.0, help="artificial latency of the offline stand-in")
+    parser.add_argument("--sink", choices=["csv", "jsonl", "parquet"], help="stream records instead of daily csv")
+    parser.add_argument("--gzip", action="store_true", help="gzip the streamed csv / jsonl records")
+    parser.add_argument("--compact-prompts", action="store_true", help="compact schedule encoding in the prompts")
+    parser.add_argument("--history-window", type=int, help="completed activities kept in the prompts")
+    parser.add_argument("--random-model", choices=["legacy", "timeline"], default="legacy",
+                        help="toilet / phone trigger model")
+    parser.add_argument("--profile", action="store_true", help="write a profile.json of every household")
+    parser.add_argument("--prometheus", action="store_true", help="also write the profile as profile.prom")
+    parser.add_argument("--stream", action="store_true", help="stream schedules and simulate them as they arrive")
+    parser.add_argument("--prefetch", action="store_true", help="request the next day's schedule during the day")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. a local backend.OfflineChatServer")
+    parser.add_argument("--rate-limit", type=float, help="LLM requests per second")
+    parser.add_argument("--burst", type=float, help="requests allowed at once, defaults to one second of them")
+    parser.add_argument("--timeout", type=float, help="seconds per LLM request attempt")
+    parser.add_argument("--max-retries", type=int, help="retries after a rate limit, server error or timeout")
+    parser.add_argument("--hedge-percentile", type=float,
+                        help="send a duplicate request when one is slower than this latency percentile")
+    args = parser.parse_args()
+
+    request_policy = make_policy(args.rate_limit, args.burst, args.timeout, args.max_retries, args.hedge_percentile)
+    client_options = {"timeout": args.timeout, "max_retries": 0} if request_policy is not None else {}
+    chat.set_backend(backend.make_backend("offline" if args.offline else "openai", latency=args.latency,
+                                          base_url=args.base_url, **client_options))
+    chat.set_request_policy(request_policy)
+    simulation_inputs = load_inputs()
+    event_systems = [create_event(simulation_inputs, user_name, seed, sink_format=args.sink, compress=args.gzip,
+                                  compact_prompts=args.compact_prompts, history_window=args.history_window,
+                                  random_model=args.random_model, profile=args.profile or args.prometheus,
+                                  prometheus=args.prometheus, stream_schedules=args.stream,
+                                  prefetch_schedules=args.prefetch)
+                     for user_name in args.users for seed in args.seeds]
+    start = time.perf_counter()
+    asyncio.run(run_households(event_systems, args.days, args.max_concurrency))
+    print(f"{len(event_systems)} households finished in {time.perf_counter() - start:.2f}s")
+    if request_policy is not None:
+        print(json.dumps(request_policy.metrics.summary(), indent=2))
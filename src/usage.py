@@ -0,0 +1,93 @@
+import json
+import threading
+
+USAGE_FIELDS = ["calls", "cached", "prompt_tokens", "completion_tokens", "latency", "max_latency"]
+
+
+def empty_usage():
+    return {field: 0 for field in USAGE_FIELDS}
+
+
+def add_usage(total, usage):
+    for field in USAGE_FIELDS:
+        if field == "max_latency":
+            total[field] = max(total[field], usage[field])
+        else:
+            total[field] += usage[field]
+    return total
+
+
+class UsageTracker:
+    def __init__(self):
+        """
+        Token and latency accounting of the LLM calls of one agent, per day and per call type.
+        chat.get_response records a call when it is given a tracker, cache hits count as cached calls.
+        """
+        self.day = None
+        self.days = {}
+        # prefetched schedules are recorded from a worker thread
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def set_day(self, day):
+        self.day = day
+
+    def for_day(self, day):
+        """Tracker recording into this one under a fixed day, for calls made ahead of their day"""
+        return DayUsage(self, day)
+
+    def record(self, call_type, prompt_tokens, completion_tokens, latency, cached=False, day=None):
+        call = {
+            "calls": 1,
+            "cached": int(cached),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency": latency,
+            "max_latency": latency
+        }
+        with self._lock:
+            day_usage = self.days.setdefault(self.day if day is None else day, {})
+            add_usage(day_usage.setdefault(call_type or "other", empty_usage()), call)
+
+    def day_summary(self, day):
+        """{call_type: totals} of one day plus an "all" row"""
+        summary = {call_type: dict(totals) for call_type, totals in self.days.get(day, {}).items()}
+        summary["all"] = empty_usage()
+        for call_type, totals in self.days.get(day, {}).items():
+            add_usage(summary["all"], totals)
+        return summary
+
+    def summary(self):
+        """Per day and whole-run totals"""
+        run = {}
+        for day_usage in self.days.values():
+            for call_type, totals in day_usage.items():
+                add_usage(run.setdefault(call_type, empty_usage()), totals)
+        run["all"] = empty_usage()
+        for call_type, totals in list(run.items()):
+            if call_type != "all":
+                add_usage(run["all"], totals)
+        return {"days": {str(day): self.day_summary(day) for day in self.days}, "run": run}
+
+    def save(self, path):
+        with self._lock:
+            summary = self.summary()
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, ensure_ascii=False, indent=2)
+
+
+class DayUsage:
+    def __init__(self, tracker, day):
+        self.tracker = tracker
+        self.day = day
+
+    def record(self, call_type, prompt_tokens, completion_tokens, latency, cached=False):
+        self.tracker.record(call_type, prompt_tokens, completion_tokens, latency, cached, day=self.day)
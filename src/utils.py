@@ -1,102 +1,82 @@
 import json
+import re
 import numpy as np
-import matplotlib
 from collections import deque
-
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-from matplotlib.table import Table
 import os
 
-plt.rcParams["font.family"] = ["SimHei"]  # window
-
 
-# plt.rcParams["font.family"] = ["Heiti TC", "STHeiti"]  # mac
+def map_initialization(data):
+    """Map as a list of lists, a copy of map_array_initialization kept for list-based callers"""
+    return map_array_initialization(data).tolist()
 
 
-def map_initialization(data):
+def map_array_initialization(data):
+    """
+    Map as a compact numpy int8 grid
+    -1: wall, 1: valid area, 2: door sensor, 3: motion sensor, 4: control device, 5: facility
+    """
     xmin = data['environment_config']['Layout']['xmin']
     xhigh = data['environment_config']['Layout']['xhigh']
     ymin = data['environment_config']['Layout']['ymin']
     yhigh = data['environment_config']['Layout']['yhigh']
 
-    map_matrix = [[-1] * (yhigh - ymin + 1) for _ in range(xhigh - xmin + 1)]
+    map_array = np.full((xhigh - xmin + 1, yhigh - ymin + 1), -1, dtype=np.int8)
 
     # set area
     sector = data['environment_config']['valid_area']
     for key, value in sector.items():
         for _, sector0 in value['Scope'].items():
-            xmin = sector0['xmin']
-            xhigh = sector0['xhigh']
-            ymin = sector0['ymin']
-            yhigh = sector0['yhigh']
-            for i in range(xmin, xhigh + 1):
-                for j in range(ymin, yhigh + 1):
-                    map_matrix[i][j] = 1
+            map_array[sector0['xmin']:sector0['xhigh'] + 1, sector0['ymin']:sector0['yhigh'] + 1] = 1
 
     # set sensor
     sensor = data['environment_config']['sensor']
     for key, value in sensor.items():
-        x = value['x']
-        y = value['y']
         if 'Door' in key:
-            map_matrix[x][y] = 2
+            map_array[value['x'], value['y']] = 2
         elif 'Motion' in key:
-            map_matrix[x][y] = 3
+            map_array[value['x'], value['y']] = 3
         else:
             raise Exception("no such sensor type")
 
     # set device
     device = data['environment_config']['control_device']
     for key, value in device.items():
-        x = value['x']
-        y = value['y']
-        map_matrix[x][y] = 4
+        map_array[value['x'], value['y']] = 4
 
     # set facility
     device = data['environment_config']['Facility']
     for key, value in device.items():
-        x = value['x']
-        y = value['y']
-        map_matrix[x][y] = 5
-    return map_matrix
-
-
-def create_color_table(matrix):
-    # map visualization
-    # color map
-    color_map = {
-        1: "#FFFFFF",  # White
-        2: "#FFFF00",  # Yellow
-        3: "#00FA9A",  # Green
-        4: "#00BFFF",  # Blue
-        5: "#DC143C",  # Red
-        -1: "#808080"  # Gray
-    }
+        map_array[value['x'], value['y']] = 5
+    return map_array
 
-    n_rows, n_cols = len(matrix), len(matrix[0])
 
-    fig, ax = plt.subplots(figsize=(n_cols, n_rows))
-    ax.set_axis_off()
+def passable_mask(map_matrix):
+    """Boolean grid of the cells that can be walked on"""
+    return np.asarray(map_matrix) != -1
 
-    table = Table(ax, bbox=[0, 0, 1, 1])
 
-    cell_width = 1.0 / n_cols
-    cell_height = 1.0 / n_rows
-
-    for i in range(n_rows):
-        for j in range(n_cols):
-            value = matrix[i][j]
-            if value not in color_map:
-                raise ValueError(f"The matrix value must be an integer between 1 and 5: {value}")
-
-            table.add_cell(i, j, cell_width, cell_height, text=value,
-                           loc='center', facecolor=color_map[value])
+def build_sensor_index(data, map_matrix):
+    """
+    Cell to sensor lookup table: sensor_index[x][y] is the tuple of sensors fired by standing on (x, y),
+    i.e. every sensor within Chebyshev distance 1, in env_config order.
+    """
+    rows = len(map_matrix)
+    cols = len(map_matrix[0]) if rows > 0 else 0
+    sensor_index = [[() for _ in range(cols)] for _ in range(rows)]
+    sensor = data['environment_config']['sensor']
+    for key, value in sensor.items():
+        x = value['x']
+        y = value['y']
+        for i in range(max(x - 1, 0), min(x + 1, rows - 1) + 1):
+            for j in range(max(y - 1, 0), min(y + 1, cols - 1) + 1):
+                sensor_index[i][j] = sensor_index[i][j] + (key,)
+    return sensor_index
 
-    ax.add_table(table)
 
-    plt.title("Matrix Color Chart")
-    plt.show()
+def create_color_table(matrix):
+    # map visualization, matplotlib is only imported here, see src.visualization
+    from src import visualization
+    visualization.create_color_table(matrix)
 
 
 def load_prompt_dict(folder_path):
@@ -193,7 +173,7 @@ def move_to_area(position_from, area_to, map_matrix):
 
             # Check if the new position is valid and has not been accessed
             if (0 <= nx < rows and 0 <= ny < cols and
-                    not visited[nx][ny] and is_valid_position([nx, ny], map_matrix)):
+                    not visited[nx][ny] and map_matrix[nx][ny] != -1):
                 visited[nx][ny] = True
                 parent[nx][ny] = (x, y)
                 distance[nx][ny] = distance[x][y] + 1
@@ -259,7 +239,7 @@ def move_to_position(position_from, position_to, map_matrix):
             nx, ny = x + dx, y + dy
 
             if (0 <= nx < rows and 0 <= ny < cols and
-                    not visited[nx][ny] and is_valid_position([nx, ny], map_matrix)):
+                    not visited[nx][ny] and map_matrix[nx][ny] != -1):
                 visited[nx][ny] = True
                 parent[nx][ny] = (x, y)
                 queue.append((nx, ny))
@@ -329,6 +309,30 @@ def int_time2str_time(int_time):
     return f"{hour:02d}:{minute:02d}"
 
 
+def format_schedule(schedule, window=None):
+    """
+    Compact prompt encoding of a schedule: "start-end activity_name" entries separated by "; "
+    window: keep only the last window entries, the dropped ones are marked by a leading "..."
+    """
+    schedule = list(schedule)
+    omitted = window is not None and len(schedule) > window
+    if omitted:
+        schedule = schedule[len(schedule) - window:] if window > 0 else []
+    entries = [f"{activity['start_time']}-{activity['end_time']} {activity['activity_name']}" for activity in schedule]
+    return "; ".join((["..."] if omitted else []) + entries)
+
+
+def parse_compact_schedule(text):
+    """Inverse of format_schedule, entries that do not match the format are skipped"""
+    schedule = []
+    for entry in text.split(";"):
+        match = re.match(r"\s*(\d{1,2}:\d{2})-(\d{1,2}:\d{2}) (.+?)\s*$", entry)
+        if match:
+            schedule.append({"activity_name": match.group(3), "start_time": match.group(1),
+                             "end_time": match.group(2)})
+    return schedule
+
+
 def adjust_toilet_prob(toilet_prob, diff_time):
     # Adjust the probability based on the time of the last toilet.
     if diff_time < 1:
@@ -0,0 +1,54 @@
+import os
+
+
+def load_pyplot():
+    """
+    Import matplotlib on first use, the simulator itself never needs it.
+    The Tk backend is only selected when MPLBACKEND does not name another one (e.g. Agg on headless nodes).
+    """
+    import matplotlib
+    if "MPLBACKEND" not in os.environ:
+        matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    from matplotlib.table import Table
+    plt.rcParams["font.family"] = ["SimHei"]  # window
+    # plt.rcParams["font.family"] = ["Heiti TC", "STHeiti"]  # mac
+    return plt, Table
+
+
+def create_color_table(matrix):
+    # map visualization
+    plt, Table = load_pyplot()
+    # color map
+    color_map = {
+        1: "#FFFFFF",  # White
+        2: "#FFFF00",  # Yellow
+        3: "#00FA9A",  # Green
+        4: "#00BFFF",  # Blue
+        5: "#DC143C",  # Red
+        -1: "#808080"  # Gray
+    }
+
+    n_rows, n_cols = len(matrix), len(matrix[0])
+
+    fig, ax = plt.subplots(figsize=(n_cols, n_rows))
+    ax.set_axis_off()
+
+    table = Table(ax, bbox=[0, 0, 1, 1])
+
+    cell_width = 1.0 / n_cols
+    cell_height = 1.0 / n_rows
+
+    for i in range(n_rows):
+        for j in range(n_cols):
+            value = matrix[i][j]
+            if value not in color_map:
+                raise ValueError(f"The matrix value must be an integer between 1 and 5: {value}")
+
+            table.add_cell(i, j, cell_width, cell_height, text=value,
+                           loc='center', facecolor=color_map[value])
+
+    ax.add_table(table)
+
+    plt.title("Matrix Color Chart")
+    plt.show()
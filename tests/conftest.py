@@ -0,0 +1,27 @@
+import pytest
+
+from src.backend import LLMBackend
+from src.module.agent import SmartAgent
+
+
+class ScriptedBackend(LLMBackend):
+    """Answers every request with the next scripted answer and keeps the prompts it was sent"""
+    model = "scripted"
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.prompts = []
+
+    def complete_with_usage(self, messages):
+        self.prompts.append(messages[-1]["content"])
+        return self.answers.pop(0), None
+
+
+@pytest.fixture
+def scripted_agent():
+    """Factory of SmartAgents asking a ScriptedBackend of the given answers"""
+    def make(answers, activity_names=("Sleeping",), max_reasks=2):
+        user_config = {"user_name": "Tester", "Introduction": "", "Characteristics": []}
+        return SmartAgent(user_config, ", ".join(activity_names), {}, backend=ScriptedBackend(answers),
+                          activity_names=list(activity_names), max_reasks=max_reasks)
+    return make
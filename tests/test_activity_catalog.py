@@ -0,0 +1,84 @@
+import copy
+import random
+
+import pytest
+
+from src.activity_catalog import ActivityCatalog
+from src.simulation import create_event, load_inputs
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    return load_inputs()
+
+
+def legacy_find_activity(activity_config, activity_name):
+    """The linear scan of activity_config the catalog replaced"""
+    for activity in activity_config["activity_config"]:
+        if activity.get("activity_name") == activity_name:
+            return activity
+    raise Exception(f"cant find activity {activity_name}")
+
+
+def legacy_event_list(activity, activity_name, user_config, rng, duration):
+    """activity2event_list over the config dicts, with the same random draws"""
+    duration_mapping = {"Movement": 1, "control": 1, "execution": duration}
+    activity = activity["event_sequence"]
+    if activity_name != 'Cooking':
+        event_input_list = activity["normal"]
+    else:
+        rand = rng.random()
+        cook_prob = user_config["Parameter"]["Cooking"]["Probability"]
+        if rand < cook_prob["Heating"]:
+            event_input_list = activity["Heating"]
+        elif rand < cook_prob["Heating"] + cook_prob["Stewing"]:
+            event_input_list = activity["Stewing"]
+        else:
+            event_input_list = activity["Stir-frying"]
+    for event_input in event_input_list:
+        if event_input.get("attribute") in duration_mapping:
+            if event_input.get("Generate") == "random":
+                event_input["duration"] = rng.randint(3, 10)
+            else:
+                event_input["duration"] = duration_mapping[event_input.get("attribute")]
+        event_input["activity_name"] = activity_name
+    return [event_input.copy() for event_input in event_input_list]
+
+
+def test_catalog_keeps_every_step_of_the_config(inputs):
+    catalog = ActivityCatalog(inputs["activity_config"], inputs["env_config"])
+    names = {activity["activity_name"] for activity in inputs["activity_config"]["activity_config"]}
+    assert len(catalog) == len(names) and all(name in catalog for name in names)
+    for name in names:
+        activity = legacy_find_activity(inputs["activity_config"], name)
+        for variant_name, steps in activity["event_sequence"].items():
+            # same keys, values and key order as the config steps
+            assert [list(template.fields) for template in catalog.get(name).variant(variant_name)] \
+                == [list(step.items()) for step in steps]
+    assert catalog.get("Flying") is None
+    with pytest.raises(KeyError):
+        catalog.get("Cooking").variant("Baking")
+
+
+def test_catalog_positions(inputs):
+    catalog = ActivityCatalog(inputs["activity_config"], inputs["env_config"])
+    env = inputs["env_config"]["environment_config"]
+    for group in ("Facility", "control_device"):
+        for name, value in env[group].items():
+            assert catalog.position(name) == (value['x'], value['y'])
+
+
+@pytest.mark.parametrize("user_name", ["OldMan", "RemoteWorker"])
+def test_event_lists_match_the_config_scan(inputs, user_name):
+    household = create_event(inputs, user_name, 3)
+    activity_config = copy.deepcopy(inputs["activity_config"])
+    rng = random.Random(11)
+    for name in {activity["activity_name"] for activity in activity_config["activity_config"]}:
+        # Cooking draws its variant: try it often enough to see each of them
+        for _ in range(20 if name == "Cooking" else 1):
+            household.rng.setstate(rng.getstate())
+            expected = legacy_event_list(legacy_find_activity(activity_config, name), name,
+                                         household.agent.user_config, rng, 30)
+            event_list = household.activity2event_list(household.find_activity(name), name, 30)
+            # the key order decides the csv columns of the event records
+            assert [list(event.items()) for event in event_list] == [list(event.items()) for event in expected]
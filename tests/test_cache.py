@@ -0,0 +1,127 @@
+import itertools
+
+import pytest
+
+from src import cache as cache_module
+from src import chat
+from src.backend import OfflineBackend
+from src.cache import CacheMissError, ResponseCache, make_cache_key
+from src.simulation import create_event, load_inputs
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing time.time of the cache module, access order decides LRU eviction"""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(cache_module.time, "time", lambda: float(next(ticks)))
+
+
+@pytest.fixture
+def response_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    yield cache
+    cache.close()
+
+
+def test_cache_key_covers_every_part_of_the_request():
+    key = make_cache_key("model", "system", "prompt")
+    assert key == make_cache_key("model", "system", "prompt")
+    assert len({key, make_cache_key("other", "system", "prompt"), make_cache_key("model", "other", "prompt"),
+                make_cache_key("model", "system", "other")}) == 4
+
+
+def test_cache_key_scope():
+    unscoped = make_cache_key("model", "system", "prompt")
+    scoped = make_cache_key("model", "system", "prompt", ["OldMan", 1, 5, 0])
+    assert scoped != unscoped
+    assert scoped != make_cache_key("model", "system", "prompt", ["OldMan", 2, 5, 0])
+    assert scoped != make_cache_key("model", "system", "prompt", ["OldMan", 1, 12, 0])
+    assert scoped != make_cache_key("model", "system", "prompt", ["OldMan", 1, 5, 1])
+    assert make_cache_key("model", "system", "prompt", None) == unscoped
+
+
+def test_get_and_put(response_cache, tmp_path):
+    assert response_cache.get("model", "system", "prompt") is None
+    response_cache.put("model", "system", "prompt", "answer")
+    assert response_cache.get("model", "system", "prompt") == "answer"
+    assert response_cache.get("model", "system", "prompt", ["OldMan", 1, 5, 0]) is None
+    assert response_cache.stats()["hits"] == 1 and response_cache.stats()["misses"] == 2
+    # the sqlite file outlives the instance
+    reopened = ResponseCache(str(tmp_path))
+    assert reopened.get("model", "system", "prompt") == "answer"
+    reopened.close()
+
+
+def test_replay_miss_raises(tmp_path):
+    ResponseCache(str(tmp_path)).put("model", "system", "known", "answer")
+    replay = ResponseCache(str(tmp_path), replay=True)
+    assert replay.get("model", "system", "known") == "answer"
+    with pytest.raises(CacheMissError):
+        replay.get("model", "system", "unknown")
+    replay.close()
+
+
+def test_lru_eviction_by_entries(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), max_entries=2)
+    cache.put("model", "system", "a", "A")
+    cache.put("model", "system", "b", "B")
+    # reading a makes b the least recently used
+    assert cache.get("model", "system", "a") == "A"
+    cache.put("model", "system", "c", "C")
+    assert len(cache) == 2
+    assert cache.get("model", "system", "b") is None
+    assert cache.get("model", "system", "a") == "A"
+    assert cache.get("model", "system", "c") == "C"
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+
+def test_lru_eviction_by_bytes(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path), max_bytes=10)
+    cache.put("model", "system", "a", "x" * 4)
+    cache.put("model", "system", "b", "y" * 4)
+    cache.put("model", "system", "c", "z" * 4)
+    assert cache.stats()["bytes"] <= 10
+    assert cache.get("model", "system", "a") is None
+    assert cache.get("model", "system", "c") == "zzzz"
+    cache.close()
+
+
+def test_agent_calls_are_scoped_per_household_day_and_occurrence(response_cache, monkeypatch, scripted_agent):
+    monkeypatch.setattr(chat, "response_cache", response_cache)
+    first = scripted_agent(["first answer", "second answer"])
+    first.cache_scope = ["Tester", 1]
+    first.usage.set_day(5)
+    assert chat.get_response("same prompt", first.backend, cache_scope=first.call_scope("same prompt", 5)) \
+        == "first answer"
+    # the same prompt again on the same day is a new call, not the cached answer
+    assert chat.get_response("same prompt", first.backend, cache_scope=first.call_scope("same prompt", 5)) \
+        == "second answer"
+    other = scripted_agent(["other household"])
+    other.cache_scope = ["Tester", 2]
+    assert chat.get_response("same prompt", other.backend, cache_scope=other.call_scope("same prompt", 5)) \
+        == "other household"
+    # a rerun of the first household replays its answers in order from the cache
+    rerun = scripted_agent([])
+    rerun.cache_scope = ["Tester", 1]
+    assert [chat.get_response("same prompt", rerun.backend, cache_scope=rerun.call_scope("same prompt", 5))
+            for _ in range(2)] == ["first answer", "second answer"]
+
+
+def test_replay_of_an_unrecorded_call_raises(tmp_path, monkeypatch, scripted_agent):
+    monkeypatch.setattr(chat, "response_cache", ResponseCache(str(tmp_path), replay=True))
+    with pytest.raises(CacheMissError):
+        chat.get_response("never recorded", scripted_agent(["unused"]).backend)
+
+
+def test_household_reruns_replay_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat, "backend", OfflineBackend())
+    inputs = load_inputs()
+    for replay in (False, True):
+        monkeypatch.setattr(chat, "response_cache", ResponseCache(str(tmp_path / "cache"), replay=replay))
+        household = create_event(inputs, "OldMan", 3, save_dir=str(tmp_path / f"record{replay}"))
+        # a replay raises on any call the first run did not record
+        household.run_workflow(5)
+        chat.response_cache.close()
+    # the random record directory number of an unseeded household is not part of its cache keys
+    assert create_event(inputs, "OldMan", None, save_dir=str(tmp_path)).agent.cache_scope == ["OldMan"]
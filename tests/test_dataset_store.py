@@ -0,0 +1,32 @@
+import pytest
+
+from src import backend, chat
+from src.dataset_store import DatasetStore, compact
+from src.simulation import create_event, load_inputs
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    return load_inputs()
+
+
+def simulate(inputs, save_dir, seed, days=6):
+    create_event(inputs, "OldMan", seed, save_dir=str(save_dir)).run_workflow(days)
+
+
+def test_compact_indexes_every_run_day(inputs, tmp_path, monkeypatch):
+    monkeypatch.setattr(chat, "backend", backend.OfflineBackend())
+    for seed in (3, 4):
+        simulate(inputs, tmp_path / "corpus" / "OldMan" / str(seed), seed)
+    compact(str(tmp_path / "corpus"), str(tmp_path / "store"))
+    store = DatasetStore(str(tmp_path / "store"))
+    assert sorted(store.keys()) == [("OldMan", seed, day) for seed in (3, 4) for day in (5, 6)]
+
+
+def test_compact_rejects_a_day_simulated_twice(inputs, tmp_path, monkeypatch):
+    monkeypatch.setattr(chat, "backend", backend.OfflineBackend())
+    simulate(inputs, tmp_path / "corpus" / "OldMan" / "3", 3)
+    # a replay of day 5 of the same seed, next to the batch run
+    simulate(inputs, tmp_path / "corpus" / "OldMan" / "day5" / "seed3", 3, days=5)
+    with pytest.raises(ValueError, match="duplicate day 5 of user OldMan seed 3"):
+        compact(str(tmp_path / "corpus"), str(tmp_path / "store"))
@@ -0,0 +1,46 @@
+import json
+import os
+
+import pytest
+
+from src import utils
+from src.path_cache import PathCache
+from src.simulation import BASE_DIR
+
+
+@pytest.fixture(scope="module")
+def env_config():
+    with open(os.path.join(BASE_DIR, "config/env_config.json"), 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def fixed_positions(env_config):
+    layout = env_config["environment_config"]
+    return [[value['x'], value['y']] for group in ("Facility", "control_device") for value in layout[group].values()]
+
+
+@pytest.mark.parametrize("initialization", [utils.map_initialization, utils.map_array_initialization])
+def test_paths_match_the_bfs_for_every_fixed_target(env_config, initialization):
+    # every Facility / control_device position to every other one and to every valid_area
+    map_matrix = initialization(env_config)
+    path_cache = PathCache(env_config, map_matrix)
+    valid_area = env_config["environment_config"]["valid_area"]
+    positions = fixed_positions(env_config)
+    for position_from in positions:
+        for position_to in positions:
+            assert path_cache.move_to_position(position_from, position_to) \
+                == utils.move_to_position(position_from, position_to, map_matrix)
+        for area_name, area in valid_area.items():
+            assert path_cache.move_to_area(position_from, area_name) \
+                == utils.move_to_area(position_from, area["Scope"], map_matrix)
+
+
+@pytest.mark.parametrize("initialization", [utils.map_initialization, utils.map_array_initialization])
+def test_fields_round_trip_through_the_cache_dir(env_config, tmp_path, initialization):
+    map_matrix = initialization(env_config)
+    built = PathCache(env_config, map_matrix, cache_dir=str(tmp_path))
+    loaded = PathCache(env_config, map_matrix, cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 1
+    for position_from in fixed_positions(env_config):
+        for area_name in env_config["environment_config"]["valid_area"]:
+            assert loaded.move_to_area(position_from, area_name) == built.move_to_area(position_from, area_name)
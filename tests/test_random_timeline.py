@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from src import backend, chat
+from src.random_timeline import MINUTES_PER_DAY, RandomTimeline
+from src.simulation import create_event, load_inputs
+
+PARAMS = {"Toilet": {"Probability": {"Daytime": 0.3, "Sleeping": 0.05}},
+          "Phone": {"Probability": {"Weekday": 0.4, "Weekend": 0.2}}}
+SCHEDULE = [{"activity_name": "Sleeping", "start_time": "22:00", "end_time": "7:00"}]
+
+
+def timeline(start, toilet=(), phone=(), length=300):
+    """RandomTimeline of events at the given grid minutes"""
+    toilet_grid, phone_grid = np.zeros(length, dtype=bool), np.zeros(length, dtype=bool)
+    toilet_grid[list(toilet)] = True
+    phone_grid[list(phone)] = True
+    return RandomTimeline(start, toilet_grid, phone_grid)
+
+
+def sample(seed, start_minute=480):
+    return RandomTimeline.sample(PARAMS, 5, start_minute, SCHEDULE, 120, np.random.default_rng(seed))
+
+
+def test_sampling_is_seeded():
+    first, again, other = sample(3), sample(3), sample(4)
+    assert first.toilet.size and first.phone.size
+    assert np.array_equal(first.toilet, again.toilet) and np.array_equal(first.phone, again.phone)
+    assert not (np.array_equal(first.toilet, other.toilet) and np.array_equal(first.phone, other.phone))
+    # absolute minutes from the start of the sampled day and minute on
+    assert first.start == 5 * MINUTES_PER_DAY + 480 and first.end == first.start + 2 * MINUTES_PER_DAY
+    assert first.toilet.min() >= first.start and first.toilet.max() < first.end
+
+
+def test_keep_pending_takes_over_unconsumed_events_before_the_new_start():
+    previous = timeline(0, toilet=[10, 50, 200], phone=[30])
+    previous.consumed = 20
+    resampled = timeline(100, toilet=[50])
+    resampled.keep_pending(previous)
+    # 10 was consumed, 200 lies in the range the new timeline sampled again
+    assert resampled.toilet.tolist() == [50, 150]
+    assert resampled.phone.tolist() == [30]
+    assert resampled.next_event(25, 1000) == (30, "phone_activity")
+    assert resampled.next_event(31, 1000) == (50, "toilet_activity")
+
+
+def test_next_event_defers_missed_events_to_now():
+    events = timeline(0, toilet=[10, 60], phone=[10, 40, 50])
+    # both fell before now: one interruption at now, the toilet visit, the other one is dropped
+    assert events.next_event(25, 100) == (25, "toilet_activity")
+    # the next one is not due before end
+    assert events.next_event(30, 40) == (None, None)
+    assert events.next_event(30, 100) == (40, "phone_activity")
+    assert events.next_event(45, 100, phone_allowed=False) == (60, "toilet_activity")
+    assert events.next_event(70, 300) == (None, None)
+
+
+@pytest.mark.parametrize("seed", [3, 7])
+def test_timeline_households_are_reproducible(tmp_path, monkeypatch, seed):
+    monkeypatch.setattr(chat, "backend", backend.OfflineBackend())
+    inputs = load_inputs()
+    runs = []
+    for run in range(2):
+        household = create_event(inputs, "OldMan", seed, save_dir=str(tmp_path / str(run)), random_model="timeline")
+        household.run_workflow(5)
+        runs.append(list(household.record))
+    assert runs[0] and runs[0] == runs[1]
@@ -0,0 +1,107 @@
+import csv
+import gzip
+import json
+import os
+
+import pytest
+
+from src import backend, chat
+from src.record_sink import RecordSink
+from src.simulation import create_event, load_inputs
+
+
+def record(minute):
+    return {"Day": "Monday", "Hour": f"{minute // 60:02d}:{minute % 60:02d}", "sensor_type": "BedroomPIR",
+            "sensor_state": "ON", "device_type": "", "device_state": "", "activity": "Sleeping"}
+
+
+def read_rows(sink, stream="record"):
+    opener = gzip.open if sink.compress else open
+    with opener(sink.path(stream), 'rt', encoding='utf-8', newline='') as file:
+        if sink.format == "csv":
+            return list(csv.DictReader(file))
+        return [json.loads(line) for line in file]
+
+
+@pytest.mark.parametrize("format, compress", [("csv", False), ("jsonl", False), ("csv", True), ("jsonl", True)])
+def test_truncate_drops_rows_after_the_checkpoint(tmp_path, format, compress):
+    sink = RecordSink(str(tmp_path), format=format, compress=compress, buffer_size=3)
+    for minute in range(5):
+        sink.write("record", 5, record(minute))
+    offsets = sink.checkpoint()
+    # flushed and buffered rows after the checkpoint are both dropped
+    for minute in range(5, 12):
+        sink.write("record", 5, record(minute))
+    sink.truncate(offsets)
+    sink.write("record", 6, record(100))
+    sink.close()
+    rows = read_rows(sink)
+    assert [row["Hour"] for row in rows] == ["00:00", "00:01", "00:02", "00:03", "00:04", "01:40"]
+    assert str(rows[-1]["day"]) == "6"
+
+
+def test_checkpoint_offsets_cover_every_stream(tmp_path):
+    sink = RecordSink(str(tmp_path))
+    sink.write("record", 5, record(0))
+    offsets = sink.checkpoint()
+    assert set(offsets) == {"record", "event_record", "done_schedule"}
+    assert offsets["record"] == os.path.getsize(sink.path("record"))
+    assert offsets["event_record"] == 0
+
+
+def test_parquet_cannot_be_resumed(tmp_path):
+    sink = RecordSink(str(tmp_path), format="parquet")
+    assert sink.checkpoint() is None
+    with pytest.raises(ValueError):
+        sink.truncate(None)
+
+
+def test_new_sink_starts_the_stream_files_over(tmp_path):
+    failed = RecordSink(str(tmp_path), buffer_size=1)
+    failed.write("record", 5, record(0))
+    failed.write("record", 5, record(1))
+    # a resumed sink keeps the files for truncate, a new run removes them
+    assert len(read_rows(RecordSink(str(tmp_path), resume=True))) == 2
+    sink = RecordSink(str(tmp_path))
+    assert not os.path.exists(sink.path("record"))
+    sink.write("record", 5, record(2))
+    sink.close()
+    assert [row["Hour"] for row in read_rows(sink)] == ["00:02"]
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    return load_inputs()
+
+
+def run_household(inputs, save_dir, resume=False, fail_at_waiting=None):
+    event_system = create_event(inputs, "OldMan", 3, save_dir=save_dir, sink_format="csv", checkpoint_every="day",
+                                resume=resume)
+    event_system.sink.buffer_size = 50
+    if fail_at_waiting is not None:
+        calls = []
+
+        def judge_waiting_event(*args):
+            calls.append(args)
+            if len(calls) > fail_at_waiting:
+                raise RuntimeError("simulated crash")
+            return type(event_system.agent).judge_waiting_event(event_system.agent, *args)
+
+        event_system.agent.judge_waiting_event = judge_waiting_event
+    event_system.run_workflow(6)
+    return event_system
+
+
+@pytest.mark.parametrize("fail_at_waiting", [0, 3])
+def test_resume_after_a_crash_matches_an_uninterrupted_run(inputs, tmp_path, monkeypatch, fail_at_waiting):
+    monkeypatch.setattr(chat, "backend", backend.OfflineBackend())
+    clean_dir, crashed_dir = str(tmp_path / "clean"), str(tmp_path / "crashed")
+    clean = run_household(inputs, clean_dir)
+    with pytest.raises(RuntimeError):
+        run_household(inputs, crashed_dir, fail_at_waiting=fail_at_waiting)
+    # 0: flushed rows but no checkpoint yet, 3: a day checkpoint to truncate back to
+    assert os.path.getsize(os.path.join(crashed_dir, "record.csv")) > 0
+    assert os.path.exists(os.path.join(crashed_dir, "checkpoint.pkl")) == (fail_at_waiting > 0)
+    resumed = run_household(inputs, crashed_dir, resume=True)
+    for stream in ("record", "event_record", "done_schedule"):
+        assert read_rows(resumed.sink, stream) == read_rows(clean.sink, stream)
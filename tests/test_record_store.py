@@ -0,0 +1,63 @@
+import pytest
+
+from src import backend, chat
+from src.record_store import EventRecordStore, RecordStore, Vocabulary
+from src.simulation import create_event, load_inputs
+
+
+class ListSink:
+    """Sink keeping the rows Event hands to a RecordSink as they are, the legacy list-of-dicts records"""
+
+    def __init__(self):
+        self.rows = {"record": [], "event_record": [], "done_schedule": []}
+
+    def write(self, stream, day, row):
+        self.rows[stream].append(dict(row))
+
+    def end_day(self, day):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_vocabulary_codes():
+    vocabulary = Vocabulary(["ON", "OFF"])
+    assert vocabulary.encode("") == 0
+    assert [vocabulary.encode("OFF"), vocabulary.encode("ON")] == [2, 1]
+    # unseen values are added on the fly
+    assert vocabulary.encode("DIM") == 3 and vocabulary.decode(3) == "DIM"
+    assert len(vocabulary) == 4
+
+
+def test_stores_round_trip_rows_with_unseen_values():
+    vocabularies = {name: Vocabulary() for name in ("weekday", "sensor", "device", "state", "activity",
+                                                    "event_template")}
+    records, events = RecordStore(vocabularies), EventRecordStore(vocabularies)
+    rows = [{"Day": "Monday", "Hour": "00:00", "sensor_type": "BedroomPIR", "sensor_state": "ON",
+             "device_type": "", "device_state": "", "activity": "Sleeping"},
+            {"Day": "Sunday", "Hour": "23:59", "sensor_type": "", "sensor_state": "",
+             "device_type": "TV", "device_state": "OFF", "activity": "Watching TV"}]
+    event_rows = [{"type": "move", "target": "Bed", "duration": 0, "activity_name": "Sleeping",
+                   "start_time": "00:00"},
+                  {"type": "stay", "duration": 420, "activity_name": "Sleeping", "start_time": "00:01"}]
+    for row in rows:
+        records.append(row)
+    for row in event_rows:
+        events.append(row)
+    assert list(records) == rows
+    assert list(events) == event_rows
+
+
+@pytest.mark.parametrize("seed", [3, 7])
+def test_event_stores_match_the_legacy_records(tmp_path, monkeypatch, seed):
+    monkeypatch.setattr(chat, "backend", backend.OfflineBackend())
+    inputs = load_inputs()
+    legacy = create_event(inputs, "OldMan", seed, save_dir=str(tmp_path / "legacy"))
+    legacy.sink = ListSink()
+    legacy.run_workflow(5)
+    compact = create_event(inputs, "OldMan", seed, save_dir=str(tmp_path / "compact"))
+    compact.run_workflow(5)
+    assert len(compact.record) > 0 and len(compact.event_record) > 0
+    assert list(compact.record) == legacy.sink.rows["record"]
+    assert list(compact.event_record) == legacy.sink.rows["event_record"]
@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import pytest
+
+from src import chat
+from src.backend import OfflineBackend, OfflineChatServer, OpenAIBackend
+from src.request_policy import RequestPolicy, RequestTimeoutError, TokenBucket
+
+pytest.importorskip("openai")
+
+MESSAGES = chat.messages_for("hello")
+ANSWER = OfflineBackend().complete_with_usage(MESSAGES)[0]
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = OfflineChatServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server):
+    script(server)
+    return OpenAIBackend(base_url=server.base_url, timeout=5, max_retries=0)
+
+
+def script(server, *faults):
+    """(delay, error status) of the next requests of server, the ones after them are answered at once"""
+    faults = list(faults)
+    server.httpd.faults = lambda: faults.pop(0) if faults else (0.0, None)
+
+
+def request(policy, client, asynchronous):
+    if asynchronous:
+        return asyncio.run(policy.acall(lambda: client.acomplete_with_usage(MESSAGES)))[0]
+    return policy.call(lambda: client.complete_with_usage(MESSAGES))[0]
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_server_errors_are_retried(server, client, asynchronous):
+    script(server, (0.0, 503), (0.0, 500))
+    policy = RequestPolicy(max_retries=3, backoff=0.001)
+    assert request(policy, client, asynchronous) == ANSWER
+    assert (policy.metrics.attempts, policy.metrics.retries, policy.metrics.failures) == (3, 2, 0)
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_client_errors_are_raised_at_once(server, client, asynchronous):
+    script(server, (0.0, 400))
+    policy = RequestPolicy(max_retries=3, backoff=0.001)
+    with pytest.raises(Exception) as error:
+        request(policy, client, asynchronous)
+    assert error.value.status_code == 400
+    assert (policy.metrics.attempts, policy.metrics.failures) == (1, 1)
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_a_late_attempt_times_out_and_is_retried(server, client, asynchronous):
+    script(server, (1.0, None))
+    policy = RequestPolicy(timeout=0.2, max_retries=1, backoff=0.001)
+    assert request(policy, client, asynchronous) == ANSWER
+    assert (policy.metrics.timeouts, policy.metrics.retries) == (1, 1)
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_timeouts_are_raised_once_the_retries_are_spent(server, client, asynchronous):
+    script(server, (1.0, None), (1.0, None))
+    policy = RequestPolicy(timeout=0.1, max_retries=1, backoff=0.001)
+    with pytest.raises(RequestTimeoutError):
+        request(policy, client, asynchronous)
+    assert (policy.metrics.timeouts, policy.metrics.failures) == (2, 1)
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_a_slow_attempt_is_hedged_and_the_first_answer_wins(server, client, asynchronous):
+    # an answered request first, so the hedge cannot overtake the slow one on the way to the server
+    request(RequestPolicy(), client, asynchronous)
+    script(server, (2.0, None))
+    policy = RequestPolicy(hedge_percentile=50, hedge_min_samples=3)
+    for _ in range(3):
+        policy.metrics.latency(0.2)
+    start = time.perf_counter()
+    assert request(policy, client, asynchronous) == ANSWER
+    assert time.perf_counter() - start < 1.5
+    assert (policy.metrics.hedged, policy.metrics.hedge_wins, policy.metrics.retries) == (1, 1, 0)
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(rate=50, burst=1)
+    start = time.perf_counter()
+    for _ in range(11):
+        bucket.acquire()
+    # the first token is in the bucket, the next ten are refilled at 50 per second
+    assert time.perf_counter() - start >= 0.19
+
+
+def test_token_bucket_is_shared_through_its_file(tmp_path):
+    path = str(tmp_path / "bucket")
+    first, second = TokenBucket(rate=50, burst=2, path=path), TokenBucket(rate=50, burst=2, path=path)
+    assert first.try_acquire() == 0 and second.try_acquire() == 0
+    assert first.try_acquire() > 0
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_requests_are_throttled_by_the_limiter(server, client, asynchronous):
+    policy = RequestPolicy(limiter=TokenBucket(rate=20, burst=1))
+    start = time.perf_counter()
+    for _ in range(5):
+        assert request(policy, client, asynchronous) == ANSWER
+    assert time.perf_counter() - start >= 0.19
+    assert policy.metrics.throttled > 0
+
+
+def test_abandoned_attempts_are_bounded(server, client):
+    script(server, *[(0.5, None)] * 4)
+    policy = RequestPolicy(timeout=0.05, max_retries=0, max_abandoned=2)
+    start = time.perf_counter()
+    for _ in range(4):
+        with pytest.raises(RequestTimeoutError):
+            request(policy, client, asynchronous=False)
+        assert len(policy._abandoned) <= 2
+    # the third attempt waited for one of the first two to finish before it was sent
+    assert time.perf_counter() - start >= 0.45
+    assert policy.metrics.abandoned == 4
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_a_stream_failing_before_its_first_piece_is_retried(server, client, monkeypatch, asynchronous):
+    script(server, (0.0, 502))
+    policy = RequestPolicy(max_retries=1, backoff=0.001)
+    monkeypatch.setattr(chat, "request_policy", policy)
+
+    async def collect():
+        return [piece async for piece in chat.astream_response("hello", client)]
+
+    pieces = asyncio.run(collect()) if asynchronous else list(chat.stream_response("hello", client))
+    assert "".join(pieces) == ANSWER
+    assert (policy.metrics.retries, policy.metrics.samples("first_piece")) == (1, 1)
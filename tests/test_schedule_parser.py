@@ -0,0 +1,72 @@
+import pytest
+
+from src import schedule_parser
+from src.schedule_parser import ScheduleError, parse_activity_name, parse_schedule
+
+ACTIVITIES = ["Sleeping", "Reading", "Cooking", "Daytime Rest"]
+SCHEDULE = '[{"activity_name": "Sleeping", "start_time": "0:00", "end_time": "7:00"}, ' \
+           '{"activity_name": "Reading", "start_time": "7:00", "end_time": "8:30"}]'
+
+
+def names(schedule):
+    return [activity["activity_name"] for activity in schedule]
+
+
+@pytest.mark.parametrize("answer", [
+    SCHEDULE,
+    f"Here is the plan:\n```json\n{SCHEDULE}\n```\nEnjoy!",
+    SCHEDULE.replace('"', "'"),
+    "0:00-7:00 Sleeping; 7:00-8:30 Reading",
+])
+def test_parse_schedule_repairs_answers(answer):
+    schedule = parse_schedule(answer, ACTIVITIES)
+    assert names(schedule) == ["Sleeping", "Reading"]
+    assert schedule[1] == {"activity_name": "Reading", "start_time": "7:00", "end_time": "8:30"}
+
+
+def test_parse_schedule_maps_near_activity_names():
+    schedule = parse_schedule('[{"activity_name": "reading.", "start_time": "7:00", "end_time": "8:00"}]',
+                              ACTIVITIES)
+    assert names(schedule) == ["Reading"]
+
+
+@pytest.mark.parametrize("answer", [
+    "sorry, I cannot help with that",
+    '[{"activity_name": "Sleeping", "start_time": "25:00", "end_time": "7:00"}]',
+    '[{"activity_name": "Sleeping", "start_time": "0:00"}]',
+    '[{"activity_name": "Skydiving", "start_time": "0:00", "end_time": "7:00"}]',
+])
+def test_parse_schedule_rejects_unusable_answers(answer):
+    with pytest.raises(ScheduleError):
+        parse_schedule(answer, ACTIVITIES)
+
+
+def test_parse_schedule_empty_only_when_allowed():
+    assert parse_schedule("[]", ACTIVITIES) == []
+    with pytest.raises(ScheduleError):
+        parse_schedule("[]", ACTIVITIES, allow_empty=False)
+
+
+def test_parse_activity_name():
+    assert parse_activity_name("```\nDaytime rest\n```", ACTIVITIES) == "Daytime Rest"
+    with pytest.raises(ScheduleError):
+        parse_activity_name("Skydiving", ACTIVITIES)
+
+
+def test_ask_reasks_then_succeeds(scripted_agent):
+    agent = scripted_agent(["no idea", SCHEDULE], ACTIVITIES)
+    schedule = agent.ask("plan my day", "generate_daily_schedule", agent.parse_daily_schedule,
+                         lambda: pytest.fail("no fallback"))
+    assert names(schedule) == ["Sleeping", "Reading"]
+    assert agent.backend.prompts[0] == "plan my day"
+    assert agent.backend.prompts[1] == schedule_parser.reask_prompt("plan my day", ScheduleError(
+        "not a JSON list: 'no idea'"))
+
+
+def test_ask_falls_back_after_max_reasks(scripted_agent):
+    agent = scripted_agent(["no idea"] * 3, ACTIVITIES, max_reasks=2)
+    fallback = [{"activity_name": "Sleeping", "start_time": "0:00", "end_time": "7:00"}]
+    schedule = agent.ask("plan my day", "generate_daily_schedule", agent.parse_daily_schedule, lambda: fallback)
+    assert schedule == fallback
+    assert len(agent.backend.prompts) == 3
+    assert agent.backend.answers == []
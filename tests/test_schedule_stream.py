@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from src.schedule_parser import IncrementalListParser
+from src.schedule_stream import ScheduleStream
+
+ACTIVITIES = ["Sleeping", "Reading", "Cooking", "Daytime Rest"]
+SCHEDULE = '[{"activity_name": "Sleeping", "start_time": "0:00", "end_time": "7:00"}, ' \
+           '{"activity_name": "Reading", "start_time": "7:00", "end_time": "8:30"}]'
+
+
+def names(schedule):
+    return [activity["activity_name"] for activity in schedule]
+
+
+def test_incremental_parser_returns_objects_as_they_complete():
+    parser = IncrementalListParser()
+    pieces = [SCHEDULE[i:i + 7] for i in range(0, len(SCHEDULE), 7)]
+    completed = []
+    for i, piece in enumerate(pieces):
+        for item in parser.feed(piece):
+            completed.append((i, item["activity_name"]))
+    assert [name for _, name in completed] == ["Sleeping", "Reading"]
+    # the first entry is available before the second one has arrived
+    assert completed[0][0] < completed[1][0]
+    assert parser.closed
+
+
+def test_incremental_parser_skips_prose_and_brackets_in_strings():
+    parser = IncrementalListParser()
+    items = parser.feed('Sure! ```json\n[{"activity_name": "Reading", "note": "a } and ] inside", '
+                        '"start_time": "7:00", "end_time": "8:00"}')
+    assert [item["activity_name"] for item in items] == ["Reading"]
+    assert not parser.closed
+    assert parser.feed("]") == []
+    assert parser.closed
+
+
+def test_schedule_stream_repairs_an_unclosed_answer():
+    text = SCHEDULE[:-1]
+    stream = ScheduleStream(iter([text]), ACTIVITIES, lambda answer, emitted: [])
+    assert names(stream.rest()) == ["Sleeping", "Reading"]
+    assert stream.exhausted
+
+
+def test_schedule_stream_raises_a_failed_request():
+    def pieces():
+        yield SCHEDULE[:80]
+        raise ConnectionError("dropped")
+
+    stream = ScheduleStream(pieces(), ACTIVITIES, lambda answer, emitted: pytest.fail("no repair of a failure"))
+    assert names(stream.next_entries()) == ["Sleeping"]
+    with pytest.raises(ConnectionError):
+        stream.next_entries()
+    assert not stream.exhausted
+
+
+def streamed_schedule(agent, fallback, asynchronous):
+    """Every entry of a streamed daily schedule, through the blocking or the async driver's stream"""
+    if asynchronous:
+        async def read():
+            return await agent.astream_schedule("plan my day", "generate_daily_schedule",
+                                                agent.parse_daily_schedule, fallback).arest()
+        return asyncio.run(read())
+    return agent.stream_schedule("plan my day", "generate_daily_schedule", agent.parse_daily_schedule,
+                                 fallback).rest()
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_streamed_schedule_is_used_as_it_comes(scripted_agent, asynchronous):
+    agent = scripted_agent([SCHEDULE], ACTIVITIES)
+    assert names(streamed_schedule(agent, lambda: pytest.fail("no fallback"), asynchronous)) \
+        == ["Sleeping", "Reading"]
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_unusable_stream_continues_with_the_fallback(scripted_agent, asynchronous):
+    answer = SCHEDULE.replace('"start_time": "7:00"', '"start_time": "soon"')
+    fallback = [{"activity_name": "Sleeping", "start_time": "0:00", "end_time": "6:00"},
+                {"activity_name": "Cooking", "start_time": "6:00", "end_time": "7:00"},
+                {"activity_name": "Daytime Rest", "start_time": "7:00", "end_time": "9:00"}]
+    agent = scripted_agent([answer], ACTIVITIES)
+    schedule = streamed_schedule(agent, lambda: fallback, asynchronous)
+    # the streamed entry was already simulated, the fallback plan continues after it without a re-ask
+    assert names(schedule) == ["Sleeping", "Cooking", "Daytime Rest"]
+    assert schedule[0]["end_time"] == "7:00"
+    assert len(agent.backend.prompts) == 1
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_unusable_stream_is_reasked_while_nothing_was_used(scripted_agent, asynchronous):
+    agent = scripted_agent(["no idea", SCHEDULE], ACTIVITIES)
+    assert names(streamed_schedule(agent, lambda: pytest.fail("no fallback"), asynchronous)) \
+        == ["Sleeping", "Reading"]
+    assert len(agent.backend.prompts) == 2
+